@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结果控制台渲染基准测试
+对比旧的逐行插入方式（insert + see + update_idletasks）与 ResultConsole
+（批量写入会话日志、只渲染可见行）的每秒处理行数，并统计两者最终控件中
+保存的字符数。需要图形环境（Windows桌面或X11显示）。
+
+用法: python benchmarks/bench_console.py [--lines 20000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import tkinter as tk
+from tkinter import scrolledtext
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as app_main  # noqa: E402
+from main import ResultConsole, SessionLog  # noqa: E402
+
+app_main.load_tkinter()
+
+LINE = "[12:00:00] 08-18 10:20:30.123  1234  1256 I C01406/Tag: sample output line"
+
+
+def bench_legacy(root, lines):
+    """旧实现：每行插入一次并强制刷新界面"""
+    text = scrolledtext.ScrolledText(root)
+    text.pack()
+    start = time.perf_counter()
+    for _ in range(lines):
+        text.insert(tk.END, LINE + "\n")
+        text.see(tk.END)
+        root.update_idletasks()
+    elapsed = time.perf_counter() - start
+    chars = len(text.get("1.0", tk.END))
+    text.destroy()
+    return elapsed, chars
+
+
+def bench_batched(root, lines):
+    """新实现：工作线程写入队列，Tk线程按帧批量写入会话日志并渲染可见行"""
+    frame = tk.Frame(root)
+    frame.pack(fill=tk.BOTH, expand=True)
+    directory = tempfile.mkdtemp()
+    log = SessionLog(os.path.join(directory, "session.log"))
+    console = ResultConsole(root, frame, log)
+    result = {}
+
+    def producer():
+        for _ in range(lines):
+            console.write(LINE + "\n")
+
+    def check_done():
+        if console.pending.empty() and not worker.is_alive():
+            result["elapsed"] = time.perf_counter() - start
+            root.quit()
+        else:
+            root.after(5, check_done)
+
+    start = time.perf_counter()
+    worker = threading.Thread(target=producer, daemon=True)
+    worker.start()
+    root.after(5, check_done)
+    root.mainloop()
+    console.stop()
+    chars = len(console.text.get("1.0", tk.END))
+    frame.destroy()
+    log.close()
+    return result["elapsed"], chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description="结果控制台渲染基准测试")
+    parser.add_argument("--lines", type=int, default=20000, help="写入行数")
+    args = parser.parse_args()
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"无法创建Tk窗口（需要图形环境）: {e}")
+        return 1
+    root.geometry("800x400")
+
+    legacy, legacy_chars = bench_legacy(root, args.lines)
+    batched, batched_chars = bench_batched(root, args.lines)
+    root.destroy()
+
+    print(f"写入行数: {args.lines}")
+    print(f"逐行插入: {legacy:.3f}s, {args.lines / legacy:,.0f} 行/秒, 控件保存 {legacy_chars:,} 字符")
+    print(f"虚拟控制台: {batched:.3f}s, {args.lines / batched:,.0f} 行/秒, 控件保存 {batched_chars:,} 字符")
+    print(f"提升倍数: {legacy / batched:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
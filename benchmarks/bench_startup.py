@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+冷启动时间基准测试
+对比命令行模式（不导入tkinter）与图形界面模式的启动开销，每项启动独立的Python进程，
+取多次运行的中位数。
+
+用法: python benchmarks/bench_startup.py [--runs 10]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ("python空进程", [sys.executable, "-c", "pass"]),
+    ("命令行模式 (main.py --help)", [sys.executable, "main.py", "--help"]),
+    ("图形界面导入 (main + tkinter)", [sys.executable, "-c", "import main; main.load_tkinter()"]),
+    ("图形界面首帧 (创建并显示Tk窗口)",
+     [sys.executable, "-c", "import main; main.load_tkinter(); r = main.tk.Tk(); r.update(); r.destroy()"]),
+]
+
+
+def measure(cmd, runs):
+    """返回多次运行耗时的中位数（秒）"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        if completed.returncode != 0:
+            # 例如无图形环境时无法创建Tk窗口
+            return None
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动时间基准测试")
+    parser.add_argument("--runs", type=int, default=10, help="每项运行次数")
+    args = parser.parse_args()
+
+    for name, cmd in CASES:
+        elapsed = measure(cmd, args.runs)
+        print(f"{name}: " + (f"{elapsed * 1000:.1f} ms" if elapsed is not None else "运行失败（需要图形环境）"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用于基准测试的 hdc 替身（Linux/macOS）
+模拟 list targets、shell、file recv/send、install/uninstall、version 等命令，
+“设备”文件系统直接使用本机文件系统。行为通过环境变量配置：
+
+    FAKE_HDC_LATENCY        每条命令的固定延迟，秒（默认 0）
+    FAKE_HDC_TARGETS        list targets 返回的设备数（默认 1）
+    FAKE_HDC_OUTPUT_BYTES   非交互 shell 命令改为输出指定字节数的合成文本（默认 0，真实执行）
+    FAKE_HDC_FAIL_RATE      命令以临时错误失败的概率，0~1（默认 0）
+    FAKE_HDC_BANDWIDTH      文件传输带宽，字节/秒（默认 0，不限速）
+    FAKE_HDC_INSTALL_TIME   install 的额外耗时，秒（默认 0）
+    FAKE_HDC_SEED           失败概率使用的随机种子
+
+用法与 hdc 相同，例如: fake_hdc.py -t FAKE0001 shell ls /
+"""
+
+import os
+import random
+import sys
+import time
+
+LATENCY = float(os.environ.get("FAKE_HDC_LATENCY", "0"))
+TARGETS = int(os.environ.get("FAKE_HDC_TARGETS", "1"))
+OUTPUT_BYTES = int(os.environ.get("FAKE_HDC_OUTPUT_BYTES", "0"))
+FAIL_RATE = float(os.environ.get("FAKE_HDC_FAIL_RATE", "0"))
+BANDWIDTH = float(os.environ.get("FAKE_HDC_BANDWIDTH", "0"))
+INSTALL_TIME = float(os.environ.get("FAKE_HDC_INSTALL_TIME", "0"))
+
+CHUNK_SIZE = 64 * 1024
+OUTPUT_LINE = "fake hdc output line 0123456789 abcdefghijklmnopqrstuvwxyz\n"
+
+
+def fail(message):
+    print(f"[Fail]{message}")
+    return 1
+
+
+def copy_file(src, dst):
+    """按配置的带宽复制单个文件，返回字节数"""
+    copied = 0
+    start = time.perf_counter()
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while True:
+            chunk = fin.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            fout.write(chunk)
+            copied += len(chunk)
+            if BANDWIDTH > 0:
+                delay = copied / BANDWIDTH - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+    return copied
+
+
+def transfer(src, dst):
+    """file recv/send: dst 为已存在的目录时复制到其中"""
+    if not os.path.exists(src):
+        return fail(f"Error opening file: no such file or directory, path:{src}")
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src.rstrip("/")))
+    start = time.perf_counter()
+    size = count = 0
+    if os.path.isdir(src):
+        for root, _, files in os.walk(src):
+            target_dir = os.path.join(dst, os.path.relpath(root, src))
+            os.makedirs(target_dir, exist_ok=True)
+            for name in files:
+                size += copy_file(os.path.join(root, name), os.path.join(target_dir, name))
+                count += 1
+    else:
+        size = copy_file(src, dst)
+        count = 1
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    print(f"FileTransfer finish, Size:{size}, File count = {count}, time:{elapsed * 1000:.0f}ms "
+          f"rate:{size / elapsed / 1024:.2f}kB/s")
+    return 0
+
+
+def shell(arguments):
+    if not arguments:
+        # 交互式shell（常驻会话使用）
+        os.execvp("sh", ["sh"])
+    if OUTPUT_BYTES > 0:
+        lines, rest = divmod(OUTPUT_BYTES, len(OUTPUT_LINE))
+        out = sys.stdout
+        block = OUTPUT_LINE * 1024
+        for _ in range(lines // 1024):
+            out.write(block)
+        out.write(OUTPUT_LINE * (lines % 1024) + OUTPUT_LINE[:rest])
+        return 0
+    os.execvp("sh", ["sh", "-c", " ".join(arguments)])
+
+
+def install(arguments):
+    paths = [a for a in arguments if not a.startswith("-")]
+    if not paths or not os.path.exists(paths[-1]):
+        return fail("Not any installation package was found")
+    time.sleep(INSTALL_TIME)
+    print(f"[Info]App install path:{paths[-1]}, queuesize:0, msg:install bundle successfully.")
+    print("AppMod finish")
+    return 0
+
+
+def main(argv):
+    if len(argv) >= 2 and argv[0] == "-t":
+        argv = argv[2:]
+    if LATENCY > 0:
+        time.sleep(LATENCY)
+    if not argv or argv[0] in ("-v", "version"):
+        print("Ver: 3.1.0e (fake)")
+        return 0
+
+    command, arguments = argv[0], argv[1:]
+    if FAIL_RATE > 0 and command != "list" and random.random() < FAIL_RATE:
+        return fail("ExecuteCommand failed: connect server failed (fake transient error)")
+
+    if command == "list" and arguments[:1] == ["targets"]:
+        for i in range(TARGETS):
+            print(f"FAKE{i + 1:04d}\tUSB\tConnected\tlocalhost")
+        return 0
+    if command == "shell":
+        return shell(arguments)
+    if command == "file" and len(arguments) >= 3 and arguments[0] in ("recv", "send"):
+        return transfer(arguments[1], arguments[2])
+    if command == "install":
+        return install(arguments)
+    if command == "uninstall":
+        print("[Info]App uninstall path:, queuesize:0, msg:uninstall bundle successfully.")
+        return 0
+    if command in ("kill", "start", "tconn", "target"):
+        print("[Info]OK")
+        return 0
+    return fail(f"Unknown command: {command}")
+
+
+if __name__ == "__main__":
+    if "FAKE_HDC_SEED" in os.environ:
+        random.seed(int(os.environ["FAKE_HDC_SEED"]) + os.getpid())
+    sys.exit(main(sys.argv[1:]))
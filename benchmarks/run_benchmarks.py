@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试套件
+使用 fake_hdc.py 代替真实设备（Linux/macOS），测量：
+- 单条命令的进程启动开销（直接启动、run_exe、run_command、常驻shell会话）
+- run_exe / run_command / iter_exe 的输出吞吐
+- 控制台写入会话日志和渲染的速率（渲染部分需要图形环境）
+- 传输（file recv 整个目录、TransferEngine 并行拉取/推送、增量导出首次与无变化时）的耗时
+
+结果保存为JSON（默认 benchmarks/results/），可用 --compare 与之前的结果对比。
+
+用法: python benchmarks/run_benchmarks.py [--quick] [--latency 0.01] [--bandwidth 0]
+                                          [-o result.json] [--compare old.json]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+import main as app_main  # noqa: E402
+
+LINE = "[12:00:00] 08-18 10:20:30.123  1234  1256 I C01406/Tag: sample output line\n"
+
+
+def make_fake_hdc(directory):
+    """生成调用 fake_hdc.py 的可执行包装脚本，返回路径"""
+    path = os.path.join(directory, "hdc")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCH_DIR, "fake_hdc.py")}" "$@"\n')
+    os.chmod(path, 0o755)
+    return path
+
+
+def summarize(samples):
+    """耗时样本（秒）的统计，单位毫秒"""
+    ordered = sorted(samples)
+    return {
+        "runs": len(samples),
+        "median_ms": statistics.median(ordered) * 1000,
+        "mean_ms": statistics.mean(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+
+def timed(func, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_spawn(hdc_util, runs):
+    """单条命令的开销"""
+    hdc = hdc_util.hdc_path
+    hdc_util.run_command("shell true")  # 预先建立shell会话
+    return {
+        "subprocess_run": timed(lambda: subprocess.run([hdc, "version"], stdout=subprocess.DEVNULL), runs),
+        "run_exe": timed(lambda: hdc_util.run_exe(hdc, "version"), runs),
+        "run_command": timed(lambda: hdc_util.run_command("list targets"), runs),
+        "shell_spawn": timed(lambda: hdc_util.run_exe(hdc, "shell true"), runs),
+        "shell_session": timed(lambda: hdc_util.run_command("shell true"), runs),
+    }
+
+
+def throughput(func, runs):
+    """重复调用 func（返回输出文本），统计最好的一次的吞吐"""
+    best = None
+    size = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = func()
+        elapsed = time.perf_counter() - start
+        size = len(output.encode("utf-8"))
+        best = elapsed if best is None else min(best, elapsed)
+    return {"bytes": size, "seconds": best, "mb_per_s": size / best / 1e6}
+
+
+def bench_throughput(hdc_util, lines, runs):
+    """输出吞吐"""
+    hdc = hdc_util.hdc_path
+    command = f"shell seq 100000 {100000 + lines - 1}"
+    results = {
+        "lines": lines,
+        "run_exe": throughput(lambda: hdc_util.run_exe(hdc, command), runs),
+        "run_command": throughput(lambda: hdc_util.run_command(command), runs),
+        "iter_exe": throughput(lambda: "\n".join(hdc_util.iter_exe(hdc, command)), runs),
+    }
+    for key in ("run_exe", "run_command", "iter_exe"):
+        results[key]["lines_per_s"] = lines / results[key]["seconds"]
+    return results
+
+
+def bench_console(lines, directory):
+    """控制台：写入会话日志的速率，以及（有图形环境时）ResultConsole 的渲染速率"""
+    log = app_main.SessionLog(os.path.join(directory, "session.log"))
+    batch = LINE * 2000
+    start = time.perf_counter()
+    for _ in range(max(1, lines // 2000)):
+        log.append(batch)
+    elapsed = time.perf_counter() - start
+    # 随机位置读取一屏（40行），模拟滚动
+    reads = 1000
+    read_start = time.perf_counter()
+    for i in range(reads):
+        log.read_lines((i * 7919) % log.line_count, 40)
+    read_elapsed = time.perf_counter() - read_start
+    results = {
+        "session_log_lines_per_s": log.line_count / elapsed,
+        "window_read_ms": read_elapsed / reads * 1000,
+    }
+    log.close()
+
+    try:
+        import bench_console
+        root = bench_console.tk.Tk()
+    except Exception as e:
+        results["render"] = {"skipped": f"无法创建Tk窗口: {e}".strip()}
+        return results
+    root.geometry("800x400")
+    legacy, _ = bench_console.bench_legacy(root, min(lines, 20000))
+    batched, _ = bench_console.bench_batched(root, lines)
+    root.destroy()
+    results["render"] = {
+        "legacy_lines_per_s": min(lines, 20000) / legacy,
+        "console_lines_per_s": lines / batched,
+    }
+    return results
+
+
+def bench_export(hdc_util, directory, files, file_size, workers):
+    """传输：一次 file recv 整个目录、并行拉取和推送，以及增量导出首次和无变化时的耗时"""
+    remote = os.path.join(directory, "device", "Photo")
+    os.makedirs(remote)
+    payload = os.urandom(file_size)
+    for i in range(files):
+        with open(os.path.join(remote, f"IMG_{i:05d}.jpg"), "wb") as f:
+            f.write(payload)
+
+    start = time.perf_counter()
+    os.makedirs(os.path.join(directory, "export_full"))
+    hdc_util.recv_file(remote, os.path.join(directory, "export_full"))
+    recv_dir = time.perf_counter() - start
+
+    engine = app_main.TransferEngine(hdc_util, workers)
+    parallel_recv = engine.recv(remote, os.path.join(directory, "export_parallel"))
+    parallel_send = engine.send(os.path.join(directory, "export_parallel"),
+                                os.path.join(directory, "device", "pushed"))
+
+    exporter = app_main.IncrementalExporter(hdc_util, workers)
+    local = os.path.join(directory, "export_sync")
+    first = exporter.sync(remote, local)
+    second = exporter.sync(remote, local)
+    total_bytes = files * file_size
+    return {
+        "files": files,
+        "file_size": file_size,
+        "recv_dir_seconds": recv_dir,
+        "recv_dir_mb_per_s": total_bytes / recv_dir / 1e6,
+        "parallel_recv_seconds": parallel_recv.duration,
+        "parallel_recv_mb_per_s": parallel_recv.bytes / parallel_recv.duration / 1e6,
+        "parallel_recv_failed": len(parallel_recv.failures),
+        "parallel_send_seconds": parallel_send.duration,
+        "parallel_send_mb_per_s": parallel_send.bytes / parallel_send.duration / 1e6,
+        "parallel_send_failed": len(parallel_send.failures),
+        "sync_first_seconds": first.duration,
+        "sync_first_pulled": first.pulled,
+        "sync_first_failed": first.failed,
+        "sync_noop_seconds": second.duration,
+        "sync_noop_skipped": second.skipped,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def flatten(data, prefix=""):
+    """把嵌套结果展开为 {"a.b.c": 数值}"""
+    items = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            items.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[name] = value
+    return items
+
+
+def compare(old, new):
+    """打印两次结果中相同指标的对比"""
+    old_items = flatten(old["results"])
+    new_items = flatten(new["results"])
+    print(f"\n对比 {old.get('version')} ({old.get('git')}) -> {new.get('version')} ({new.get('git')})")
+    for name, value in new_items.items():
+        if name in old_items and old_items[name]:
+            print(f"  {name:48s} {old_items[name]:14.3f} {value:14.3f}  x{value / old_items[name]:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HarmonyDevTools 基准测试（使用 fake hdc）")
+    parser.add_argument("--quick", action="store_true", help="减少运行次数和数据量")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake hdc 每条命令的延迟（秒）")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="fake hdc 文件传输带宽（字节/秒，0为不限速）")
+    parser.add_argument("-o", "--output", help="结果JSON路径，默认 benchmarks/results/ 下按时间命名")
+    parser.add_argument("--compare", help="与之前保存的结果JSON对比")
+    args = parser.parse_args()
+
+    if os.name == "nt":
+        print("fake hdc 仅支持 Linux/macOS")
+        return 1
+
+    runs = 5 if args.quick else 20
+    os.environ["FAKE_HDC_LATENCY"] = str(args.latency)
+    os.environ["FAKE_HDC_BANDWIDTH"] = str(args.bandwidth)
+
+    with tempfile.TemporaryDirectory(prefix="hdc_bench_") as directory:
+        hdc_util = app_main.HdcUtil()
+        hdc_util.hdc_path = make_fake_hdc(directory)
+        results = {}
+        steps = (
+            ("spawn", lambda: bench_spawn(hdc_util, runs)),
+            ("throughput", lambda: bench_throughput(hdc_util, 20000 if args.quick else 200000, 3)),
+            ("console", lambda: bench_console(20000 if args.quick else 200000, directory)),
+            ("export", lambda: bench_export(hdc_util, directory, 50 if args.quick else 300, 256 * 1024, 4)),
+        )
+        try:
+            for name, step in steps:
+                print(f"运行 {name} ...", flush=True)
+                results[name] = step()
+        finally:
+            hdc_util.close_sessions()
+
+    report = {
+        "version": app_main.VERSION,
+        "git": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fake_hdc": {"latency": args.latency, "bandwidth": args.bandwidth},
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        BENCH_DIR, "results", f"bench-{app_main.VERSION}-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"结果已保存到: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
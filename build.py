@@ -11,8 +11,39 @@ import subprocess
 import shutil
 import re
 import zipfile
+import argparse
+import hashlib
+import json
+import platform
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
+# 增量构建记录：输入指纹和上次生成的产物，保存在PyInstaller工作目录中
+BUILD_DIR = "build"
+BUILD_CACHE_FILE = os.path.join(BUILD_DIR, "build_cache.json")
+DIST_DIR = "dist"
+# 会被打包进exe的第三方包（分发名），版本变化时需要重新构建
+BUNDLED_PACKAGES = ["pyinstaller", "pyinstaller-hooks-contrib", "Pillow", "PyYAML"]
+
+@contextmanager
+def timed_phase(timings, name):
+    """记录一个构建阶段的耗时（秒）到 timings"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+def print_timings(timings):
+    """打印各阶段耗时"""
+    total = sum(timings.values())
+    print("\n各阶段耗时：")
+    for name, seconds in timings.items():
+        share = seconds / total * 100 if total else 0
+        print(f"  {seconds:8.2f}s  {share:5.1f}%  {name}")
+    print(f"  {total:8.2f}s  100.0%  合计")
+
 def check_pyinstaller():
     """检查PyInstaller是否已安装"""
     try:
@@ -55,6 +86,8 @@ def build_with_version(main_file, exe_name, version):
         "pyinstaller",
         "--onefile",                    # 打包为单个文件
         "--windowed",                   # 无控制台窗口
+        "--noconfirm",                  # 覆盖dist中的旧文件时不询问
+        f"--workpath={BUILD_DIR}",      # 保留工作目录，输入未变的分析结果可复用
         f"--name={exe_name}",           # 输出文件名
         "--icon=icon.ico",              # 图标文件（如果存在）
         "--version-file=version_info.txt",  # 版本信息文件
@@ -72,6 +105,105 @@ def build_with_version(main_file, exe_name, version):
     
     return cmd
 
+def get_pyinstaller_version():
+    try:
+        import PyInstaller
+        return PyInstaller.__version__
+    except ImportError:
+        return ""
+
+def get_package_versions():
+    """BUNDLED_PACKAGES 中各包已安装的版本，未安装的为空字符串"""
+    try:
+        from importlib import metadata
+    except ImportError:
+        return {}
+    versions = {}
+    for name in BUNDLED_PACKAGES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = ""
+    return versions
+
+def hash_file(path, digest):
+    """把文件内容加入 digest"""
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+def compute_fingerprint(cmd):
+    """计算构建输入的指纹
+
+    包括PyInstaller命令行、PyInstaller、Python及打包的第三方包版本、main.py、toolchains目录下所有文件
+    （相对路径和内容）、图标、版本信息文件，以及本构建脚本自身。
+    """
+    digest = hashlib.sha256()
+    header = {
+        "cmd": cmd,
+        "pyinstaller": get_pyinstaller_version(),
+        "packages": get_package_versions(),
+        "python": sys.version,
+        "platform": f"{sys.platform}-{platform.machine()}",
+    }
+    digest.update(json.dumps(header, sort_keys=True).encode("utf-8"))
+    
+    inputs = ["main.py", "icon.ico", "version_info.txt", os.path.basename(__file__)]
+    if os.path.isdir("toolchains"):
+        for root, dirs, files in os.walk("toolchains"):
+            dirs.sort()
+            inputs.extend(os.path.join(root, name) for name in sorted(files))
+    for path in inputs:
+        # 路径统一用/分隔，同一份源码在不同系统上指纹一致
+        digest.update(b"\0" + path.replace(os.sep, "/").encode("utf-8") + b"\0")
+        if os.path.isfile(path):
+            hash_file(path, digest)
+        else:
+            digest.update(b"<missing>")
+    return digest.hexdigest()
+
+def file_stamp(path):
+    """产物的大小和修改时间，用于确认上次的产物未被改动"""
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def load_build_cache():
+    try:
+        with open(BUILD_CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_build_cache(fingerprint, outputs):
+    """记录本次构建的指纹和产物（相对路径 -> 大小、修改时间）"""
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    cache = {"fingerprint": fingerprint, "outputs": {path: file_stamp(path) for path in outputs}}
+    with open(BUILD_CACHE_FILE, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+
+def cached_outputs(fingerprint):
+    """指纹一致且上次的产物都还在、未被改动时返回产物列表，否则返回None"""
+    cache = load_build_cache()
+    if cache.get("fingerprint") != fingerprint:
+        return None
+    outputs = cache.get("outputs") or {}
+    if not outputs or any(stamp is None or file_stamp(path) != stamp for path, stamp in outputs.items()):
+        return None
+    return list(outputs)
+
+def remove_recorded_outputs():
+    """删除上次构建记录的产物（如旧版本的exe和zip），避免与新产物一起分发"""
+    outputs = load_build_cache().get("outputs") or {}
+    dist_dir = os.path.abspath(DIST_DIR)
+    for path in outputs:
+        # 只删除dist目录中的文件，防止记录被改动后误删其他文件
+        if os.path.commonpath([os.path.abspath(path), dist_dir]) != dist_dir or not os.path.isfile(path):
+            continue
+        os.remove(path)
+        print(f"已删除旧产物：{path}")
+
 def get_version_for_filename(version):
     """将版本号转换为文件名格式（只取前三位）"""
     parts = version.split('.')
@@ -79,14 +211,19 @@ def get_version_for_filename(version):
         return f"{parts[0]}.{parts[1]}.{parts[2]}"
     return version
 
-def build_exe():
-    """构建exe文件"""
+def build_exe(timings=None, force=False):
+    """构建exe文件
+
+    输入指纹与上次构建相同且 dist 中的产物未被改动时直接复用，返回 (exe_name, 指纹, 是否复用)；
+    失败时exe_name为False。force 为True时总是重新构建。
+    """
+    timings = {} if timings is None else timings
     print("开始构建exe文件...")
     
     # 检查主程序文件是否存在
     if not os.path.exists("main.py"):
         print("错误：找不到main.py文件！")
-        return False
+        return False, None, False
     
     # 从version_info.txt获取版本号
     version = get_version_from_version_info()
@@ -102,13 +239,28 @@ def build_exe():
     # 构建命令
     cmd = build_with_version(main_file, exe_name, version_for_filename)
     
+    with timed_phase(timings, "计算指纹"):
+        fingerprint = compute_fingerprint(cmd)
+        outputs = None if force else cached_outputs(fingerprint)
+    if outputs:
+        print(f"输入未变化（指纹 {fingerprint[:12]}），复用dist中的构建产物：")
+        for path in outputs:
+            print(f"- {path}")
+        return exe_name, fingerprint, True
+    
+    with timed_phase(timings, "清理"):
+        remove_recorded_outputs()
     try:
-        subprocess.check_call(cmd)
+        with timed_phase(timings, "PyInstaller"):
+            subprocess.check_call(cmd)
         print("构建成功！")
-        return exe_name
+        return exe_name, fingerprint, False
     except subprocess.CalledProcessError as e:
         print(f"构建失败：{e}")
-        return False
+        # 构建失败时丢弃记录，避免下次误用残缺的产物
+        if os.path.exists(BUILD_CACHE_FILE):
+            os.remove(BUILD_CACHE_FILE)
+        return False, fingerprint, False
 
 def create_distribution(exe_name="HarmonyDevTools"):
     """创建发布包"""
@@ -236,6 +388,9 @@ def clean_build_files():
     """清理构建文件"""
     print("清理构建文件...")
     
+    # build目录中保存着上次产物的记录，删除前先清掉这些产物
+    remove_recorded_outputs()
+    
     # 清理所有构建相关的临时文件
     dirs_to_clean = ["build", "__pycache__"]
     files_to_clean = ["HarmonyDevTools.spec", "HarmonyDevTools_Enhanced.spec"]
@@ -253,15 +408,10 @@ def clean_build_files():
     print("清理完成")
 
 def clean_after_build(exe_name):
-    """构建完成后清理临时文件"""
+    """构建完成后清理临时文件（保留build目录供下次增量构建）"""
     print("清理构建临时文件...")
     
-    # 清理build目录
-    if os.path.exists("build"):
-        shutil.rmtree("build")
-        print("已删除build目录")
-    
-    # 清理spec文件
+    # 清理spec文件（每次构建都会按命令行参数重新生成）
     spec_files = [f"{exe_name}.spec"]
     for spec_file in spec_files:
         if os.path.exists(spec_file):
@@ -272,6 +422,11 @@ def clean_after_build(exe_name):
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="HarmonyDevTools 打包工具")
+    parser.add_argument("--force", action="store_true", help="输入未变化时也重新构建")
+    parser.add_argument("--clean", action="store_true", help="构建前删除build目录（不复用PyInstaller的分析结果）")
+    args = parser.parse_args()
+    
     print("=" * 50)
     print("HarmonyDevTools Python版本打包工具")
     print("=" * 50)
@@ -294,24 +449,38 @@ def main():
             print("请手动安装PyInstaller：pip install pyinstaller")
             return
     
-    # 自动清理之前的构建文件
-    if os.path.exists("build") or os.path.exists("dist"):
+    timings = {}
+    # 指定 --clean 时清理之前的构建文件，否则保留build目录增量构建
+    if args.clean and os.path.exists(BUILD_DIR):
         print("清理之前的构建文件...")
-        clean_build_files()
+        with timed_phase(timings, "清理"):
+            clean_build_files()
     
     # 构建exe文件
-    exe_name = build_exe()
+    exe_name, fingerprint, reused = build_exe(timings, force=args.force or args.clean)
     if exe_name:
-        # 自动创建发布包
-        create_distribution(exe_name)
-        
-        # 创建zip压缩包
-        zip_filename = create_zip_package(exe_name, "dist")
-        
-        # 构建完成后清理临时文件
-        clean_after_build(exe_name)
+        version_for_filename = get_version_for_filename(get_version_from_version_info())
+        zip_filename = f"HarmonyDevTools_v{version_for_filename}.zip"
+        if not reused:
+            # 自动创建发布包
+            with timed_phase(timings, "发布包"):
+                create_distribution(exe_name)
+            
+            # 创建zip压缩包
+            with timed_phase(timings, "zip压缩包"):
+                zip_filename = create_zip_package(exe_name, "dist")
+            
+            # 构建完成后清理临时文件
+            with timed_phase(timings, "清理"):
+                clean_after_build(exe_name)
+            
+            outputs = [os.path.join("dist", name) for name in (f"{exe_name}.exe", "README.md", zip_filename)]
+            for root, dirs, files in os.walk(os.path.join("dist", "toolchains")):
+                outputs.extend(os.path.join(root, name) for name in files)
+            save_build_cache(fingerprint, outputs)
         
-        print("\n构建完成！")
+        print_timings(timings)
+        print("\n构建完成！" if not reused else "\n无需重新构建！")
         print(f"exe文件位置：dist/{exe_name}.exe")
         print(f"zip压缩包：{zip_filename}")
         print("发布包位置：dist/目录")
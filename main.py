@@ -5,44 +5,164 @@ HarmonyDevTools
 提供更丰富的功能和更好的用户体验
 """
 
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext, Menu
+import time
+
+# 模块开始导入的时间，用于启动耗时分析
+_IMPORT_START = time.perf_counter()
+
 import subprocess
 import os
+import sys
 import threading
+import queue
+import uuid
+import asyncio
+import locale
+import signal
+import concurrent.futures
 import datetime
 import logging
 import json
-import ctypes
-import webbrowser
 import re
-from pathlib import Path
-from typing import Optional, Dict, Any
+import shlex
+import argparse
+import shutil
+import contextlib
+import hashlib
+import zipfile
+import base64
+import io
+import tempfile
+import csv
+import mmap
+import collections
+import itertools
+import bisect
+import math
+import heapq
+from array import array
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, List
 
 # 版本信息
 VERSION = "1.4.0"
 
-# --- UI 界面 ---
-# 启用 DPI 感知（避免高分屏模糊）
-try:
-    ctypes.windll.shcore.SetProcessDpiAwareness(1)
-except Exception:
-    try:
-        ctypes.windll.user32.SetProcessDPIAware()
-    except Exception:
-        pass
+# tkinter 只在启动图形界面时导入（见 load_tkinter），命令行模式不会加载
+tk = ttk = filedialog = messagebox = scrolledtext = Menu = tkfont = None
+# 可选依赖 Pillow，屏幕镜像用于解码JPEG（见 load_pillow）
+Image = ImageTk = None
 
-# 配置日志
+# 日志文件
+LOG_FILE = "harmony_dev_tools.log"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# 配置日志（文件日志由 attach_file_log_handler 添加：图形界面在显示后，命令行模式在启动时）
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler('harmony_dev_tools.log', encoding='utf-8'),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
+def attach_file_log_handler():
+    """添加文件日志（重复调用无副作用）"""
+    root_logger = logging.getLogger()
+    if any(isinstance(h, logging.FileHandler) for h in root_logger.handlers):
+        return
+    try:
+        handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root_logger.addHandler(handler)
+    except Exception as e:
+        logger.warning(f"创建日志文件失败: {e}")
+
+class StartupProfiler:
+    """启动耗时分析，记录各阶段耗时，--profile-startup 时输出报告"""
+    
+    # 报告追加写入的文件，每行一条JSON记录，便于按版本跟踪启动耗时
+    REPORT_FILE = "startup_profile.jsonl"
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = _IMPORT_START
+        self.mainloop_start = None
+        self.phases = []
+        self._lock = threading.Lock()
+    
+    def record(self, name, duration):
+        """记录一个阶段的耗时（秒）"""
+        with self._lock:
+            self.phases.append((name, duration))
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        """统计代码块耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+    
+    def elapsed(self):
+        """从模块开始导入至今的时间（秒）"""
+        return time.perf_counter() - self.start
+    
+    def report(self, title="启动耗时"):
+        """输出报告并追加到报告文件"""
+        if not self.enabled:
+            return
+        with self._lock:
+            phases = list(self.phases)
+        total = self.elapsed()
+        lines = [f"{title}（版本 {get_version()}）:"]
+        for name, duration in phases:
+            lines.append(f"  {duration * 1000:8.1f} ms  {name}")
+        lines.append(f"  {total * 1000:8.1f} ms  总计")
+        print("\n".join(lines), flush=True)
+        
+        record = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "version": get_version(),
+            "title": title,
+            "total_ms": round(total * 1000, 1),
+            "phases": {name: round(duration * 1000, 1) for name, duration in phases},
+        }
+        try:
+            with open(self.REPORT_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.warning(f"写入启动耗时报告失败: {e}")
+
+def load_tkinter():
+    """导入tkinter及其子模块"""
+    global tk, ttk, filedialog, messagebox, scrolledtext, Menu, tkfont
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox, scrolledtext, Menu
+    from tkinter import font as tkfont
+
+def load_pillow():
+    """导入可选的 Pillow，未安装时返回False"""
+    global Image, ImageTk
+    if Image is None:
+        try:
+            from PIL import Image, ImageTk
+        except ImportError:
+            return False
+    return True
+
+def enable_dpi_awareness():
+    """启用 DPI 感知（避免高分屏模糊）"""
+    import ctypes
+    try:
+        ctypes.windll.shcore.SetProcessDpiAwareness(1)
+    except Exception:
+        try:
+            ctypes.windll.user32.SetProcessDPIAware()
+        except Exception:
+            pass
+
 def center_window(win, width, height):
     """让窗口在屏幕中央显示"""
     screen_width = win.winfo_screenwidth()
@@ -53,18 +173,32 @@ def center_window(win, width, height):
 
 def get_version():
     """获取版本号"""
-    import sys
     # 检查是否有命令行参数传入版本号
     if len(sys.argv) > 1 and sys.argv[1].startswith('--version='):
         return sys.argv[1].split('=', 1)[1]
     return VERSION
 
 class Config:
-    """配置管理类"""
+    """配置管理类
+
+    set() 只修改内存并标记为脏，由一个常驻的写盘线程合并多次修改后统一写盘（频繁修改时
+    不会每次创建定时器线程）；写盘先写临时文件再替换，避免中途崩溃留下不完整的配置文件。
+    """
+    
+    # 最后一次修改后延迟写盘的时间，单位秒
+    SAVE_DELAY = 1.0
+    # 持续修改时（如拖动窗口）最长的写盘间隔，单位秒
+    MAX_SAVE_DELAY = 5.0
     
     def __init__(self, config_file="config.json"):
         self.config_file = config_file
         self.config = self.load_config()
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._dirty_since = None
+        self._last_change = None
+        self._wake = threading.Event()
+        self._flusher = None
     
     def load_config(self) -> Dict[str, Any]:
         """加载配置"""
@@ -75,6 +209,29 @@ class Config:
             "default_target": "",
             "recent_commands": [],
             "max_recent_commands": 10,
+            "history_max_entries": 100000,
+            "console_keep_sessions": 5,
+            "fanout_max_workers": 8,
+            "install_max_workers": 4,
+            "install_per_hub_limit": 2,
+            "install_retries": 2,
+            "install_hub_groups": {},
+            "export_sync_dir": "export",
+            "export_workers": 4,
+            "transfer_workers": 4,
+            "push_remote_dir": "/data/local/tmp",
+            "transfer_file_timeout": 600,
+            "device_poll_interval": 3.0,
+            "command_timeout": 300,
+            "long_running_commands": ["hilog", "shell hilog", "shell top", "file recv", "file send"],
+            "engine_max_concurrency": 16,
+            "query_cache_commands": ["shell bm get --udid", "shell param get", "checkserver", "version"],
+            "query_cache_ttl": 600,
+            "query_cache_max_entries": 256,
+            "package_index_ttl": 300,
+            "hilog_buffer_lines": 200000,
+            "hilog_display_lines": 5000,
+            "screen_fps": 5,
             "log_level": "INFO"
         }
         
@@ -93,185 +250,5126 @@ class Config:
         return default_config
     
     def save_config(self):
-        """保存配置"""
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            logger.error(f"保存配置失败: {e}")
+        """立即保存配置（原子写入）"""
+        with self._lock:
+            self._dirty_since = None
+            data = json.dumps(self.config, indent=2, ensure_ascii=False)
+        
+        tmp_file = self.config_file + ".tmp"
+        with self._write_lock:
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, self.config_file)
+            except Exception as e:
+                logger.error(f"保存配置失败: {e}")
+    
+    def flush(self):
+        """有未保存的修改时立即写盘"""
+        with self._lock:
+            dirty = self._dirty_since is not None
+        if dirty:
+            self.save_config()
     
     def get(self, key: str, default=None):
         """获取配置值"""
         return self.config.get(key, default)
     
     def set(self, key: str, value):
-        """设置配置值"""
-        self.config[key] = value
-        self.save_config()
+        """设置配置值，延迟合并写盘"""
+        with self._lock:
+            if key in self.config and self.config[key] == value:
+                return
+            self.config[key] = value
+            now = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._last_change = now
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="config-flush", daemon=True)
+                self._flusher.start()
+            self._wake.set()
+    
+    def _flush_loop(self):
+        """写盘线程：有未保存的修改时等到到期再写盘，没有时休眠"""
+        while True:
+            self._wake.wait()
+            with self._lock:
+                if self._dirty_since is None:
+                    self._wake.clear()
+                    continue
+                # 防抖：最后一次修改后 SAVE_DELAY 写盘，但距首次未保存的修改不超过 MAX_SAVE_DELAY
+                due = min(self._last_change + self.SAVE_DELAY, self._dirty_since + self.MAX_SAVE_DELAY)
+                delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.flush()
+
+@dataclass
+class CommandResult:
+    """一次hdc命令的执行结果"""
+    command: str
+    output: str
+    exit_code: int
+    duration: float
+    target: str = ""
+    # 因超时被结束（AsyncHdcEngine）
+    timed_out: bool = False
+    
+    @property
+    def ok(self):
+        """命令是否执行成功（hdc 失败时退出码可能仍为0，需同时检查输出）"""
+        return self.exit_code == 0 and "[Fail]" not in self.output and not self.output.startswith("ERROR:")
+
+@dataclass
+class DeviceTarget:
+    """`list targets -v` 中的一个设备"""
+    connect_key: str
+    transport: str = ""
+    state: str = ""
+    name: str = ""
+    
+    @property
+    def connected(self):
+        return self.state.lower() in ("connected", "ready", "")
+
+@dataclass
+class CommandMetric:
+    """一次hdc调用的计时记录，时间单位为秒"""
+    verb: str
+    target: str = ""
+    source: str = "process"
+    spawn: float = 0.0
+    ttfb: Optional[float] = None
+    duration: float = 0.0
+    stdout_bytes: int = 0
+    stderr_bytes: int = 0
+    exit_code: int = 0
+    timestamp: float = 0.0
+
+class LatencyHistogram:
+    """对数分桶的耗时直方图
+
+    第 i 个桶的上界为 BASE * 2 ** (i / STEPS)，每个2倍区间分 STEPS 个桶，
+    分位数的相对误差约 19%；记录一次只需一次对数运算和计数加一。
+    """
+    
+    BASE = 0.0001
+    STEPS = 4
+    # 最后一个有限桶的上界约 1678 秒，更大的值计入 +Inf 桶
+    BUCKETS = 97
+    # 类体中的推导式不能引用类属性，这里直接写出常量
+    BOUNDS = [0.0001 * 2 ** (i / 4) for i in range(97)]
+    
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+    
+    def add(self, value):
+        if value <= self.BASE:
+            index = 0
+        else:
+            index = min(self.BUCKETS, math.ceil(math.log2(value / self.BASE) * self.STEPS - 1e-9))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+    
+    def quantile(self, q):
+        """估算分位数，桶内线性插值并限制在实际最小、最大值之间"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.BOUNDS[index - 1] if index > 0 else 0.0
+                upper = self.BOUNDS[index] if index < self.BUCKETS else self.max
+                value = lower + (upper - lower) * (rank - cumulative) / count
+                return min(max(value, self.min), self.max)
+            cumulative += count
+        return self.max
+    
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+class CommandStats:
+    """同一命令类别的累计统计"""
+    
+    def __init__(self):
+        self.duration = LatencyHistogram()
+        self.spawn = LatencyHistogram()
+        self.ttfb = LatencyHistogram()
+        self.errors = 0
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+    
+    def add(self, metric: CommandMetric):
+        self.duration.add(metric.duration)
+        if metric.source != "session":
+            self.spawn.add(metric.spawn)
+        if metric.ttfb is not None:
+            self.ttfb.add(metric.ttfb)
+        if metric.exit_code != 0:
+            self.errors += 1
+        self.stdout_bytes += metric.stdout_bytes
+        self.stderr_bytes += metric.stderr_bytes
+
+class MetricsStore:
+    """内存中的命令执行指标，按命令类别（verb）聚合为直方图，可在任意线程记录"""
+    
+    # 命令类别上限，超出后归入 other，防止任意shell命令使类别无限增长
+    MAX_VERBS = 200
+    # 保留的最近调用记录数
+    RECENT = 1000
+    
+    def __init__(self):
+        self.stats: Dict[str, CommandStats] = {}
+        self.recent = collections.deque(maxlen=self.RECENT)
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def command_verb(arguments):
+        """命令类别，如 shell ls、file recv、install"""
+        parts = arguments.split() if isinstance(arguments, str) else list(arguments)
+        if parts[:1] == ["-t"]:
+            parts = parts[2:]
+        if not parts:
+            return "hdc"
+        if parts[0] in ("file", "list", "fport", "target") and len(parts) > 1:
+            return f"{parts[0]} {parts[1]}"
+        if parts[0] == "shell" and len(parts) > 1:
+            return f"shell {os.path.basename(parts[1])[:32]}"
+        return parts[0]
+    
+    def record(self, metric: CommandMetric):
+        with self._lock:
+            stats = self.stats.get(metric.verb)
+            if stats is None:
+                if len(self.stats) >= self.MAX_VERBS:
+                    metric.verb = "other"
+                    stats = self.stats.get("other")
+                if stats is None:
+                    stats = self.stats[metric.verb] = CommandStats()
+            stats.add(metric)
+            self.recent.append(metric)
+    
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.recent.clear()
+    
+    def summary(self):
+        """每个命令类别一行的汇总（时间单位秒），按调用次数降序"""
+        with self._lock:
+            rows = []
+            for verb, stats in self.stats.items():
+                rows.append({
+                    "verb": verb,
+                    "count": stats.duration.count,
+                    "errors": stats.errors,
+                    "p50": stats.duration.quantile(0.50),
+                    "p95": stats.duration.quantile(0.95),
+                    "p99": stats.duration.quantile(0.99),
+                    "mean": stats.duration.mean,
+                    "max": stats.duration.max,
+                    "spawn_p50": stats.spawn.quantile(0.50),
+                    "ttfb_p50": stats.ttfb.quantile(0.50),
+                    "stdout_bytes": stats.stdout_bytes,
+                    "stderr_bytes": stats.stderr_bytes,
+                })
+        return sorted(rows, key=lambda row: row["count"], reverse=True)
+    
+    def to_json(self):
+        """汇总和最近调用记录，可直接 json.dump"""
+        with self._lock:
+            recent = [asdict(metric) for metric in self.recent]
+        return {"generated_at": time.time(), "commands": self.summary(), "recent": recent}
+    
+    def to_prometheus(self):
+        """Prometheus 文本格式"""
+        def label(verb):
+            return verb.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        
+        lines = []
+        with self._lock:
+            items = sorted(self.stats.items())
+            for name, attribute, help_text in (
+                    ("hdc_command_duration_seconds", "duration", "hdc命令总耗时"),
+                    ("hdc_command_spawn_seconds", "spawn", "启动hdc进程的耗时"),
+                    ("hdc_command_ttfb_seconds", "ttfb", "收到第一个输出字节的耗时")):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for verb, stats in items:
+                    histogram = getattr(stats, attribute)
+                    cumulative = 0
+                    for bound, count in zip(histogram.BOUNDS, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{verb="{label(verb)}",le="{bound:.6g}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{verb="{label(verb)}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{verb="{label(verb)}"}} {histogram.total:.6f}')
+                    lines.append(f'{name}_count{{verb="{label(verb)}"}} {histogram.count}')
+            for name, attribute, help_text in (
+                    ("hdc_command_errors_total", "errors", "退出码非0的命令数"),
+                    ("hdc_command_stdout_bytes_total", "stdout_bytes", "标准输出字节数"),
+                    ("hdc_command_stderr_bytes_total", "stderr_bytes", "标准错误字节数")):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for verb, stats in items:
+                    lines.append(f'{name}{{verb="{label(verb)}"}} {getattr(stats, attribute)}')
+        return "\n".join(lines) + "\n"
+    
+    def export(self, path):
+        """按扩展名导出：.json 为JSON，其余为 Prometheus 文本"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.lower().endswith(".json"):
+                json.dump(self.to_json(), f, indent=2, ensure_ascii=False)
+            else:
+                f.write(self.to_prometheus())
+
+# 全局指标存储，所有hdc调用都记录到这里
+metrics = MetricsStore()
+
+class CommandTimer:
+    """测量单次hdc调用：启动耗时、首字节时间、总耗时和输出字节数"""
+    
+    __slots__ = ("verb", "target", "source", "start", "spawn", "ttfb", "stdout_bytes", "stderr_bytes")
+    
+    def __init__(self, arguments, target="", source="process"):
+        parts = arguments.split() if isinstance(arguments, str) else arguments
+        self.verb = MetricsStore.command_verb(parts)
+        self.target = parts[1] if not target and len(parts) > 1 and parts[0] == "-t" else target
+        self.source = source
+        self.start = time.perf_counter()
+        self.spawn = 0.0
+        self.ttfb = None
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+    
+    def spawned(self):
+        self.spawn = time.perf_counter() - self.start
+    
+    def received(self, size, stderr=False):
+        if size and self.ttfb is None:
+            self.ttfb = time.perf_counter() - self.start
+        if stderr:
+            self.stderr_bytes += size
+        else:
+            self.stdout_bytes += size
+    
+    def finish(self, exit_code):
+        metrics.record(CommandMetric(self.verb, self.target, self.source, self.spawn, self.ttfb,
+                                     time.perf_counter() - self.start, self.stdout_bytes,
+                                     self.stderr_bytes, -1 if exit_code is None else exit_code, time.time()))
+
+@dataclass
+class ProcessInfo:
+    """系统中的一个进程"""
+    pid: int
+    ppid: int
+    name: str
+
+class ProcessUtil:
+    """跨平台的进程与文件系统操作，在进程内完成，不再借助 cmd.exe"""
+    
+    # Windows 下隐藏子进程控制台窗口，其他平台为空
+    POPEN_FLAGS = {"creationflags": subprocess.CREATE_NO_WINDOW} if os.name == "nt" else {}
+    
+    @staticmethod
+    def ensure_dir(path):
+        """创建目录（含上级目录），已存在时不报错"""
+        os.makedirs(path, exist_ok=True)
+        return path
+    
+    @staticmethod
+    def open_path(path):
+        """用系统默认程序打开文件或目录"""
+        path = os.path.abspath(path)
+        if os.name == "nt":
+            os.startfile(path)
+        elif sys.platform == "darwin":
+            subprocess.Popen(["open", path])
+        else:
+            subprocess.Popen(["xdg-open", path])
+    
+    @staticmethod
+    def list_processes() -> List[ProcessInfo]:
+        """列出系统中的所有进程"""
+        if os.name == "nt":
+            return ProcessUtil._list_processes_windows()
+        if os.path.isdir("/proc"):
+            return ProcessUtil._list_processes_proc()
+        return ProcessUtil._list_processes_ps()
+    
+    @staticmethod
+    def _list_processes_windows():
+        import ctypes
+        from ctypes import wintypes
+        
+        class PROCESSENTRY32W(ctypes.Structure):
+            _fields_ = [
+                ("dwSize", wintypes.DWORD),
+                ("cntUsage", wintypes.DWORD),
+                ("th32ProcessID", wintypes.DWORD),
+                ("th32DefaultHeapID", ctypes.c_size_t),
+                ("th32ModuleID", wintypes.DWORD),
+                ("cntThreads", wintypes.DWORD),
+                ("th32ParentProcessID", wintypes.DWORD),
+                ("pcPriClassBase", ctypes.c_long),
+                ("dwFlags", wintypes.DWORD),
+                ("szExeFile", ctypes.c_wchar * 260),
+            ]
+        
+        TH32CS_SNAPPROCESS = 0x00000002
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+        kernel32.CreateToolhelp32Snapshot.argtypes = [wintypes.DWORD, wintypes.DWORD]
+        kernel32.Process32FirstW.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32W)]
+        kernel32.Process32NextW.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32W)]
+        kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        
+        snapshot = kernel32.CreateToolhelp32Snapshot(TH32CS_SNAPPROCESS, 0)
+        if not snapshot or snapshot == ctypes.c_void_p(-1).value:
+            logger.error(f"获取进程列表失败: {ctypes.get_last_error()}")
+            return []
+        processes = []
+        try:
+            entry = PROCESSENTRY32W()
+            entry.dwSize = ctypes.sizeof(PROCESSENTRY32W)
+            ok = kernel32.Process32FirstW(snapshot, ctypes.byref(entry))
+            while ok:
+                processes.append(ProcessInfo(entry.th32ProcessID, entry.th32ParentProcessID, entry.szExeFile))
+                ok = kernel32.Process32NextW(snapshot, ctypes.byref(entry))
+        finally:
+            kernel32.CloseHandle(snapshot)
+        return processes
+    
+    @staticmethod
+    def _list_processes_proc():
+        processes = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", 'r', encoding='utf-8', errors='replace') as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            # 格式: pid (comm) state ppid ...，comm 中可能包含空格和括号
+            name = stat[stat.find("(") + 1:stat.rfind(")")]
+            fields = stat[stat.rfind(")") + 2:].split()
+            processes.append(ProcessInfo(int(entry), int(fields[1]), name))
+        return processes
+    
+    @staticmethod
+    def _list_processes_ps():
+        output = subprocess.run(["ps", "-axo", "pid=,ppid=,comm="], capture_output=True, text=True).stdout
+        processes = []
+        for line in output.splitlines():
+            parts = line.split(None, 2)
+            if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+                processes.append(ProcessInfo(int(parts[0]), int(parts[1]), os.path.basename(parts[2])))
+        return processes
+    
+    @staticmethod
+    def find_processes(name) -> List[ProcessInfo]:
+        """按进程名查找（忽略大小写和 .exe 后缀），不包含当前进程"""
+        def normalize(value):
+            value = value.lower()
+            return value[:-4] if value.endswith(".exe") else value
+        
+        target = normalize(name)
+        return [p for p in ProcessUtil.list_processes()
+                if normalize(p.name) == target and p.pid != os.getpid()]
+    
+    @staticmethod
+    def terminate(pid, force=False):
+        """结束进程，成功返回True"""
+        try:
+            if os.name == "nt":
+                import ctypes
+                from ctypes import wintypes
+                PROCESS_TERMINATE = 0x0001
+                kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+                # 声明原型，否则64位系统上返回的句柄会被截断为int
+                kernel32.OpenProcess.restype = wintypes.HANDLE
+                kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+                kernel32.TerminateProcess.restype = wintypes.BOOL
+                kernel32.TerminateProcess.argtypes = [wintypes.HANDLE, wintypes.UINT]
+                kernel32.CloseHandle.restype = wintypes.BOOL
+                kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+                handle = kernel32.OpenProcess(PROCESS_TERMINATE, False, pid)
+                if not handle:
+                    return False
+                try:
+                    return bool(kernel32.TerminateProcess(handle, 1))
+                finally:
+                    kernel32.CloseHandle(handle)
+            os.kill(pid, signal.SIGKILL if force else signal.SIGTERM)
+            return True
+        except Exception as e:
+            logger.warning(f"结束进程 {pid} 失败: {e}")
+            return False
+    
+    @staticmethod
+    def kill_processes(name):
+        """结束所有同名进程，返回成功结束的进程数"""
+        return sum(1 for p in ProcessUtil.find_processes(name) if ProcessUtil.terminate(p.pid))
+    
+    @staticmethod
+    def kill_process_tree(pid):
+        """结束进程及其所有子进程"""
+        if os.name != "nt":
+            # 以 start_new_session 启动的进程自成进程组，可一次性结束
+            try:
+                os.killpg(pid, signal.SIGKILL)
+                return
+            except Exception:
+                pass
+        children = {}
+        for process in ProcessUtil.list_processes():
+            children.setdefault(process.ppid, []).append(process.pid)
+        # 先结束子进程，避免其被重新挂到其他父进程下
+        order, stack = [], [pid]
+        while stack:
+            current = stack.pop()
+            order.append(current)
+            stack.extend(children.get(current, []))
+        for current in reversed(order):
+            ProcessUtil.terminate(current, force=True)
+
+class HdcSessionError(Exception):
+    """shell会话不可用（启动失败、写入失败等），调用方应回退到单进程执行"""
+
+
+class HdcShellSession:
+    """常驻的 hdc shell 会话
+
+    每个设备保持一个 `hdc [-t key] shell` 进程，命令通过标准输入发送，
+    输出用前后哨兵行分隔，因此每条命令的结果与单独执行一次完全一致。
+    标准错误单独读取，与单进程执行一样以 "ERROR: " 前缀附加在输出末尾。
+    """
+
+    # 会话建立（握手）超时时间，单位秒
+    START_TIMEOUT = 10
+    # 输出队列上限（行），消费方处理不及时时阻塞读取，由管道向hdc施加背压
+    MAX_PENDING_LINES = 1024
+
+    def __init__(self, hdc_path, target=""):
+        self.hdc_path = hdc_path
+        self.target = target
+        self.process = None
+        self.lines = None
+        self.exit_code = None
+        self._stopped = None
+        # 同一会话同一时间只能执行一条命令
+        self.lock = threading.Lock()
+        self._token = uuid.uuid4().hex[:12]
+        self._seq = 0
+
+    def start(self):
+        """启动 hdc shell 进程并完成握手"""
+        args = [self.hdc_path]
+        if self.target:
+            args += ["-t", self.target]
+        args.append("shell")
+        try:
+            self.process = subprocess.Popen(
+                args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                errors="replace",
+                bufsize=1,
+                **ProcessUtil.POPEN_FLAGS
+            )
+        except Exception as e:
+            raise HdcSessionError(f"启动shell会话失败: {e}")
+
+        self.lines = queue.Queue(maxsize=self.MAX_PENDING_LINES)
+        self._stopped = threading.Event()
+        for stream, is_stderr in ((self.process.stdout, False), (self.process.stderr, True)):
+            reader = threading.Thread(target=self._read_output, args=(stream, is_stderr, self.lines, self._stopped))
+            reader.daemon = True
+            reader.start()
+
+        # 关闭回显和提示符，避免污染命令输出
+        self._send("stty -echo 2>/dev/null; PS1=''; PS2=''; export PS1 PS2")
+        ready = self._next_marker()
+        self._send(f"echo {ready}")
+        deadline = time.monotonic() + self.START_TIMEOUT
+        while True:
+            item = self._get_line(deadline)
+            if item is None:
+                self.close()
+                raise HdcSessionError("shell会话握手失败")
+            line, is_stderr = item
+            if not is_stderr and line.rstrip("\r\n").endswith(ready) and "echo" not in line:
+                break
+        logger.info(f"shell会话已建立: {self.target or '默认设备'}")
+
+    @staticmethod
+    def _read_output(stream, is_stderr, lines, stopped):
+        """后台读取进程的标准输出或标准错误，以 (行, 是否为标准错误) 放入队列
+
+        队列满时等待消费方，会话关闭后退出。标准输出结束表示会话断开，此时放入None。
+        """
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    lines.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for line in stream:
+                if not put((line, is_stderr)):
+                    return
+        except Exception:
+            pass
+        if not is_stderr:
+            put(None)
+
+    def _next_marker(self):
+        self._seq += 1
+        return f"__HDT_{self._token}_{self._seq}__"
+
+    def _send(self, text):
+        try:
+            self.process.stdin.write(text + "\n")
+            self.process.stdin.flush()
+        except Exception as e:
+            raise HdcSessionError(f"写入shell会话失败: {e}")
+
+    def _get_line(self, deadline=None):
+        """读取一行输出，返回 (行, 是否为标准错误)，超时、进程退出或会话被关闭时返回None"""
+        lines, stopped = self.lines, self._stopped
+        while True:
+            wait = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+            if wait <= 0:
+                return None
+            try:
+                return lines.get(timeout=wait)
+            except queue.Empty:
+                # 会话可能已被其他线程关闭（超时或取消），此时不会再有输出
+                if stopped.is_set():
+                    return None
+
+    def _pending_errors(self):
+        """取出队列中已到达的标准错误行，标准输出行不应出现在结束哨兵之后，一并丢弃"""
+        errors = []
+        while True:
+            try:
+                item = self.lines.get_nowait()
+            except queue.Empty:
+                return errors
+            if item is None:
+                # 会话已断开，放回供下次读取时发现
+                self.lines.put(None)
+                return errors
+            if item[1]:
+                errors.append(item[0].rstrip("\r\n"))
+
+    def is_alive(self):
+        """会话进程是否仍在运行"""
+        return self.process is not None and self.process.poll() is None
+
+    def execute(self, command, timeout=None):
+        """在会话中执行一条设备端命令，返回 (输出, 退出码)"""
+        output = list(self.iter_lines(command, timeout))
+        return '\n'.join(output), self.exit_code
+
+    def iter_lines(self, command, timeout=None):
+        """在会话中执行一条设备端命令，返回逐行产出输出的生成器
+
+        命令会立即发出，尚未发出就失败时抛出 HdcSessionError；执行过程中会话断开
+        或超时，则产出一行错误信息并关闭会话，下次调用时自动重连。
+        生成器被提前关闭时，剩余输出无法与下一条命令区分，同样会关闭会话。
+        退出码在生成器结束后通过 exit_code 获取。
+        """
+        if not self.is_alive():
+            raise HdcSessionError("shell会话未运行")
+
+        begin = self._next_marker()
+        end = self._next_marker()
+        # 命令放在独立的代码块中并重定向标准输入，防止其读取后续发送的内容
+        timer = CommandTimer(["shell"] + command.split()[:1], self.target, source="session")
+        self._send(f"echo {begin}\n{{ {command}\n}} </dev/null\necho {end} $?")
+        self.exit_code = None
+        deadline = time.monotonic() + timeout if timeout else None
+        return self._receive(begin, end, deadline, timer)
+
+    def _receive(self, begin, end, deadline, timer):
+        end_pattern = re.compile(re.escape(end) + r" (\d+)\s*$")
+        started = False
+        finished = False
+        errors = []
+        try:
+            while True:
+                item = self._get_line(deadline)
+                if item is None:
+                    finished = True
+                    self.close()
+                    self.exit_code = -1
+                    if deadline is not None and time.monotonic() >= deadline:
+                        yield "ERROR: 命令执行超时"
+                    else:
+                        yield "ERROR: shell会话已断开"
+                    return
+                line, is_stderr = item
+                line = line.rstrip("\r\n")
+                if is_stderr:
+                    # 开始哨兵之前的标准错误属于上一条命令，丢弃
+                    if started:
+                        timer.received(len(line) + 1, stderr=True)
+                        errors.append(line)
+                    continue
+                if not started:
+                    started = line.endswith(begin) and "echo" not in line
+                    continue
+                match = end_pattern.search(line)
+                if match:
+                    finished = True
+                    self.exit_code = int(match.group(1))
+                    # 命令输出末尾没有换行时，哨兵会与最后一段输出处于同一行
+                    if match.start() > 0:
+                        timer.received(match.start())
+                        yield line[:match.start()]
+                    errors.extend(self._pending_errors())
+                    if errors:
+                        errors[0] = "ERROR: " + errors[0]
+                        yield from errors
+                    return
+                timer.received(len(line) + 1)
+                yield line
+        finally:
+            if not finished:
+                self.close()
+            timer.finish(self.exit_code)
+
+    def close(self):
+        """关闭会话进程"""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        self._stopped.set()
+        try:
+            process.stdin.close()
+        except Exception:
+            pass
+        try:
+            process.kill()
+            process.wait(timeout=2)
+        except Exception:
+            pass
+
 
 class HdcUtil:
     """HDC工具类，用于执行hdc命令"""
     
+    # shell会话连续失败后，暂停重连的时间，单位秒
+    SESSION_RETRY_INTERVAL = 30
+    # 同步执行shell命令（run_shell、execute）时会话命令的默认超时时间，单位秒
+    DEFAULT_SHELL_TIMEOUT = 300
+
     def __init__(self):
-        self.hdc_path = "toolchains/hdc.exe"
-        self.check_hdc_path()
+        # hdc路径在首次使用时才查找，不阻塞启动
+        # Linux/macOS 下的hdc没有 .exe 后缀
+        self._hdc_path = "toolchains/hdc.exe" if os.name == "nt" else "toolchains/hdc"
+        self._hdc_checked = False
+        self._hdc_lock = threading.Lock()
+        
+        # 常驻shell会话，键为connect key（空字符串表示默认设备）
+        self.use_shell_session = True
+        # 超时后关闭会话，避免命令卡住时一直占用会话锁；None表示不限制
+        self.shell_timeout = self.DEFAULT_SHELL_TIMEOUT
+        self._shell_sessions = {}
+        self._session_retry_at = {}
+        self._sessions_lock = threading.Lock()
+    
+    @property
+    def hdc_path(self):
+        """hdc可执行文件路径，首次访问时查找"""
+        if not self._hdc_checked:
+            with self._hdc_lock:
+                if not self._hdc_checked:
+                    self.check_hdc_path()
+                    self._hdc_checked = True
+        return self._hdc_path
+    
+    @hdc_path.setter
+    def hdc_path(self, path):
+        self._hdc_path = path
+        self._hdc_checked = True
     
     def check_hdc_path(self):
-        """检查hdc.exe路径"""
-        if not os.path.exists(self.hdc_path):
-            logger.warning(f"HDC路径不存在: {self.hdc_path}")
-            # 尝试查找hdc.exe
-            possible_paths = [
-                "hdc.exe",
-                "toolchains/hdc.exe",
-                "toolchains\\hdc.exe",
-                "../toolchains/hdc.exe"
-            ]
-            for path in possible_paths:
-                if os.path.exists(path):
-                    self.hdc_path = path
-                    logger.info(f"找到HDC路径: {self.hdc_path}")
-                    break
+        """检查hdc路径，默认位置不存在时依次查找其他位置和 PATH，都找不到时记录警告"""
+        if os.path.exists(self._hdc_path):
+            return
+        possible_paths = [
+            "hdc.exe",
+            "toolchains/hdc.exe",
+            "toolchains\\hdc.exe",
+            "../toolchains/hdc.exe"
+        ]
+        if os.name != "nt":
+            possible_paths = ["hdc", "../toolchains/hdc"] + possible_paths
+        for path in possible_paths:
+            if os.path.exists(path):
+                break
+        else:
+            # 最后在 PATH 中查找
+            path = shutil.which("hdc")
+        if path:
+            logger.debug(f"HDC不在默认位置 {self._hdc_path}，使用: {path}")
+            self._hdc_path = path
+        else:
+            logger.warning(f"HDC路径不存在: {self._hdc_path}")
     
-    @staticmethod
-    def run_cmd(parameter="", with_exit=True):
-        """使用cmd.exe执行命令"""
+    def run_exe(self, exe_path, arguments=""):
+        """使用指定的exe文件执行命令"""
+        return self._run_process(exe_path, arguments)[0]
+    
+    def _run_process(self, exe_path, arguments=""):
+        """使用指定的exe文件执行命令，返回 (输出, 退出码)
+
+        arguments 为字符串时按空白拆分；为列表时原样传递（用于含空格的路径）。
+        按块读取标准输出以记录首字节时间，标准错误在单独的线程中读取，避免管道写满阻塞。
+        """
         output = []
+        returncode = -1
+        if isinstance(arguments, str):
+            arguments = arguments.split()
+        timer = CommandTimer(arguments)
         try:
-            if parameter:
-                cmd = ["cmd.exe", "/c", parameter]
-                if with_exit:
-                    cmd.append("&exit")
-            else:
-                cmd = ["cmd.exe"]
-            
             process = subprocess.Popen(
-                cmd,
+                [exe_path] + arguments,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW
+                **ProcessUtil.POPEN_FLAGS
             )
+            timer.spawned()
             
-            stdout, stderr = process.communicate()
+            stderr_chunks = []
+            stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+            stderr_reader.start()
+            chunks = []
+            while True:
+                chunk = process.stdout.read1(65536)
+                if not chunk:
+                    break
+                timer.received(len(chunk))
+                chunks.append(chunk)
+            stderr_reader.join()
+            returncode = process.wait()
+            process.stdout.close()
+            process.stderr.close()
             
-            # 过滤输出
-            for line in stdout.split('\n'):
-                if line and not line.startswith("(c) Microsoft") and not line.startswith("Microsoft Windows"):
-                    output.append(line)
+            stderr = b"".join(stderr_chunks)
+            timer.received(len(stderr), stderr=True)
+            if chunks:
+                output.extend(self.decode(b"".join(chunks)).split('\n'))
             
             if stderr:
-                output.append(f"ERROR: {stderr}")
+                output.append(f"ERROR: {self.decode(stderr)}")
                 
         except Exception as e:
-            logger.error(f"执行命令失败: {e}")
-            output.append(f"ERROR: {e}")
-            
-        return '\n'.join(output)
+            logger.error(f"执行exe失败: {e}")
+            output.append(f"ERROR: {e}")
+        finally:
+            timer.finish(returncode)
+            
+        return '\n'.join(output), returncode
+    
+    @staticmethod
+    def decode(data):
+        """按系统编码解码进程输出，并统一换行符（与文本模式读取一致）"""
+        return data.decode(locale.getpreferredencoding(False), errors="replace").replace("\r\n", "\n")
+    
+    def iter_exe(self, exe_path, arguments=""):
+        """使用指定的exe文件执行命令，返回逐行产出输出的生成器
+
+        stderr 合并到 stdout，输出按行解码后立即产出，不在内存中累积；
+        消费方处理慢时管道写满，hdc 自然被阻塞。生成器提前关闭时结束进程。
+        """
+        arguments = arguments.split() if arguments else []
+        timer = CommandTimer(arguments)
+        try:
+            process = subprocess.Popen(
+                [exe_path] + arguments,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+                bufsize=1,
+                **ProcessUtil.POPEN_FLAGS
+            )
+        except Exception as e:
+            logger.error(f"执行exe失败: {e}")
+            timer.finish(-1)
+            yield f"ERROR: {e}"
+            return
+        timer.spawned()
+        
+        try:
+            for line in process.stdout:
+                # 文本模式下按字符数近似字节数
+                timer.received(len(line))
+                yield line.rstrip("\r\n")
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            timer.finish(process.wait())
+    
+    def export_file(self, origin_path, local_dir=None, max_workers=4, on_progress=None,
+                    async_engine=None, timeout=None, target=""):
+        """从 target 设备导出文件或目录到 local_dir（默认为当前时间命名的目录）下的同名目录，多个文件并行传输
+
+        async_engine、timeout 见 TransferEngine。无法列举远端文件（设备离线、路径不存在）时
+        抛出 TransferError。
+        """
+        if local_dir is None:
+            local_dir = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        ProcessUtil.ensure_dir(local_dir)
+        origin_path = origin_path.rstrip("/")
+        engine = TransferEngine(self, max_workers, async_engine=async_engine, timeout=timeout)
+        if self.run_shell(f"test -d {shlex.quote(origin_path)} && echo dir", target).strip() == "dir":
+            local_dir = os.path.join(local_dir, origin_path.rsplit("/", 1)[-1])
+        return engine.recv(origin_path, local_dir, target, on_progress=on_progress).summary()
+    
+    def recv_file(self, remote_path, local_path, target=""):
+        """从设备接收单个文件或目录，返回 CommandResult"""
+        return self._transfer_file("recv", remote_path, local_path, target)
+    
+    def send_file(self, local_path, remote_path, target=""):
+        """向设备发送单个文件或目录，返回 CommandResult"""
+        return self._transfer_file("send", local_path, remote_path, target)
+    
+    def _transfer_file(self, direction, source, destination, target=""):
+        arguments = ["-t", target] if target else []
+        arguments += ["file", direction, source, destination]
+        start = time.perf_counter()
+        output, exit_code = self._run_process(self.hdc_path, arguments)
+        return CommandResult(" ".join(arguments), output, exit_code, time.perf_counter() - start, target)
+    
+    def run_command(self, command):
+        """运行hdc命令，带参数的shell命令通过常驻会话执行"""
+        return self.execute(command).output
+    
+    def execute(self, command, target=""):
+        """运行hdc命令并返回 CommandResult，指定 target 时自动添加 `-t` 前缀"""
+        if target and not command.lstrip().startswith("-t "):
+            command = f"-t {target} {command}"
+        start = time.perf_counter()
+        shell = self.parse_shell_command(command)
+        if shell is not None:
+            target, shell_command = shell
+            output, exit_code = self._run_shell(shell_command, target)
+        else:
+            target = self.split_target(command)[0]
+            output, exit_code = self._run_process(self.hdc_path, command)
+        return CommandResult(command, output, exit_code, time.perf_counter() - start, target)
+    
+    @staticmethod
+    def install_options(replace=False, downgrade=False, grant=False):
+        """install 命令的选项：-r 替换安装、-d 允许降级、-g 动态授权"""
+        options = []
+        if replace:
+            options.append("-r")
+        if downgrade:
+            options.append("-d")
+        if grant:
+            options.append("-g")
+        return options
+    
+    def install(self, hap_path, target="", options=()):
+        """安装hap文件，返回 CommandResult"""
+        arguments = ["-t", target] if target else []
+        arguments += ["install"] + list(options) + [os.path.normpath(hap_path)]
+        start = time.perf_counter()
+        output, exit_code = self._run_process(self.hdc_path, arguments)
+        return CommandResult(" ".join(arguments), output, exit_code, time.perf_counter() - start, target)
+    
+    def list_targets(self) -> List[DeviceTarget]:
+        """列举设备"""
+        return self.parse_targets(self.run_command("list targets -v"))
+    
+    @staticmethod
+    def parse_targets(output) -> List[DeviceTarget]:
+        """解析 `list targets [-v]` 的输出"""
+        targets = []
+        for line in output.splitlines():
+            parts = line.split()
+            # 跳过 [Empty]、[Fail] 及错误信息
+            if not parts or parts[0].startswith("[") or parts[0] == "ERROR:":
+                continue
+            targets.append(DeviceTarget(
+                connect_key=parts[0],
+                transport=parts[1] if len(parts) > 1 else "",
+                state=parts[2] if len(parts) > 2 else "",
+                name=" ".join(parts[3:])
+            ))
+        return targets
+    
+    def iter_command(self, command):
+        """运行hdc命令，返回逐行产出输出的生成器"""
+        shell = self.parse_shell_command(command)
+        if shell is not None:
+            target, shell_command = shell
+            session = self.acquire_session(target)
+            if session is not None:
+                try:
+                    lines = session.iter_lines(shell_command)
+                except HdcSessionError as e:
+                    logger.warning(f"shell会话执行失败，回退到单进程执行: {e}")
+                    session.lock.release()
+                else:
+                    try:
+                        yield from lines
+                    finally:
+                        lines.close()
+                        session.lock.release()
+                    return
+        yield from self.iter_exe(self.hdc_path, command)
+    
+    def stream_command(self, command, on_line):
+        """运行hdc命令，每收到一行输出调用一次 on_line(line)
+
+        回调在调用线程中同步执行，回调阻塞期间不会继续读取输出。
+        """
+        for line in self.iter_command(command):
+            on_line(line)
+    
+    @staticmethod
+    def split_target(command):
+        """拆分命令中的 `-t <connect key>` 前缀，返回 (connect key, 剩余命令)"""
+        parts = command.strip().split(None, 2)
+        if len(parts) >= 2 and parts[0] == "-t":
+            return parts[1], parts[2] if len(parts) > 2 else ""
+        return "", command.strip()
+    
+    @staticmethod
+    def parse_shell_command(command):
+        """若为带参数的shell命令，返回 (connect key, 设备端命令)，否则返回None"""
+        target, rest = HdcUtil.split_target(command)
+        verb, _, shell_command = rest.partition(" ")
+        if verb != "shell" or not shell_command.strip():
+            return None
+        return target, shell_command.strip()
+    
+    def run_shell(self, shell_command, target=""):
+        """执行设备端shell命令，优先使用常驻会话，失败时回退到单进程执行"""
+        return self._run_shell(shell_command, target)[0]
+    
+    def _run_shell(self, shell_command, target=""):
+        """执行设备端shell命令，返回 (输出, 退出码)，会话中执行时超时见 shell_timeout"""
+        session = self.acquire_session(target)
+        if session is not None:
+            try:
+                return session.execute(shell_command, self.shell_timeout)
+            except HdcSessionError as e:
+                logger.warning(f"shell会话执行失败，回退到单进程执行: {e}")
+            finally:
+                session.lock.release()
+        
+        arguments = f"shell {shell_command}"
+        if target:
+            arguments = f"-t {target} {arguments}"
+        return self._run_process(self.hdc_path, arguments)
+    
+    def acquire_session(self, target):
+        """获取并锁定目标设备的shell会话，会话忙或不可用时返回None
+
+        使用完毕后调用方需执行 session.lock.release()。
+        """
+        if not self.use_shell_session:
+            return None
+        with self._sessions_lock:
+            session = self._shell_sessions.get(target)
+            if session is None:
+                if time.monotonic() < self._session_retry_at.get(target, 0):
+                    return None
+                session = HdcShellSession(self.hdc_path, target)
+                self._shell_sessions[target] = session
+        
+        # 会话正被其他命令占用时直接回退，保持并行执行能力
+        if not session.lock.acquire(blocking=False):
+            return None
+        if session.is_alive():
+            return session
+        
+        # 会话未启动或已断开，自动重连
+        try:
+            session.start()
+            return session
+        except HdcSessionError as e:
+            logger.warning(f"{e}，{self.SESSION_RETRY_INTERVAL}秒内使用单进程执行")
+            session.lock.release()
+            with self._sessions_lock:
+                if self._shell_sessions.get(target) is session:
+                    del self._shell_sessions[target]
+                self._session_retry_at[target] = time.monotonic() + self.SESSION_RETRY_INTERVAL
+            return None
+    
+    def close_session(self, target):
+        """关闭指定设备的shell会话（设备断开时调用）"""
+        with self._sessions_lock:
+            session = self._shell_sessions.pop(target, None)
+            self._session_retry_at.pop(target, None)
+        if session is not None:
+            session.close()
+    
+    def close_sessions(self):
+        """关闭所有shell会话"""
+        with self._sessions_lock:
+            sessions = list(self._shell_sessions.values())
+            self._shell_sessions.clear()
+        for session in sessions:
+            session.close()
+
+class AsyncHdcEngine:
+    """基于asyncio的hdc执行引擎
+
+    所有命令在同一个后台事件循环中以协程方式执行，进程输出异步读取，
+    因此大量并发命令只占用一个线程。支持单条命令超时、取消（结束整个进程树）
+    和全局并发上限。带参数的shell命令仍优先走常驻shell会话。
+    """
+    
+    # 单行输出长度上限，超过时asyncio按错误处理
+    LINE_LIMIT = 1024 * 1024
+    
+    def __init__(self, hdc_util, max_concurrency=16):
+        self.hdc_util = hdc_util
+        self.max_concurrency = max_concurrency
+        self.encoding = locale.getpreferredencoding(False)
+        self.loop = asyncio.new_event_loop()
+        # shell会话的读取是阻塞的，放在少量工作线程中执行
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(2, min(8, max_concurrency)), thread_name_prefix="hdc-engine")
+        self._semaphore = None
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def start(self):
+        """启动后台事件循环线程"""
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+        
+        def run_loop():
+            asyncio.set_event_loop(self.loop)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            ready.set()
+            self.loop.run_forever()
+        
+        self._thread = threading.Thread(target=run_loop, name="hdc-engine-loop", daemon=True)
+        self._thread.start()
+        ready.wait()
+    
+    def submit(self, coro) -> concurrent.futures.Future:
+        """在事件循环中运行协程，返回可在任意线程使用的 Future，cancel() 即可取消"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+    
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+    
+    def run_command(self, command, timeout=None, on_line=None, target="") -> concurrent.futures.Future:
+        """提交一条hdc命令，Future 的结果为 CommandResult"""
+        return self.submit(self.execute(command, timeout, on_line, target))
+    
+    def run_in_executor(self, func, *args) -> concurrent.futures.Future:
+        """在引擎的工作线程中执行阻塞函数"""
+        async def run():
+            return await self.loop.run_in_executor(self.executor, func, *args)
+        return self.submit(run())
+    
+    @property
+    def pending(self):
+        """尚未完成的任务数"""
+        with self._lock:
+            return len(self._futures)
+    
+    def cancel_all(self):
+        """取消所有尚未完成的任务"""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+        return len(futures)
+    
+    def shutdown(self):
+        """取消所有任务并停止事件循环"""
+        self.cancel_all()
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread = None
+        self.executor.shutdown(wait=False)
+    
+    async def execute(self, command, timeout=None, on_line=None, target="") -> CommandResult:
+        """执行一条hdc命令
+
+        command 为列表时按参数原样传递（用于含空格的路径），不走shell会话。
+        on_line 不为空时每行输出回调一次且不在结果中累积；超时后结束进程树，在输出中
+        附带超时信息并设置结果的 timed_out；被取消时同样结束进程树后抛出 CancelledError。
+        """
+        if isinstance(command, (list, tuple)):
+            arguments = (["-t", target] if target else []) + list(command)
+            command = " ".join(arguments)
+            shell = None
+        else:
+            if target and not command.lstrip().startswith("-t "):
+                command = f"-t {target} {command}"
+            arguments = command.split()
+            shell = HdcUtil.parse_shell_command(command)
+        async with self._semaphore:
+            start = time.perf_counter()
+            output = []
+            emit = on_line or output.append
+            result = None
+            timed_out = False
+            try:
+                if shell is not None:
+                    result = await self._execute_in_session(shell[1], shell[0], timeout, emit)
+                if result is None:
+                    result = await self._execute_process(arguments, timeout, emit)
+            except asyncio.TimeoutError:
+                result, timed_out = -1, True
+            exit_code, target = result, self.hdc_util.split_target(command)[0]
+            return CommandResult(command, '\n'.join(output), exit_code, time.perf_counter() - start, target,
+                                 timed_out)
+    
+    async def _execute_in_session(self, shell_command, target, timeout, emit):
+        """通过常驻shell会话执行，返回退出码，会话不可用时返回None，超时时抛出 TimeoutError"""
+        session = self.hdc_util.acquire_session(target)
+        if session is None:
+            return None
+        try:
+            lines = session.iter_lines(shell_command)
+        except HdcSessionError as e:
+            logger.warning(f"shell会话执行失败，回退到单进程执行: {e}")
+            session.lock.release()
+            return None
+        
+        timed_out = threading.Event()
+        
+        def consume():
+            try:
+                for line in lines:
+                    # 超时后关闭会话产生的断开信息不再输出
+                    if not timed_out.is_set():
+                        emit(line)
+            finally:
+                lines.close()
+                session.lock.release()
+            return session.exit_code
+        
+        future = self.loop.run_in_executor(self.executor, consume)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            # 关闭会话会结束hdc进程，读取线程随之退出
+            timed_out.set()
+            session.close()
+            await future
+            emit("ERROR: 命令执行超时")
+            raise
+        except asyncio.CancelledError:
+            session.close()
+            raise
+    
+    async def _execute_process(self, arguments, timeout, emit):
+        """启动独立的hdc进程执行，返回退出码，超时时抛出 TimeoutError"""
+        kwargs = dict(ProcessUtil.POPEN_FLAGS)
+        if os.name != "nt":
+            # 独立的进程组，便于结束整个进程树
+            kwargs["start_new_session"] = True
+        timer = CommandTimer(arguments, source="async")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.hdc_util.hdc_path, *arguments,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                limit=self.LINE_LIMIT,
+                **kwargs
+            )
+        except Exception as e:
+            logger.error(f"执行exe失败: {e}")
+            emit(f"ERROR: {e}")
+            timer.finish(-1)
+            return -1
+        timer.spawned()
+        
+        async def pump():
+            async for raw in process.stdout:
+                timer.received(len(raw))
+                emit(raw.decode(self.encoding, errors="replace").rstrip("\r\n"))
+            return await process.wait()
+        
+        exit_code = -1
+        try:
+            exit_code = await asyncio.wait_for(pump(), timeout)
+            return exit_code
+        except asyncio.TimeoutError:
+            ProcessUtil.kill_process_tree(process.pid)
+            await process.wait()
+            emit("ERROR: 命令执行超时")
+            raise
+        except asyncio.CancelledError:
+            ProcessUtil.kill_process_tree(process.pid)
+            raise
+        finally:
+            timer.finish(exit_code)
+
+class DeviceRegistry:
+    """后台设备注册表
+
+    后台线程按固定间隔轮询 `list targets -v`，缓存解析后的设备列表，查询时直接返回缓存；
+    设备增加、移除或状态变化时通知订阅者。
+    """
+    
+    ADDED = "added"
+    REMOVED = "removed"
+    CHANGED = "changed"
+    
+    def __init__(self, hdc_util, interval=3.0):
+        self.hdc_util = hdc_util
+        self.interval = interval
+        self._devices: Dict[str, DeviceTarget] = {}
+        self._updated_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._listeners = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """启动后台轮询"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._poll, name="device-registry", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """停止后台轮询"""
+        self._stop.set()
+        self._wakeup.set()
+        self._thread = None
+    
+    def subscribe(self, callback):
+        """订阅设备变化，callback(event, device, previous) 在轮询线程中调用
+
+        event 为 ADDED / REMOVED / CHANGED，previous 仅在 CHANGED 时为变化前的记录。
+        返回取消订阅的函数。
+        """
+        with self._lock:
+            self._listeners.append(callback)
+        
+        def unsubscribe():
+            with self._lock:
+                if callback in self._listeners:
+                    self._listeners.remove(callback)
+        return unsubscribe
+    
+    def devices(self, wait=False) -> List[DeviceTarget]:
+        """缓存的设备列表
+
+        尚未完成首次轮询时：wait 为True则同步刷新一次（只能在工作线程中使用），否则返回
+        空列表并让后台线程立即轮询，结果通过订阅回调通知。
+        """
+        if self._updated_at is None:
+            if wait:
+                return self.refresh()
+            self.request_refresh()
+        with self._lock:
+            return list(self._devices.values())
+    
+    def get(self, connect_key) -> Optional[DeviceTarget]:
+        """按 connect key 查询缓存的设备"""
+        with self._lock:
+            return self._devices.get(connect_key)
+    
+    @property
+    def age(self):
+        """缓存的年龄，单位秒，尚未轮询时为None"""
+        return None if self._updated_at is None else time.monotonic() - self._updated_at
+    
+    def request_refresh(self):
+        """让后台线程立即轮询一次"""
+        self._wakeup.set()
+    
+    def refresh(self) -> List[DeviceTarget]:
+        """立即轮询一次并返回最新的设备列表"""
+        with self._refresh_lock:
+            result = self.hdc_util.execute("list targets -v")
+            if "ERROR:" in result.output or "[Fail]" in result.output:
+                # hdc 本身出错时保留上次结果，避免误报设备全部断开
+                logger.warning(f"列举设备失败: {result.output.strip()}")
+                with self._lock:
+                    return list(self._devices.values())
+            
+            current = {t.connect_key: t for t in HdcUtil.parse_targets(result.output)}
+            events = []
+            with self._lock:
+                for key, device in current.items():
+                    previous = self._devices.get(key)
+                    if previous is None:
+                        events.append((self.ADDED, device, None))
+                    elif previous != device:
+                        events.append((self.CHANGED, device, previous))
+                for key, device in self._devices.items():
+                    if key not in current:
+                        events.append((self.REMOVED, device, None))
+                self._devices = current
+                self._updated_at = time.monotonic()
+                listeners = list(self._listeners)
+        
+        for event in events:
+            for listener in listeners:
+                try:
+                    listener(*event)
+                except Exception as e:
+                    logger.error(f"设备事件处理失败: {e}")
+        return list(current.values())
+    
+    def _poll(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"设备轮询失败: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+class QueryCache:
+    """幂等查询结果缓存
+
+    按 (connect key, 命令) 缓存 UDID、版本、param get 等设备连接期间不会变化的查询结果，
+    超过 TTL 或条目数超过上限（淘汰最久未使用的）时丢弃。设备连接、断开或状态变化时
+    该设备和默认设备的缓存失效，hdc 服务重启时全部失效，执行 param set 等修改命令时
+    相应的查询失效。
+    """
+    
+    # 修改设备状态的命令前缀 -> 因此失效的查询前缀
+    WRITES = {"shell param set": "shell param get"}
+    
+    def __init__(self, prefixes=(), ttl=600.0, max_entries=256):
+        self.prefixes = tuple(prefixes)
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(command):
+        """缓存键 (connect key, 去除多余空白的命令)"""
+        target, rest = HdcUtil.split_target(command)
+        return target, " ".join(rest.split())
+    
+    @staticmethod
+    def matches(rest, prefixes):
+        return any(rest == prefix or rest.startswith(prefix + " ") for prefix in prefixes)
+    
+    def cacheable(self, command):
+        return self.matches(self.key(command)[1], self.prefixes)
+    
+    def invalidate_for(self, command):
+        """command 会修改设备状态时（如 param set），使相应查询的缓存失效，返回清除的条目数
+
+        未指定设备时无法确定是哪台设备，所有设备的相应查询都失效。
+        """
+        target, rest = self.key(command)
+        stale = [read for write, read in self.WRITES.items() if self.matches(rest, (write,))]
+        if not stale:
+            return 0
+        with self._lock:
+            keys = [key for key in self._entries
+                    if (not target or key[0] in (target, "")) and self.matches(key[1], stale)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+    
+    @staticmethod
+    def resets_server(command):
+        """kill / start 会重启hdc服务，之前的结果全部作废"""
+        return HdcUtil.split_target(command)[1].split()[:1] in (["kill"], ["start"])
+    
+    def get(self, command):
+        """返回 (CommandResult, 缓存时长秒数)，未命中或已过期时返回None"""
+        key = self.key(command)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], now - entry[1]
+    
+    def put(self, result: CommandResult):
+        """缓存成功的可缓存查询，返回是否已缓存"""
+        if not result.ok or not self.cacheable(result.command):
+            return False
+        key = self.key(result.command)
+        with self._lock:
+            self._entries[key] = (result, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+    
+    def invalidate(self, target=None):
+        """使 target 及默认设备的缓存失效，target 为None时全部清空，返回清除的条目数"""
+        with self._lock:
+            if target is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            keys = [key for key in self._entries if key[0] in (target, "")]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+    
+    def on_device_event(self, event, device, previous):
+        """DeviceRegistry 订阅回调"""
+        self.invalidate(device.connect_key)
+    
+    def __len__(self):
+        return len(self._entries)
+
+@dataclass
+class PackageList:
+    """一台设备的包名索引，创建后不再修改"""
+    names: List[str]
+    lower: List[str]
+    joined: str
+    starts: Any
+    updated_at: float
+
+class PackageIndex:
+    """按设备缓存的已安装应用包名索引
+
+    `bm dump -a` 的结果按设备缓存：包名按小写排序后二分查找前缀，子串查找在拼接后的
+    小写文本上用 str.find 扫描，查询时都不调用hdc。缓存超过 ttl、设备连接状态变化或
+    安装卸载后在后台线程中重新获取，同一设备同时只有一次刷新。获取失败（设备离线等）后
+    RETRY_DELAY 秒内不再自动重试，避免每次按键都启动hdc。
+    """
+    
+    BUNDLE_PATTERN = re.compile(r"[A-Za-z][\w-]*(?:\.[\w-]+)+")
+    # 获取失败后自动重试的最短间隔（秒）
+    RETRY_DELAY = 30.0
+    
+    def __init__(self, hdc_util, ttl=300.0):
+        self.hdc_util = hdc_util
+        self.ttl = ttl
+        self._lists: Dict[str, PackageList] = {}
+        self._failed_at: Dict[str, float] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def parse(cls, output):
+        """解析 `bm dump -a` 的输出（"ID: 100:" 后每行一个包名），返回按小写排序的包名"""
+        names = {line.strip() for line in output.splitlines() if cls.BUNDLE_PATTERN.fullmatch(line.strip())}
+        return sorted(names, key=str.lower)
+    
+    @staticmethod
+    def build(names) -> PackageList:
+        lower = [name.lower() for name in names]
+        starts = array('L')
+        position = 0
+        for name in lower:
+            starts.append(position)
+            position += len(name) + 1
+        return PackageList(list(names), lower, "\n".join(lower), starts, time.monotonic())
+    
+    def packages(self, target="") -> List[str]:
+        with self._lock:
+            package_list = self._lists.get(target)
+        return list(package_list.names) if package_list else []
+    
+    def refresh(self, target=""):
+        """立即重新获取，返回 (新增的包, 移除的包)；失败时记录失败时间"""
+        try:
+            output, exit_code = self.hdc_util._run_shell("bm dump -a", target)
+        except Exception:
+            self._mark_failed(target)
+            raise
+        names = self.parse(output)
+        if not names and (exit_code != 0 or "error" in output.lower() or "[Fail]" in output):
+            logger.warning(f"获取应用列表失败: {output.strip()}")
+            self._mark_failed(target)
+            return [], []
+        package_list = self.build(names)
+        with self._lock:
+            self._failed_at.pop(target, None)
+            previous = set(self._lists[target].names) if target in self._lists else set()
+            self._lists[target] = package_list
+        added = [name for name in names if name not in previous]
+        removed = sorted(previous.difference(names))
+        if previous and (added or removed):
+            logger.info(f"应用列表已更新: 新增 {len(added)} 个，移除 {len(removed)} 个")
+        return added, removed
+    
+    def _mark_failed(self, target):
+        with self._lock:
+            self._failed_at[target] = time.monotonic()
+    
+    def refresh_async(self, target="", force=False):
+        """缓存不存在或已过期（force 为True时总是）在后台刷新，最近获取失败过时等待 RETRY_DELAY"""
+        with self._lock:
+            now = time.monotonic()
+            package_list = self._lists.get(target)
+            fresh = package_list is not None and now - package_list.updated_at < self.ttl
+            backoff = target in self._failed_at and now - self._failed_at[target] < self.RETRY_DELAY
+            if ((fresh or backoff) and not force) or target in self._refreshing:
+                return
+            self._refreshing.add(target)
+        
+        def run():
+            try:
+                self.refresh(target)
+            except Exception as e:
+                logger.error(f"刷新应用列表失败: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(target)
+        
+        threading.Thread(target=run, name="package-index", daemon=True).start()
+    
+    def remove(self, target, names):
+        """卸载成功后直接从索引中移除，不必重新获取"""
+        names = set(names)
+        with self._lock:
+            package_list = self._lists.get(target)
+            if package_list is not None:
+                rebuilt = self.build([n for n in package_list.names if n not in names])
+                rebuilt.updated_at = package_list.updated_at
+                self._lists[target] = rebuilt
+    
+    def invalidate(self, target=None):
+        """丢弃 target（None 为全部）的缓存"""
+        with self._lock:
+            if target is None:
+                self._lists.clear()
+                self._failed_at.clear()
+            else:
+                self._lists.pop(target, None)
+                self._failed_at.pop(target, None)
+    
+    def on_device_event(self, event, device, previous):
+        """DeviceRegistry 订阅回调：设备变化后丢弃缓存，新连接的设备预先获取"""
+        self.invalidate(device.connect_key)
+        self.invalidate("")
+        if event == DeviceRegistry.ADDED and device.connected:
+            self.refresh_async(device.connect_key)
+    
+    def search(self, target, text, limit=50) -> List[str]:
+        """先返回以 text 开头的包名，再返回包含 text 的包名（不区分大小写）
+
+        缓存不存在或已过期时在后台刷新，本次返回现有的结果。
+        """
+        self.refresh_async(target)
+        with self._lock:
+            package_list = self._lists.get(target)
+        if package_list is None:
+            return []
+        text = text.lower()
+        if not text:
+            return package_list.names[:limit]
+        lower = package_list.lower
+        matches = []
+        index = bisect.bisect_left(lower, text)
+        while index < len(lower) and lower[index].startswith(text) and len(matches) < limit:
+            matches.append(index)
+            index += 1
+        prefix_matches = set(matches)
+        joined, starts = package_list.joined, package_list.starts
+        position = joined.find(text)
+        while position >= 0 and len(matches) < limit:
+            index = bisect.bisect_right(starts, position) - 1
+            if index not in prefix_matches:
+                matches.append(index)
+            # 跳到下一行继续查找，同一个包名只计一次
+            position = joined.find(text, starts[index] + len(lower[index]) + 1)
+        return [package_list.names[i] for i in matches]
+
+class FanOutRunner:
+    """在多个设备上并行执行同一条hdc命令"""
+    
+    def __init__(self, hdc_util, max_workers=8):
+        self.hdc_util = hdc_util
+        self.max_workers = max_workers
+    
+    def run(self, command, targets=None, on_start=None, on_result=None) -> List[CommandResult]:
+        """在 targets（connect key 列表，默认所有已连接设备）上执行命令
+
+        on_start(target) / on_result(CommandResult) 在工作线程中回调，
+        返回结果按 targets 的顺序排列。
+        """
+        if targets is None:
+            targets = [t.connect_key for t in self.hdc_util.list_targets() if t.connected]
+        if not targets:
+            return []
+        
+        def run_one(target):
+            if on_start:
+                on_start(target)
+            try:
+                result = self.hdc_util.execute(command, target)
+            except Exception as e:
+                logger.error(f"设备 {target} 执行失败: {e}")
+                result = CommandResult(command, f"ERROR: {e}", -1, 0.0, target)
+            if on_result:
+                on_result(result)
+            return result
+        
+        workers = max(1, min(self.max_workers, len(targets)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fanout") as pool:
+            return list(pool.map(run_one, targets))
+
+@dataclass
+class DeviceInfo:
+    """设备信息快照"""
+    connect_key: str
+    udid: str = ""
+    manufacturer: str = ""
+    model: str = ""
+    os_version: str = ""
+    os_fullname: str = ""
+    api_level: str = ""
+    cpu_abi: str = ""
+    storage_total_kb: Optional[int] = None
+    storage_used_kb: Optional[int] = None
+    storage_free_kb: Optional[int] = None
+    battery_level: Optional[int] = None
+    battery_status: str = ""
+    battery_temperature: Optional[float] = None
+    duration: float = 0.0
+    error: str = ""
+
+class DeviceInfoCollector:
+    """一次 shell 调用采集设备信息
+
+    把 UDID、若干 param、df 和电池信息的查询拼成一条以分隔行隔开的脚本，通过常驻shell
+    会话（或一个hdc进程）执行，再按分隔行拆开解析；多台设备并行采集。
+    """
+    
+    MARKER = "@@HDT@@"
+    PARAMS = (
+        ("manufacturer", "const.product.manufacturer"),
+        ("model", "const.product.model"),
+        ("os_version", "const.product.software.version"),
+        ("os_fullname", "const.ohos.fullname"),
+        ("api_level", "const.ohos.apiversion"),
+        ("cpu_abi", "const.product.cpu.abilist"),
+    )
+    BATTERY_STATUS = {"0": "未知", "1": "充电中", "2": "未充电", "3": "已充满"}
+    FIELDS = list(DeviceInfo.__dataclass_fields__)
+    
+    def __init__(self, hdc_util, max_workers=8):
+        self.hdc_util = hdc_util
+        self.max_workers = max_workers
+    
+    @classmethod
+    def script(cls):
+        """采集脚本，每段输出前有一行 `@@HDT@@ <段名>`（不含引号，单进程回退时按空白拆分也不受影响）"""
+        sections = [("udid", "bm get --udid")]
+        sections += [(name, f"param get {key}") for name, key in cls.PARAMS]
+        sections += [("df", "df -k /data"), ("battery", "hidumper -s BatteryService -a -i")]
+        return "; ".join(f"echo {cls.MARKER} {name}; {command} 2>&1" for name, command in sections)
+    
+    @classmethod
+    def split_sections(cls, output):
+        """按分隔行拆分输出，返回 {段名: 行列表}"""
+        sections = {}
+        lines = None
+        for line in output.splitlines():
+            line = line.rstrip("\r")
+            if line.startswith(cls.MARKER):
+                lines = sections.setdefault(line[len(cls.MARKER):].strip(), [])
+            elif lines is not None and line.strip():
+                lines.append(line.strip())
+        return sections
+    
+    @classmethod
+    def parse(cls, connect_key, output) -> DeviceInfo:
+        """解析采集脚本的输出"""
+        info = DeviceInfo(connect_key)
+        sections = cls.split_sections(output)
+        if not sections:
+            info.error = output.strip()[:200] or "没有输出"
+            return info
+        
+        for line in sections.get("udid", []):
+            if re.fullmatch(r"[0-9A-Fa-f]{32,}", line):
+                info.udid = line
+        for name, _ in cls.PARAMS:
+            lines = sections.get(name, [])
+            # 不存在的参数输出 "Get parameter ... fail! errNum is:..."
+            if lines and "fail" not in lines[0].lower():
+                setattr(info, name, lines[0])
+        
+        for line in sections.get("df", [])[1:]:
+            parts = line.split()
+            if len(parts) >= 4 and parts[1].isdigit() and parts[2].isdigit() and parts[3].isdigit():
+                info.storage_total_kb, info.storage_used_kb, info.storage_free_kb = map(int, parts[1:4])
+                break
+        
+        battery = {}
+        for line in sections.get("battery", []):
+            key, sep, value = line.partition(":")
+            if sep:
+                battery[key.strip()] = value.strip()
+        if battery.get("capacity", "").isdigit():
+            info.battery_level = int(battery["capacity"])
+        info.battery_status = cls.BATTERY_STATUS.get(battery.get("chargingStatus", ""), "")
+        if re.fullmatch(r"-?\d+", battery.get("temperature", "")):
+            info.battery_temperature = int(battery["temperature"]) / 10
+        return info
+    
+    def collect(self, target="") -> DeviceInfo:
+        """采集一台设备的信息"""
+        start = time.perf_counter()
+        try:
+            info = self.parse(target, self.hdc_util.run_shell(self.script(), target))
+        except Exception as e:
+            logger.error(f"设备 {target} 信息采集失败: {e}")
+            info = DeviceInfo(target, error=str(e))
+        info.duration = time.perf_counter() - start
+        return info
+    
+    def collect_all(self, targets=None, on_result=None) -> List[DeviceInfo]:
+        """并行采集 targets（默认所有已连接设备），on_result(DeviceInfo) 在工作线程中回调"""
+        if targets is None:
+            targets = [t.connect_key for t in self.hdc_util.list_targets() if t.connected]
+        if not targets:
+            return []
+        
+        def collect_one(target):
+            info = self.collect(target)
+            if on_result:
+                on_result(info)
+            return info
+        
+        workers = max(1, min(self.max_workers, len(targets)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="device-info") as pool:
+            return list(pool.map(collect_one, targets))
+    
+    @classmethod
+    def export(cls, infos, path):
+        """按扩展名导出：.csv 为CSV，其余为JSON"""
+        if path.lower().endswith(".csv"):
+            # utf-8-sig 便于Excel直接打开
+            with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=cls.FIELDS)
+                writer.writeheader()
+                for info in infos:
+                    writer.writerow({k: "" if v is None else v for k, v in asdict(info).items()})
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump([asdict(info) for info in infos], f, indent=2, ensure_ascii=False)
+
+@dataclass
+class MacroStep:
+    """宏中的一步"""
+    id: str
+    command: str
+    depends_on: List[str]
+    target: Optional[str] = None
+    timeout: Optional[float] = None
+    # 输出（去掉首尾空白）保存到的变量名
+    capture: str = ""
+
+@dataclass
+class StepResult:
+    """宏中一步的执行结果"""
+    id: str
+    status: str = "pending"
+    command: str = ""
+    target: str = ""
+    output: str = ""
+    exit_code: Optional[int] = None
+    start: float = 0.0
+    duration: float = 0.0
+    message: str = ""
+
+@dataclass
+class MacroResult:
+    """一次宏执行的结果，steps 按宏中定义的顺序排列"""
+    name: str
+    ok: bool
+    duration: float
+    steps: List[StepResult]
+    variables: Dict[str, str]
+
+class Macro:
+    """命令宏：JSON（安装了 PyYAML 时也可以是 YAML）文件中定义的一组步骤
+
+    {
+      "name": "deploy",
+      "target": "",                      # 默认设备，可省略
+      "timeout": 300,                    # 默认超时（秒），可省略
+      "variables": {"bundle": "com.example.demo"},
+      "steps": [
+        {"id": "install", "command": "install -r entry.hap", "timeout": 120},
+        {"id": "start", "command": "shell aa start -b ${bundle} -a EntryAbility", "depends_on": ["install"]},
+        {"id": "pid", "command": "shell pidof ${bundle}", "depends_on": ["start"], "capture": "pid"}
+      ]
+    }
+
+    命令中的 ${name} 替换为变量值，${target} 为该步的目标设备。
+    """
+    
+    VARIABLE_PATTERN = re.compile(r"\$\{(\w+)\}")
+    
+    def __init__(self, name, steps: List[MacroStep], variables=None, target="", timeout=None):
+        self.name = name
+        self.steps = steps
+        self.variables = dict(variables or {})
+        self.target = target
+        self.timeout = timeout
+        self.validate()
+    
+    @classmethod
+    def load(cls, path) -> "Macro":
+        """读取宏文件，.yaml/.yml 需要安装 PyYAML"""
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("读取YAML宏需要安装PyYAML（pip install pyyaml），或改用JSON格式")
+            data = yaml.safe_load(text)
+        else:
+            data = json.loads(text)
+        return cls.from_dict(data, os.path.splitext(os.path.basename(path))[0])
+    
+    @classmethod
+    def from_dict(cls, data, default_name="macro") -> "Macro":
+        if not isinstance(data, dict) or not isinstance(data.get("steps"), list):
+            raise ValueError("宏文件必须包含 steps 列表")
+        steps = []
+        for index, item in enumerate(data["steps"]):
+            if not isinstance(item, dict) or not item.get("command"):
+                raise ValueError(f"第 {index + 1} 步缺少 command")
+            depends_on = item.get("depends_on", [])
+            if isinstance(depends_on, str):
+                depends_on = [depends_on]
+            steps.append(MacroStep(
+                id=str(item.get("id", f"step{index + 1}")),
+                command=str(item["command"]),
+                depends_on=[str(d) for d in depends_on],
+                target=item.get("target"),
+                timeout=item.get("timeout"),
+                capture=item.get("capture", ""),
+            ))
+        variables = {k: str(v) for k, v in (data.get("variables") or {}).items()}
+        return cls(data.get("name", default_name), steps, variables, data.get("target", ""), data.get("timeout"))
+    
+    def validate(self):
+        """检查步骤id唯一、依赖存在且没有循环依赖"""
+        ids = [step.id for step in self.steps]
+        duplicates = {i for i in ids if ids.count(i) > 1}
+        if duplicates:
+            raise ValueError(f"步骤id重复: {', '.join(sorted(duplicates))}")
+        for step in self.steps:
+            unknown = [d for d in step.depends_on if d not in ids]
+            if unknown:
+                raise ValueError(f"步骤 {step.id} 依赖不存在的步骤: {', '.join(unknown)}")
+        # Kahn 拓扑排序，排不完说明有环
+        pending = {step.id: set(step.depends_on) for step in self.steps}
+        while pending:
+            ready = [i for i, deps in pending.items() if not deps]
+            if not ready:
+                raise ValueError(f"存在循环依赖: {', '.join(sorted(pending))}")
+            for i in ready:
+                del pending[i]
+            for deps in pending.values():
+                deps.difference_update(ready)
+    
+    def dependents(self):
+        """步骤id -> 直接依赖它的步骤id列表"""
+        result = {step.id: [] for step in self.steps}
+        for step in self.steps:
+            for dependency in step.depends_on:
+                result[dependency].append(step.id)
+        return result
+    
+    @classmethod
+    def substitute(cls, text, variables):
+        """替换 ${name}，未定义的变量抛出 KeyError"""
+        return cls.VARIABLE_PATTERN.sub(lambda m: variables[m.group(1)], text)
+
+class MacroRunner:
+    """按依赖关系执行宏
+
+    依赖都已成功的步骤立即提交给 AsyncHdcEngine（与命令框相同的执行路径，支持超时和
+    指定设备），互不依赖的步骤并行执行；某步失败或超时后，直接或间接依赖它的步骤全部跳过。
+    """
+    
+    def __init__(self, engine: AsyncHdcEngine, default_target=""):
+        self.engine = engine
+        self.default_target = default_target
+    
+    def run(self, macro: Macro, variables=None, on_step=None) -> MacroResult:
+        """执行宏并返回结果，on_step(StepResult) 在每步开始和结束时回调（调用线程中）"""
+        start = time.perf_counter()
+        variables = {**macro.variables, **(variables or {})}
+        steps = {step.id: step for step in macro.steps}
+        results = {step.id: StepResult(step.id) for step in macro.steps}
+        dependents = macro.dependents()
+        running = {}
+        
+        def notify(result):
+            if on_step:
+                on_step(result)
+        
+        def skip_dependents(step_id):
+            queue_ids = list(dependents[step_id])
+            while queue_ids:
+                dependent = results[queue_ids.pop()]
+                if dependent.status == "pending":
+                    dependent.status = "skipped"
+                    dependent.message = f"依赖的步骤 {step_id} 未成功"
+                    notify(dependent)
+                    queue_ids.extend(dependents[dependent.id])
+        
+        def fail(result, message):
+            result.status = "failed"
+            result.message = message
+            notify(result)
+            skip_dependents(result.id)
+        
+        def launch_ready():
+            for step in macro.steps:
+                result = results[step.id]
+                if result.status != "pending" or any(results[d].status != "ok" for d in step.depends_on):
+                    continue
+                target = step.target if step.target is not None else (macro.target or self.default_target)
+                result.target = target
+                try:
+                    result.command = Macro.substitute(step.command, {**variables, "target": target})
+                except KeyError as e:
+                    fail(result, f"未定义的变量: {e.args[0]}")
+                    continue
+                timeout = step.timeout if step.timeout is not None else macro.timeout
+                result.status = "running"
+                result.start = time.perf_counter() - start
+                notify(result)
+                running[self.engine.run_command(result.command, timeout or None, target=target)] = result
+        
+        launch_ready()
+        while running:
+            done, _ = concurrent.futures.wait(list(running), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                result = running.pop(future)
+                result.duration = time.perf_counter() - start - result.start
+                try:
+                    command_result = future.result()
+                except Exception as e:
+                    fail(result, f"执行失败: {e!r}")
+                    continue
+                result.output = command_result.output
+                result.exit_code = command_result.exit_code
+                if command_result.timed_out:
+                    result.status = "timeout"
+                    result.message = "超时"
+                    notify(result)
+                    skip_dependents(result.id)
+                elif not command_result.ok:
+                    fail(result, command_result.output.strip().splitlines()[-1] if command_result.output.strip()
+                         else f"退出码 {command_result.exit_code}")
+                else:
+                    result.status = "ok"
+                    if steps[result.id].capture:
+                        variables[steps[result.id].capture] = command_result.output.strip()
+                    notify(result)
+            launch_ready()
+        
+        ordered = [results[step.id] for step in macro.steps]
+        return MacroResult(macro.name, all(r.status == "ok" for r in ordered),
+                           time.perf_counter() - start, ordered, variables)
+
+@dataclass
+class HapInfo:
+    """hap 文件的内容哈希和包信息"""
+    path: str
+    sha256: str
+    bundle_name: str = ""
+    version_code: Optional[int] = None
+
+class InstallCache:
+    """安装缓存：跳过重复安装相同的hap
+
+    hap 的 SHA-256 按 (路径, 大小, 修改时间) 缓存，文件未变化时不重新计算；每台设备
+    记录每个包最后一次安装的哈希，以及安装后 `bm dump -n` 返回的 versionCode 和
+    updateTime。再次安装时哈希一致且设备上的包信息与记录相同（未被卸载或由其他途径
+    重新安装）才跳过传输和安装。
+    """
+    
+    HASH_CHUNK = 1024 * 1024
+    
+    def __init__(self, cache_file="install_cache.json"):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self.hashes = {}
+        self.devices = {}
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.hashes = data.get("hashes", {})
+            self.devices = data.get("devices", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取安装缓存失败: {e}")
+    
+    def save(self):
+        """原子写入缓存文件"""
+        with self._lock:
+            data = json.dumps({"hashes": self.hashes, "devices": self.devices}, indent=2, ensure_ascii=False)
+            tmp_file = self.cache_file + ".tmp"
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_file, self.cache_file)
+            except Exception as e:
+                logger.error(f"保存安装缓存失败: {e}")
+    
+    @staticmethod
+    def read_bundle(path):
+        """从hap中的 module.json（Stage模型）或 config.json（FA模型）读取包名和versionCode"""
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = set(archive.namelist())
+                for name in ("module.json", "config.json"):
+                    if name in names:
+                        app = json.loads(archive.read(name).decode("utf-8")).get("app", {})
+                        code = app.get("versionCode", app.get("version", {}).get("code"))
+                        return app.get("bundleName", ""), int(code) if code is not None else None
+        except Exception as e:
+            logger.warning(f"读取hap包信息失败: {path} {e}")
+        return "", None
+    
+    def hap_info(self, path) -> HapInfo:
+        """hap 的哈希和包信息，文件大小和修改时间未变时直接使用缓存"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self.hashes.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return HapInfo(path, entry["sha256"], entry["bundle_name"], entry["version_code"])
+        
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK), b""):
+                digest.update(chunk)
+        bundle_name, version_code = self.read_bundle(path)
+        info = HapInfo(path, digest.hexdigest(), bundle_name, version_code)
+        with self._lock:
+            self.hashes[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": info.sha256,
+                                 "bundle_name": bundle_name, "version_code": version_code}
+        self.save()
+        return info
+    
+    @staticmethod
+    def parse_bundle_dump(output):
+        """从 `bm dump -n` 的输出中取 (versionCode, updateTime)，未安装时返回None"""
+        code = re.search(r'"versionCode"\s*:\s*(\d+)', output)
+        if code is None:
+            return None
+        update = re.search(r'"updateTime"\s*:\s*(\d+)', output)
+        return int(code.group(1)), int(update.group(1)) if update else None
+    
+    def device_state(self, hdc_util, bundle_name, target=""):
+        return self.parse_bundle_dump(hdc_util.run_shell(f"bm dump -n {shlex.quote(bundle_name)}", target))
+    
+    def is_installed(self, hdc_util, info: HapInfo, target=""):
+        """设备上是否已安装同一个hap"""
+        if not info.bundle_name:
+            return False
+        with self._lock:
+            record = self.devices.get(target, {}).get(info.bundle_name)
+        if not record or record["sha256"] != info.sha256:
+            return False
+        state = self.device_state(hdc_util, info.bundle_name, target)
+        return state is not None and [state[0], state[1]] == [record["version_code"], record["update_time"]]
+    
+    def remember(self, hdc_util, info: HapInfo, target=""):
+        """安装成功后记录设备上的包信息"""
+        if not info.bundle_name:
+            return
+        state = self.device_state(hdc_util, info.bundle_name, target)
+        if state is None:
+            return
+        with self._lock:
+            self.devices.setdefault(target, {})[info.bundle_name] = {
+                "sha256": info.sha256,
+                "version_code": state[0],
+                "update_time": state[1],
+                "path": info.path,
+                "installed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            }
+        self.save()
+    
+    def check(self, hdc_util, hap_path, target="", force=False):
+        """安装前检查，返回 (HapInfo, CommandResult)
+
+        需要安装时 CommandResult 为None；设备上已是同一个hap时为跳过说明；读取hap失败时
+        HapInfo 为None，CommandResult 为失败结果。
+        """
+        start = time.perf_counter()
+        try:
+            info = self.hap_info(hap_path)
+        except OSError as e:
+            return None, CommandResult(f"install {hap_path}", f"[Fail]{e}", -1, time.perf_counter() - start, target)
+        if not force and self.is_installed(hdc_util, info, target):
+            output = f"{info.bundle_name} 已安装相同的hap（sha256 {info.sha256[:12]}），跳过安装"
+            return info, CommandResult(f"install {hap_path}", output, 0, time.perf_counter() - start, target)
+        return info, None
+    
+    def install(self, hdc_util, hap_path, target="", options=(), force=False):
+        """安装hap，设备上已是同一个hap时跳过，返回 (CommandResult, 是否跳过)"""
+        info, result = self.check(hdc_util, hap_path, target, force)
+        if result is not None:
+            return result, info is not None
+        result = hdc_util.install(hap_path, target, options)
+        if BatchInstaller.install_succeeded(result):
+            self.remember(hdc_util, info, target)
+        return result, False
+
+@dataclass
+class InstallProgress:
+    """单个设备的批量安装进度"""
+    target: str
+    total: int
+    status: str = "等待中"
+    done: int = 0
+    failed: int = 0
+    skipped: int = 0
+    current_file: str = ""
+    attempt: int = 0
+    bytes_done: int = 0
+    busy_time: float = 0.0
+    message: str = ""
+    
+    @property
+    def throughput(self):
+        """已完成安装的平均速率，单位MB/s"""
+        return self.bytes_done / self.busy_time / (1024 * 1024) if self.busy_time > 0 else 0.0
+
+class BatchInstaller:
+    """多设备批量安装调度器
+
+    每个设备按顺序安装全部hap，设备之间并行；同一Hub上的设备共享一个并发上限，
+    避免并行传输占满同一个USB Hub的带宽。遇到连接类的临时错误会自动重试。
+    指定 install_cache 时跳过设备上已安装的相同hap（force 为True时不跳过）。
+    """
+    
+    # 视为临时错误、可以重试的输出关键字（小写）
+    # 只匹配hdc连接层面的错误：hdc客户端连不上服务（Connect server failed）、设备掉线或
+    # 尚未重新枚举（device offline、Device not founded or connected）、传输超时（timeout、
+    # 命令执行超时）。bm 返回的安装失败（签名、版本、空间不足等）不重试。
+    TRANSIENT_ERRORS = (
+        "connect server failed", "device offline", "device not founded or connected",
+        "timeout", "time out", "命令执行超时",
+    )
+    
+    def __init__(self, hdc_util, max_workers=4, per_hub_limit=2, retries=2,
+                 retry_delay=2.0, hub_groups=None, install_cache=None, force=False):
+        self.hdc_util = hdc_util
+        self.install_cache = install_cache
+        self.force = force
+        self.max_workers = max_workers
+        self.per_hub_limit = per_hub_limit
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # connect key -> Hub名称，未配置时所有USB设备视为同一Hub
+        self.hub_groups = hub_groups or {}
+        self._hub_semaphores = {}
+        self._lock = threading.Lock()
+    
+    def hub_of(self, target: DeviceTarget):
+        """设备所在的Hub分组"""
+        if target.connect_key in self.hub_groups:
+            return self.hub_groups[target.connect_key]
+        if target.transport.upper() == "USB":
+            return "usb"
+        # 网络设备不共享USB带宽，各自独立
+        return f"net:{target.connect_key}"
+    
+    def _hub_semaphore(self, hub):
+        with self._lock:
+            if hub not in self._hub_semaphores:
+                self._hub_semaphores[hub] = threading.Semaphore(max(1, self.per_hub_limit))
+            return self._hub_semaphores[hub]
+    
+    @staticmethod
+    def install_succeeded(result: CommandResult):
+        """根据输出判断安装是否成功"""
+        output = result.output.lower()
+        if "successfully" in output:
+            return True
+        return result.ok and "error" not in output and "fail" not in output
+    
+    def is_transient(self, result: CommandResult):
+        """失败是否属于可重试的临时错误"""
+        output = result.output.lower()
+        return any(keyword in output for keyword in self.TRANSIENT_ERRORS)
+    
+    def run(self, hap_files, targets: List[DeviceTarget], options=(), on_progress=None):
+        """在 targets 上安装 hap_files，返回 {connect key: InstallProgress}
+
+        on_progress(InstallProgress) 在工作线程中回调。
+        """
+        progress = {t.connect_key: InstallProgress(t.connect_key, len(hap_files)) for t in targets}
+        sizes = {path: os.path.getsize(path) if os.path.exists(path) else 0 for path in hap_files}
+        # 哈希在开始前统一计算（有缓存时不读取文件），避免各设备线程重复计算
+        infos = {}
+        if self.install_cache is not None:
+            for path in hap_files:
+                try:
+                    infos[path] = self.install_cache.hap_info(path)
+                except OSError as e:
+                    logger.warning(f"计算hap哈希失败: {path} {e}")
+        
+        def notify(state):
+            if on_progress:
+                on_progress(state)
+        
+        def install_device(target):
+            state = progress[target.connect_key]
+            semaphore = self._hub_semaphore(self.hub_of(target))
+            for path in hap_files:
+                state.current_file = os.path.basename(path)
+                info = infos.get(path)
+                if info is not None and not self.force and \
+                        self.install_cache.is_installed(self.hdc_util, info, target.connect_key):
+                    state.done += 1
+                    state.skipped += 1
+                    state.message = f"{state.current_file} 与已安装的相同，已跳过"
+                    notify(state)
+                    continue
+                for attempt in range(1, self.retries + 2):
+                    state.attempt = attempt
+                    state.status = "排队中"
+                    notify(state)
+                    with semaphore:
+                        state.status = "安装中" if attempt == 1 else f"重试({attempt - 1})"
+                        notify(state)
+                        result = self.hdc_util.install(path, target.connect_key, options)
+                    if self.install_succeeded(result):
+                        if info is not None:
+                            self.install_cache.remember(self.hdc_util, info, target.connect_key)
+                        state.done += 1
+                        state.bytes_done += sizes[path]
+                        state.busy_time += result.duration
+                        state.message = ""
+                        break
+                    state.message = result.output.strip().splitlines()[-1] if result.output.strip() else "安装失败"
+                    if attempt > self.retries or not self.is_transient(result):
+                        state.failed += 1
+                        logger.error(f"设备 {target.connect_key} 安装 {path} 失败: {result.output.strip()}")
+                        break
+                    time.sleep(self.retry_delay)
+            state.current_file = ""
+            state.status = "成功" if state.failed == 0 else f"失败 {state.failed} 个"
+            if state.skipped:
+                state.status += f"（跳过 {state.skipped} 个）"
+            notify(state)
+        
+        if targets and hap_files:
+            workers = max(1, min(self.max_workers, len(targets)))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="install") as pool:
+                for future in [pool.submit(install_device, t) for t in targets]:
+                    future.result()
+        return progress
+
+class TransferError(Exception):
+    """无法列举要传输的文件（设备离线、路径不存在等）"""
+
+@dataclass
+class TransferJob:
+    """单个文件的传输任务"""
+    source: str
+    destination: str
+    rel_path: str
+    size: int
+
+@dataclass
+class TransferProgress:
+    """目录传输的实时进度"""
+    total_files: int
+    total_bytes: int
+    done_files: int = 0
+    done_bytes: int = 0
+    failed: int = 0
+    current: str = ""
+    start: float = 0.0
+    
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+    
+    @property
+    def rate(self):
+        """平均速率，字节/秒"""
+        elapsed = self.elapsed
+        return self.done_bytes / elapsed if elapsed > 0 else 0.0
+    
+    @property
+    def eta(self):
+        """按平均速率估算的剩余秒数，尚无数据时为None"""
+        rate = self.rate
+        if rate <= 0:
+            return None
+        return (self.total_bytes - self.done_bytes) / rate
+    
+    def describe(self):
+        mb = 1024 * 1024
+        text = (f"{self.done_files}/{self.total_files} 个文件，"
+                f"{self.done_bytes / mb:.1f}/{self.total_bytes / mb:.1f} MB，{self.rate / mb:.2f} MB/s")
+        eta = self.eta
+        if eta is not None and self.done_files < self.total_files:
+            text += f"，剩余约 {eta:.0f} 秒"
+        if self.failed:
+            text += f"，失败 {self.failed} 个"
+        return text
+
+@dataclass
+class TransferResult:
+    """一次目录传输的结果"""
+    direction: str
+    source: str
+    destination: str
+    files: int = 0
+    bytes: int = 0
+    duration: float = 0.0
+    failures: Optional[List[tuple]] = None
+    cancelled: bool = False
+    
+    @property
+    def ok(self):
+        return not self.failures and not self.cancelled
+    
+    @property
+    def rate(self):
+        return self.bytes / self.duration if self.duration > 0 else 0.0
+    
+    def summary(self):
+        text = (f"{'导出' if self.direction == 'recv' else '推送'} {self.source} -> {self.destination}: "
+                f"{self.files} 个文件，{self.bytes / (1024 * 1024):.1f} MB，耗时 {self.duration:.1f} 秒，"
+                f"{self.rate / (1024 * 1024):.2f} MB/s")
+        if self.cancelled:
+            text += "，已取消"
+        if self.failures:
+            text += f"，失败 {len(self.failures)} 个: " + ", ".join(rel for rel, _ in self.failures[:5])
+        return text
+
+class TransferEngine:
+    """目录并行传输
+
+    单条 `file recv/send <目录>` 在一个通道上逐个传输文件，也没有进度。这里先列出
+    远端（一次 find + stat）或本地的文件树，按文件拆成任务，从大到小分给多个并发的
+    hdc 传输进程，完成后按大小校验，失败的文件再重试。hdc 不支持按偏移传输，
+    因此单个文件不再切分。
+
+    指定 async_engine 时每个文件的传输进程经由 AsyncHdcEngine 执行，受 timeout（单个文件，秒）
+    限制；引擎取消任务（界面上的"停止"）或调用 cancel() 会结束正在传输的进程，剩余文件不再传输。
+    """
+    
+    # 进度回调的最短间隔（秒）
+    PROGRESS_INTERVAL = 0.5
+    # 每条 mkdir -p 携带的目录数，避免命令行过长
+    MKDIR_BATCH = 64
+    
+    def __init__(self, hdc_util, max_workers=4, retries=1, async_engine=None, timeout=None):
+        self.hdc_util = hdc_util
+        self.max_workers = max(1, max_workers)
+        self.retries = max(0, retries)
+        self.async_engine = async_engine
+        self.timeout = timeout
+        self._cancel = threading.Event()
+        self._futures = set()
+        self._lock = threading.Lock()
+    
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+    
+    def cancel(self):
+        """取消当前传输：结束正在传输的进程，剩余文件不再传输"""
+        self._cancel.set()
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+    
+    def transfer_file(self, direction, source, destination, target=""):
+        """传输单个文件，返回 CommandResult；已取消时抛出 CancelledError"""
+        if self.cancelled:
+            raise concurrent.futures.CancelledError()
+        if self.async_engine is None:
+            if direction == "recv":
+                return self.hdc_util.recv_file(source, destination, target)
+            return self.hdc_util.send_file(source, destination, target)
+        future = self.async_engine.run_command(["file", direction, source, destination], self.timeout,
+                                               target=target)
+        with self._lock:
+            self._futures.add(future)
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            # 引擎的任务被取消（"停止"按钮），整个传输随之取消
+            self.cancel()
+            raise
+        finally:
+            with self._lock:
+                self._futures.discard(future)
+    
+    def remote_entries(self, remote_path, target=""):
+        """列出远端文件（remote_path 可以是目录或单个文件），返回 [(路径, 大小, 修改时间)]
+
+        命令失败时抛出 TransferError，不把失败当作空目录。
+        """
+        output, exit_code = self.hdc_util._run_shell(
+            f"find {shlex.quote(remote_path)} -type f -exec stat -c '%s %Y %n' {{}} +", target)
+        if exit_code != 0 or output.lstrip().startswith("[Fail]"):
+            raise TransferError(f"列举 {remote_path} 失败: {output.strip() or f'退出码 {exit_code}'}")
+        entries = []
+        for line in output.splitlines():
+            parts = line.split(" ", 2)
+            if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+                entries.append((parts[2], int(parts[0]), int(parts[1])))
+        return entries
+    
+    @staticmethod
+    def relative(path, base):
+        """path 相对于 base 的路径；base 本身是文件时为文件名"""
+        if path == base:
+            return path.rsplit("/", 1)[-1]
+        prefix = base + "/"
+        return path[len(prefix):] if path.startswith(prefix) else None
+    
+    def list_remote(self, remote_path, target=""):
+        """列出远端文件，返回 {相对路径: [大小, 修改时间]}"""
+        remote_path = remote_path.rstrip("/")
+        files = {}
+        for path, size, mtime in self.remote_entries(remote_path, target):
+            rel_path = self.relative(path, remote_path)
+            if rel_path:
+                files[rel_path] = [size, mtime]
+        return files
+    
+    @staticmethod
+    def list_local(local_path):
+        """列出本地文件，返回 {相对路径（/分隔）: 大小}"""
+        if os.path.isfile(local_path):
+            return {os.path.basename(local_path): os.path.getsize(local_path)}
+        files = {}
+        for root, _, names in os.walk(local_path):
+            rel_dir = os.path.relpath(root, local_path).replace(os.sep, "/")
+            for name in names:
+                rel_path = name if rel_dir == "." else f"{rel_dir}/{name}"
+                try:
+                    files[rel_path] = os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+        return files
+    
+    @staticmethod
+    def local_path(local_dir, rel_path):
+        return os.path.join(local_dir, *rel_path.split("/"))
+    
+    def recv(self, remote_path, local_dir, target="", files=None, on_progress=None, on_file=None):
+        """把 remote_path（目录或文件）下的文件并行拉取到 local_dir
+
+        未指定 files 时先列举远端，失败时抛出 TransferError。files 为 {相对路径: 大小或[大小, 修改时间]} 时只拉取这些文件，不再列举远端。
+        on_progress(TransferProgress) 按间隔回调；on_file(TransferJob, 是否成功) 每个文件完成后回调，
+        均在工作线程中执行。
+        """
+        start = time.perf_counter()
+        remote_path = remote_path.rstrip("/")
+        jobs = []
+        if files is None:
+            for path, size, _ in self.remote_entries(remote_path, target):
+                rel_path = self.relative(path, remote_path)
+                if rel_path:
+                    jobs.append(TransferJob(path, self.local_path(local_dir, rel_path), rel_path, size))
+        else:
+            for rel_path, entry in files.items():
+                size = entry[0] if isinstance(entry, (list, tuple)) else entry
+                jobs.append(TransferJob(f"{remote_path}/{rel_path}", self.local_path(local_dir, rel_path),
+                                        rel_path, size))
+        def prepare(pending):
+            for directory in {os.path.dirname(job.destination) for job in pending}:
+                ProcessUtil.ensure_dir(directory)
+        
+        def transfer(job):
+            result = self.transfer_file("recv", job.source, job.destination, target)
+            ok = os.path.exists(job.destination) and os.path.getsize(job.destination) == job.size
+            return ok, result.output.strip()
+        
+        result = TransferResult("recv", remote_path, local_dir)
+        self._run(jobs, prepare, transfer, None, result, on_progress, on_file)
+        result.duration = time.perf_counter() - start
+        return result
+    
+    def send(self, local_path, remote_dir, target="", on_progress=None, on_file=None):
+        """把本地目录（或文件）下的文件并行推送到设备的 remote_dir，完成后按远端大小校验"""
+        start = time.perf_counter()
+        remote_dir = remote_dir.rstrip("/")
+        single = os.path.isfile(local_path)
+        jobs = []
+        for rel_path, size in self.list_local(local_path).items():
+            source = local_path if single else self.local_path(local_path, rel_path)
+            jobs.append(TransferJob(source, f"{remote_dir}/{rel_path}", rel_path, size))
+        
+        def prepare(pending):
+            directories = sorted({job.destination.rsplit("/", 1)[0] for job in pending})
+            for i in range(0, len(directories), self.MKDIR_BATCH):
+                batch = " ".join(shlex.quote(d) for d in directories[i:i + self.MKDIR_BATCH])
+                self.hdc_util.run_shell(f"mkdir -p {batch}", target)
+        
+        def transfer(job):
+            result = self.transfer_file("send", job.source, job.destination, target)
+            return result.ok, result.output.strip()
+        
+        def verify(pending):
+            # 一次列举远端目录，对比所有已推送文件的大小
+            remote = self.list_remote(remote_dir, target)
+            return [job for job in pending if remote.get(job.rel_path, [None])[0] != job.size]
+        
+        result = TransferResult("send", local_path, remote_dir)
+        self._run(jobs, prepare, transfer, verify, result, on_progress, on_file)
+        result.duration = time.perf_counter() - start
+        return result
+    
+    def _run(self, jobs, prepare, transfer, verify, result, on_progress, on_file):
+        """并行执行任务
+
+        每轮开始前 prepare(待传任务) 创建目标目录；transfer(job) 返回 (是否成功, 输出)；
+        verify(本轮成功的任务) 返回校验不通过的任务，为None时以 transfer 的结果为准。
+        """
+        self._cancel.clear()
+        jobs.sort(key=lambda job: job.size, reverse=True)
+        progress = TransferProgress(len(jobs), sum(job.size for job in jobs), start=time.perf_counter())
+        lock = threading.Lock()
+        errors = {}
+        last_report = [0.0]
+        
+        def report(force=False):
+            now = time.perf_counter()
+            if on_progress and (force or now - last_report[0] >= self.PROGRESS_INTERVAL):
+                last_report[0] = now
+                on_progress(progress)
+        
+        def run_job(job):
+            try:
+                ok, output = transfer(job)
+            except concurrent.futures.CancelledError:
+                ok, output = False, "已取消"
+            except Exception as e:
+                ok, output = False, str(e)
+            with lock:
+                if ok:
+                    progress.done_files += 1
+                    progress.done_bytes += job.size
+                else:
+                    errors[job.rel_path] = output
+                progress.current = job.rel_path
+            if on_file and (ok or verify is None):
+                on_file(job, ok)
+            report()
+            return ok
+        
+        pending = jobs
+        for attempt in range(self.retries + 1):
+            if not pending or self.cancelled:
+                break
+            if attempt:
+                logger.info(f"重试 {len(pending)} 个传输失败的文件")
+                with lock:
+                    for job in pending:
+                        errors.pop(job.rel_path, None)
+            try:
+                prepare(pending)
+            except Exception as e:
+                logger.warning(f"创建目标目录失败: {e}")
+            workers = min(self.max_workers, len(pending))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transfer") as pool:
+                succeeded = list(pool.map(run_job, pending))
+            failed = [job for job, ok in zip(pending, succeeded) if not ok]
+            if verify is not None and not self.cancelled:
+                mismatched = verify([job for job, ok in zip(pending, succeeded) if ok])
+                with lock:
+                    for job in mismatched:
+                        progress.done_files -= 1
+                        progress.done_bytes -= job.size
+                        errors[job.rel_path] = "大小校验失败"
+                failed += mismatched
+            pending = failed
+        
+        progress.failed = len(pending)
+        if on_file and verify is not None:
+            failed_paths = {job.rel_path for job in pending}
+            for job in jobs:
+                on_file(job, job.rel_path not in failed_paths)
+        report(force=True)
+        result.files = progress.done_files
+        result.bytes = progress.done_bytes
+        result.cancelled = self.cancelled
+        result.failures = [(job.rel_path, errors.get(job.rel_path, "")) for job in pending]
+        if result.cancelled:
+            logger.info(f"传输已取消，{len(pending)} 个文件未完成")
+            return
+        for rel_path, error in result.failures:
+            logger.error(f"传输失败: {rel_path} {error}")
+
+@dataclass
+class SyncResult:
+    """一次增量导出的统计结果"""
+    local_dir: str
+    total: int = 0
+    pulled: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes_pulled: int = 0
+    duration: float = 0.0
+    cancelled: bool = False
+
+class IncrementalExporter:
+    """增量导出：只拉取新增或变化的文件
+
+    通过一次 shell 调用列出远端文件（路径、大小、修改时间），与上次导出时保存在
+    本地目录中的清单比对，只对新增或变化的文件并行执行 `file recv`，最后原子地写回清单。
+    """
+    
+    MANIFEST_NAME = ".hdc_manifest.json"
+    
+    def __init__(self, hdc_util, max_workers=4, async_engine=None, timeout=None):
+        self.hdc_util = hdc_util
+        self.max_workers = max_workers
+        self.engine = TransferEngine(hdc_util, max_workers, async_engine=async_engine, timeout=timeout)
+    
+    def remote_manifest(self, remote_dir, target=""):
+        """列出远端目录下的所有文件，返回 {相对路径: [大小, 修改时间]}"""
+        return self.engine.list_remote(remote_dir, target)
+    
+    @classmethod
+    def load_manifest(cls, local_dir):
+        """读取本地清单"""
+        path = os.path.join(local_dir, cls.MANIFEST_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("files", {})
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"读取导出清单失败，将全量导出: {e}")
+            return {}
+    
+    @classmethod
+    def save_manifest(cls, local_dir, remote_dir, files):
+        """先写临时文件再替换，避免中途退出留下损坏的清单"""
+        path = os.path.join(local_dir, cls.MANIFEST_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"remote_dir": remote_dir, "files": files}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    @staticmethod
+    def local_path(local_dir, rel_path):
+        return os.path.join(local_dir, *rel_path.split("/"))
+    
+    def changed_files(self, remote, manifest, local_dir):
+        """与本地清单比对，返回需要拉取的相对路径（清单一致但本地文件丢失的也会重新拉取）"""
+        changed = []
+        for rel_path, entry in remote.items():
+            local_path = self.local_path(local_dir, rel_path)
+            if (manifest.get(rel_path) != entry or not os.path.exists(local_path)
+                    or os.path.getsize(local_path) != entry[0]):
+                changed.append(rel_path)
+        return changed
+    
+    def sync(self, remote_dir, local_dir, target="", on_progress=None) -> SyncResult:
+        """增量导出 remote_dir 到 local_dir
+
+        on_progress(TransferProgress) 在工作线程中回调。远端列举失败时抛出 TransferError。
+        """
+        start = time.perf_counter()
+        remote_dir = remote_dir.rstrip("/")
+        # 先列举远端，失败时抛出 TransferError，不写入清单
+        remote = self.remote_manifest(remote_dir, target)
+        os.makedirs(local_dir, exist_ok=True)
+        manifest = self.load_manifest(local_dir)
+        changed = self.changed_files(remote, manifest, local_dir)
+        result = SyncResult(local_dir, total=len(remote), skipped=len(remote) - len(changed))
+        
+        # 新清单：未变化的条目保留，远端已删除的条目移除，成功拉取的条目更新
+        new_manifest = {rel: remote[rel] for rel in remote if rel not in changed}
+        lock = threading.Lock()
+        
+        def on_file(job, ok):
+            if ok:
+                with lock:
+                    new_manifest[job.rel_path] = remote[job.rel_path]
+        
+        if changed:
+            transfer = self.engine.recv(remote_dir, local_dir, target, {rel: remote[rel] for rel in changed},
+                                        on_progress=on_progress, on_file=on_file)
+            result.pulled = transfer.files
+            result.bytes_pulled = transfer.bytes
+            result.failed = len(transfer.failures)
+            result.cancelled = transfer.cancelled
+        
+        self.save_manifest(local_dir, remote_dir, new_manifest)
+        result.duration = time.perf_counter() - start
+        return result
+
+class HilogBuffer:
+    """hilog 日志环形缓冲区
+
+    各字段保存在定长 array 中，第 seq 行写入 seq % capacity 处，写满后覆盖最早的行，
+    内存占用固定。级别、tag、pid 各维护一个"值 -> 序号队列"的索引，新行追加到队尾，
+    被覆盖的行从队首移除；过滤时只遍历命中最少的索引，而不必扫描整个缓冲区。
+    """
+    
+    LEVELS = "DIWEF"
+    LEVEL_CODES = {level: code for code, level in enumerate(LEVELS)}
+    # 无法解析的行（hilog 提示信息等）的级别编码
+    UNKNOWN_LEVEL = 255
+    # 格式: 08-18 10:20:30.123  1234  1256 I C01406/Tag: message
+    LINE_PATTERN = re.compile(
+        r"(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d(?:\.\d+)?)\s+(\d+)\s+(\d+)\s+([DIWEF])\s+([^/\s]+)/(.*?):")
+    # 查询时每次持锁处理的序号数，避免长时间阻塞读取线程
+    QUERY_CHUNK = 4096
+    
+    def __init__(self, capacity=200000):
+        self.capacity = max(1, capacity)
+        self.lines = [None] * self.capacity
+        self.times = array('d', [0.0]) * self.capacity
+        self.pids = array('i', [-1]) * self.capacity
+        self.tids = array('i', [-1]) * self.capacity
+        self.levels = bytearray([self.UNKNOWN_LEVEL]) * self.capacity
+        self.tag_ids = array('i', [-1]) * self.capacity
+        self.domain_ids = array('i', [-1]) * self.capacity
+        self.tags = []
+        self.domains = []
+        self._tag_lookup = {}
+        self._domain_lookup = {}
+        self.by_level = {}
+        self.by_tag = {}
+        self.by_pid = {}
+        self.next_seq = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return self.next_seq - self.first_seq
+    
+    @property
+    def first_seq(self):
+        """缓冲区中最早一行的序号"""
+        return max(0, self.next_seq - self.capacity)
+    
+    def extend(self, lines):
+        """追加多行日志"""
+        match = self.LINE_PATTERN.match
+        with self._lock:
+            for line in lines:
+                self._append(line, match(line))
+    
+    def _append(self, line, match):
+        seq = self.next_seq
+        slot = seq % self.capacity
+        if seq >= self.capacity:
+            self._evict(slot)
+        
+        if match:
+            month, day, hour, minute, second, pid, tid, level, domain, tag = match.groups()
+            level_code = self.LEVEL_CODES[level]
+            pid = int(pid)
+            tag_id = self._intern(tag, self.tags, self._tag_lookup)
+            self.times[slot] = ((int(month) * 31 + int(day)) * 24 + int(hour)) * 3600 + int(minute) * 60 + float(second)
+            self.tids[slot] = int(tid)
+            self.domain_ids[slot] = self._intern(domain, self.domains, self._domain_lookup)
+            self._index(self.by_tag, tag_id, seq)
+            self._index(self.by_pid, pid, seq)
+        else:
+            level_code, pid, tag_id = self.UNKNOWN_LEVEL, -1, -1
+            self.times[slot] = 0.0
+            self.tids[slot] = -1
+            self.domain_ids[slot] = -1
+        self.lines[slot] = line
+        self.levels[slot] = level_code
+        self.pids[slot] = pid
+        self.tag_ids[slot] = tag_id
+        self._index(self.by_level, level_code, seq)
+        self.next_seq = seq + 1
+    
+    @staticmethod
+    def _intern(name, names, lookup):
+        value = lookup.get(name)
+        if value is None:
+            value = lookup[name] = len(names)
+            names.append(name)
+        return value
+    
+    @staticmethod
+    def _index(index, key, seq):
+        entries = index.get(key)
+        if entries is None:
+            entries = index[key] = collections.deque()
+        entries.append(seq)
+    
+    def _evict(self, slot):
+        """移除即将被覆盖的行的索引，它一定位于各索引队列的队首"""
+        for index, key in ((self.by_level, self.levels[slot]),
+                           (self.by_tag, self.tag_ids[slot]),
+                           (self.by_pid, self.pids[slot])):
+            entries = index.get(key)
+            if entries:
+                entries.popleft()
+                if not entries:
+                    del index[key]
+    
+    def clear(self):
+        """清空缓冲区（tag、domain 名称表保留）"""
+        with self._lock:
+            self.next_seq = 0
+            self.by_level.clear()
+            self.by_tag.clear()
+            self.by_pid.clear()
+    
+    def record(self, seq):
+        """返回某一行的解析结果，行已被覆盖时返回None"""
+        with self._lock:
+            if not self.first_seq <= seq < self.next_seq:
+                return None
+            slot = seq % self.capacity
+            level = self.levels[slot]
+            tag_id = self.tag_ids[slot]
+            domain_id = self.domain_ids[slot]
+            seconds = self.times[slot] % 86400
+            return {
+                "time": f"{int(seconds // 3600):02d}:{int(seconds % 3600 // 60):02d}:{seconds % 60:06.3f}",
+                "pid": self.pids[slot],
+                "tid": self.tids[slot],
+                "level": self.LEVELS[level] if level < len(self.LEVELS) else "",
+                "domain": self.domains[domain_id] if domain_id >= 0 else "",
+                "tag": self.tags[tag_id] if tag_id >= 0 else "",
+                "line": self.lines[slot],
+            }
+    
+    def query(self, levels=None, tags=None, pids=None, pattern=None, limit=5000, start_seq=0, end_seq=None):
+        """查询 [start_seq, end_seq) 范围内匹配的行
+
+        levels 为级别字母集合，tags 为 tag 名称集合，pids 为进程号集合，None 表示不限；
+        pattern 为正则表达式（字符串或已编译对象），在字段过滤之后对剩余行匹配。
+        返回 (seq, 级别字母, 行文本) 列表，按时间顺序，最多 limit 条最新的匹配。
+        """
+        regex = re.compile(pattern) if isinstance(pattern, str) else pattern
+        with self._lock:
+            end = self.next_seq if end_seq is None else min(end_seq, self.next_seq)
+            start = max(start_seq, self.first_seq)
+            level_codes = None if levels is None else {self.LEVEL_CODES[l] for l in levels if l in self.LEVEL_CODES}
+            tag_ids = None if tags is None else {self._tag_lookup[t] for t in tags if t in self._tag_lookup}
+            pid_set = None if pids is None else set(pids)
+            
+            # 选择命中行数最少的索引作为候选；命中过多时直接按范围遍历更快
+            best = None
+            for index, keys in ((self.by_level, level_codes), (self.by_tag, tag_ids), (self.by_pid, pid_set)):
+                if keys is None:
+                    continue
+                queues = [index[key] for key in keys if key in index]
+                count = sum(map(len, queues))
+                if best is None or count < best[0]:
+                    best = (count, queues)
+            if best is None or best[0] > (end - start) // 2:
+                candidates = range(start, end)
+            elif len(best[1]) == 1:
+                candidates = list(best[1][0])
+            else:
+                # 各队列本身有序，timsort 合并有序片段接近线性
+                candidates = sorted(itertools.chain(*best[1]))
+        if isinstance(candidates, list):
+            candidates = candidates[bisect.bisect_left(candidates, start):bisect.bisect_left(candidates, end)]
+        
+        # 从最新的行向前分块过滤，凑够 limit 条即停止
+        chunks = []
+        found = 0
+        stop = len(candidates)
+        while stop > 0 and (not limit or found < limit):
+            begin = max(0, stop - self.QUERY_CHUNK)
+            with self._lock:
+                first = self.first_seq
+                rows = []
+                for seq in candidates[begin:stop]:
+                    if seq < first:
+                        continue
+                    slot = seq % self.capacity
+                    level = self.levels[slot]
+                    if level_codes is not None and level not in level_codes:
+                        continue
+                    if tag_ids is not None and self.tag_ids[slot] not in tag_ids:
+                        continue
+                    if pid_set is not None and self.pids[slot] not in pid_set:
+                        continue
+                    rows.append((seq, self.LEVELS[level] if level < len(self.LEVELS) else "", self.lines[slot]))
+            if candidates[stop - 1] < first:
+                break
+            if regex is not None:
+                rows = [row for row in rows if regex.search(row[2])]
+            chunks.append(rows)
+            found += len(rows)
+            stop = begin
+        
+        result = [row for rows in reversed(chunks) for row in rows]
+        return result[-limit:] if limit else result
+
+class HilogStream:
+    """在后台线程中读取 hdc shell hilog 的输出并写入 HilogBuffer"""
+    
+    READ_SIZE = 64 * 1024
+    
+    def __init__(self, hdc_util, buffer, target="", on_exit=None):
+        self.hdc_util = hdc_util
+        self.buffer = buffer
+        self.target = target
+        self.on_exit = on_exit
+        self.process = None
+        self._thread = None
+        self._timer = None
+    
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+    
+    def start(self):
+        """启动 hilog 进程和读取线程，整个会话作为一次hdc调用计入执行统计"""
+        arguments = ["-t", self.target] if self.target else []
+        arguments += ["shell", "hilog"]
+        self._timer = CommandTimer(arguments, self.target)
+        try:
+            self.process = subprocess.Popen(
+                [self.hdc_util.hdc_path] + arguments,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                **ProcessUtil.POPEN_FLAGS
+            )
+        except Exception:
+            self._timer.finish(-1)
+            raise
+        self._timer.spawned()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+    
+    def _read(self):
+        # 按块读取，只把完整的行写入缓冲区，残余部分留到下一块
+        pending = b""
+        try:
+            while True:
+                data = self.process.stdout.read1(self.READ_SIZE)
+                if not data:
+                    break
+                self._timer.received(len(data))
+                data = pending + data
+                end = data.rfind(b"\n")
+                if end < 0:
+                    pending = data
+                    continue
+                pending = data[end + 1:]
+                self.buffer.extend(data[:end].decode("utf-8", errors="replace").splitlines())
+            if pending:
+                self.buffer.extend([pending.decode("utf-8", errors="replace").rstrip("\r")])
+        except Exception as e:
+            logger.error(f"读取hilog输出失败: {e}")
+        finally:
+            self.process.stdout.close()
+            exit_code = self.process.wait()
+            self._timer.finish(exit_code)
+            logger.info(f"hilog 已退出，退出码: {exit_code}")
+            if self.on_exit:
+                self.on_exit(exit_code)
+    
+    def stop(self):
+        """结束 hilog 进程，读取线程随之退出"""
+        if self.running:
+            self.process.kill()
+
+@dataclass
+class ScreenFrame:
+    """屏幕流中的一帧"""
+    seq: int
+    captured_at: float
+    capture_time: float = 0.0
+    pull_time: float = 0.0
+    decode_time: float = 0.0
+    data: bytes = b""
+    # 安装了 Pillow 时为缩放后的 PIL.Image，否则为None（由Tk直接解码PNG）
+    image: Any = None
+
+class ScreenStream:
+    """设备屏幕的流水线截图
+
+    设备端截图、file recv 拉取、本地解码三个阶段各在一个线程中运行，阶段之间是容量为1
+    的队列：采集第 N+1 帧时第 N 帧在传输、第 N-1 帧在解码或显示。下游来不及处理时丢弃
+    队列中较旧的帧，只保留最新的。设备端轮流使用固定数量的截图文件，空闲文件用完时
+    采集阶段等待，不会覆盖正在传输的截图。
+
+    安装了 Pillow 时使用 snapshot_display 截取JPEG并在解码线程中缩放，否则使用
+    uitest screenCap 截取Tk能直接显示的PNG。
+    """
+    
+    REMOTE_DIR = "/data/local/tmp"
+    SLOTS = 3
+    
+    def __init__(self, hdc_util, target="", fps=5.0, remote_dir=REMOTE_DIR):
+        self.hdc_util = hdc_util
+        self.target = target
+        self.fps = fps
+        self.remote_dir = remote_dir
+        # 显示区域大小，由界面在窗口大小变化时更新
+        self.view_size = None
+        self.use_pillow = load_pillow()
+        self.extension = "jpeg" if self.use_pillow else "png"
+        # 解码完成、等待显示的帧
+        self.frames = queue.Queue(maxsize=1)
+        self.captured = 0
+        self.dropped = 0
+        self.error = ""
+        self._pull_queue = queue.Queue(maxsize=1)
+        self._decode_queue = queue.Queue(maxsize=1)
+        self._free_slots = queue.Queue()
+        for slot in range(self.SLOTS):
+            self._free_slots.put(slot)
+        self._stop = threading.Event()
+        self.local_dir = None
+    
+    def remote_path(self, slot):
+        return f"{self.remote_dir}/hdt_screen_{os.getpid()}_{slot}.{self.extension}"
+    
+    def capture_command(self, path):
+        if self.use_pillow:
+            return f"snapshot_display -f {path}"
+        return f"uitest screenCap -p {path}"
+    
+    def start(self):
+        """启动三个阶段的线程"""
+        self.local_dir = tempfile.mkdtemp(prefix="hdt_screen_")
+        for name, func in (("capture", self._capture), ("pull", self._pull), ("decode", self._decode)):
+            threading.Thread(target=func, name=f"screen-{name}", daemon=True).start()
+    
+    def stop(self):
+        """停止采集，各线程在当前操作完成后退出并清理截图文件"""
+        self._stop.set()
+    
+    @property
+    def running(self):
+        return self.local_dir is not None and not self._stop.is_set()
+    
+    def _offer(self, target_queue, item, release=None):
+        """放入容量为1的队列，队列已满时丢弃其中较旧的帧"""
+        while True:
+            try:
+                target_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    old = target_queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.dropped += 1
+                if release:
+                    release(old)
+    
+    def _take(self, source_queue):
+        """从队列取出一项，停止时返回None"""
+        while not self._stop.is_set():
+            try:
+                return source_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return None
+    
+    def _capture(self):
+        prefix = f"-t {self.target} " if self.target else ""
+        next_time = time.perf_counter()
+        seq = 0
+        try:
+            while not self._stop.is_set():
+                delay = next_time - time.perf_counter()
+                if delay > 0 and self._stop.wait(delay):
+                    break
+                # 落后于目标帧率时从当前时间重新计时，不连续补拍
+                next_time = max(next_time + 1.0 / max(self.fps, 0.1), time.perf_counter())
+                slot = self._take(self._free_slots)
+                if slot is None:
+                    break
+                start = time.perf_counter()
+                path = self.remote_path(slot)
+                output = self.hdc_util.run_command(f"{prefix}shell {self.capture_command(path)}")
+                # 两种截图命令成功时都会输出保存路径
+                if path not in output or "fail" in output.lower():
+                    self.error = output.strip()
+                    self._free_slots.put(slot)
+                    self._stop.wait(1.0)
+                    continue
+                self.error = ""
+                seq += 1
+                self.captured += 1
+                frame = ScreenFrame(seq, start, capture_time=time.perf_counter() - start)
+                self._offer(self._pull_queue, (frame, slot), release=lambda item: self._free_slots.put(item[1]))
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"屏幕采集失败: {e}")
+        finally:
+            paths = " ".join(self.remote_path(slot) for slot in range(self.SLOTS))
+            try:
+                self.hdc_util.run_command(f"{prefix}shell rm -f {paths}")
+            except Exception as e:
+                logger.warning(f"清理设备端截图失败: {e}")
+    
+    def _pull(self):
+        try:
+            while True:
+                item = self._take(self._pull_queue)
+                if item is None:
+                    break
+                frame, slot = item
+                start = time.perf_counter()
+                local_path = os.path.join(self.local_dir, f"{slot}.{self.extension}")
+                try:
+                    result = self.hdc_util.recv_file(self.remote_path(slot), local_path, self.target)
+                finally:
+                    self._free_slots.put(slot)
+                try:
+                    with open(local_path, 'rb') as f:
+                        frame.data = f.read()
+                    os.remove(local_path)
+                except OSError:
+                    if not self._stop.is_set():
+                        self.error = result.output.strip() or "拉取截图失败"
+                    continue
+                frame.pull_time = time.perf_counter() - start
+                self._offer(self._decode_queue, frame)
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"拉取截图失败: {e}")
+        finally:
+            shutil.rmtree(self.local_dir, ignore_errors=True)
+    
+    def _decode(self):
+        while True:
+            frame = self._take(self._decode_queue)
+            if frame is None:
+                break
+            start = time.perf_counter()
+            try:
+                if self.use_pillow:
+                    image = Image.open(io.BytesIO(frame.data))
+                    if self.view_size:
+                        # JPEG 可以在解码时直接按比例缩小，比解码后再缩放快得多
+                        image.draft("RGB", self.view_size)
+                    image = image.convert("RGB")
+                    if self.view_size:
+                        image.thumbnail(self.view_size)
+                    frame.image = image
+            except Exception as e:
+                self.error = f"解码失败: {e}"
+                continue
+            frame.decode_time = time.perf_counter() - start
+            self._offer(self.frames, frame)
+
+class _TrieNode:
+    """压缩前缀树节点，best 为子树中最近使用的序号"""
+    
+    __slots__ = ("label", "children", "best", "command", "seq")
+    
+    def __init__(self, label="", best=-1):
+        self.label = label
+        self.children = {}
+        self.best = best
+        self.command = None
+        self.seq = -1
+
+class CommandTrie:
+    """命令前缀树（边上保存字符串的压缩形式），按最近使用顺序给出补全"""
+    
+    def __init__(self):
+        self.root = _TrieNode()
+    
+    def insert(self, command, seq):
+        """插入或更新命令，seq 必须大于所有已有序号"""
+        node = self.root
+        node.best = seq
+        i = 0
+        while i < len(command):
+            child = node.children.get(command[i])
+            if child is None:
+                child = _TrieNode(command[i:], seq)
+                node.children[command[i]] = child
+                node = child
+                break
+            label = child.label
+            if command.startswith(label, i):
+                common = len(label)
+            else:
+                common = 1
+                limit = min(len(label), len(command) - i)
+                while common < limit and label[common] == command[i + common]:
+                    common += 1
+            if common < len(label):
+                # 在公共前缀处拆分边
+                middle = _TrieNode(label[:common], seq)
+                child.label = label[common:]
+                middle.children[child.label[0]] = child
+                node.children[command[i]] = middle
+                child = middle
+            child.best = seq
+            node = child
+            i += common
+        node.command = command
+        node.seq = seq
+    
+    def remove(self, command):
+        """删除命令。只用于淘汰最早的命令，因此祖先节点的 best 不需要重新计算"""
+        path = [self.root]
+        node, i = self.root, 0
+        while i < len(command):
+            node = node.children.get(command[i])
+            if node is None or not command.startswith(node.label, i):
+                return
+            path.append(node)
+            i += len(node.label)
+        if node.command != command:
+            return
+        node.command = None
+        node.seq = -1
+        # 自底向上清理空节点
+        for parent, child in zip(reversed(path[:-1]), reversed(path[1:])):
+            if child.children or child.command is not None:
+                break
+            del parent.children[child.label[0]]
+    
+    def _find(self, prefix):
+        node, i = self.root, 0
+        while i < len(prefix):
+            node = node.children.get(prefix[i])
+            if node is None:
+                return None
+            rest = prefix[i:i + len(node.label)]
+            if not node.label.startswith(rest):
+                return None
+            i += len(node.label)
+        return node
+    
+    def complete(self, prefix, limit=10):
+        """以 prefix 开头的命令，最近使用的在前"""
+        node = self._find(prefix)
+        if node is None:
+            return []
+        # 按子树 best 做最佳优先遍历，只访问结果路径附近的节点
+        results = []
+        heap = [(-node.best, 0, node, False)]
+        counter = 1
+        while heap and len(results) < limit:
+            _, _, current, is_command = heapq.heappop(heap)
+            if is_command:
+                results.append(current.command)
+                continue
+            if current.command is not None:
+                heapq.heappush(heap, (-current.seq, counter, current, True))
+                counter += 1
+            for child in current.children.values():
+                heapq.heappush(heap, (-child.best, counter, child, False))
+                counter += 1
+        return results
+
+class CommandHistory:
+    """命令历史管理
+
+    命令按最近使用顺序保存在 OrderedDict 中，去重和移到末尾都是 O(1)；
+    每次执行以追加方式写入历史文件，文件中重复记录过多时压缩重写。
+    """
+    
+    HISTORY_FILE = "command_history.jsonl"
+    
+    def __init__(self, max_history=100000, history_file=HISTORY_FILE):
+        self.max_history = max(1, max_history)
+        self.history_file = history_file
+        self.entries = collections.OrderedDict()
+        self.trie = CommandTrie()
+        self.current_index = -1
+        self._browse = None
+        self._seq = 0
+        self._file_lines = 0
+        self._fuzzy_text = None
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def load(self):
+        """从历史文件加载，损坏的行忽略；文件不存在时返回False"""
+        entries = collections.OrderedDict()
+        lines = 0
+        try:
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        command = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(command, str) and command:
+                        entries[command] = None
+                        entries.move_to_end(command)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"加载命令历史失败: {e}")
+        
+        # 先去重再建前缀树；本次启动后新执行的命令更新，保持在最近位置，避免为被覆盖的记录反复插入
+        with self._lock:
+            recent = list(self.entries)
+            for command in itertools.islice(entries, max(0, len(entries) - self.max_history), None):
+                self._touch(command)
+            for command in recent:
+                self._touch(command)
+            self._file_lines += lines
+            self._browse = None
+        logger.info(f"已加载 {len(self.entries)} 条命令历史")
+        return True
+    
+    def _touch(self, command):
+        """把命令移到最近位置，超出上限时淘汰最早的命令"""
+        self._seq += 1
+        self.entries[command] = self._seq
+        self.entries.move_to_end(command)
+        self.trie.insert(command, self._seq)
+        while len(self.entries) > self.max_history:
+            oldest, _ = self.entries.popitem(last=False)
+            self.trie.remove(oldest)
+        self._fuzzy_text = None
+    
+    def add_command(self, command):
+        """添加命令到历史，可在任意线程调用"""
+        with self._lock:
+            if command:
+                self._touch(command)
+                self._append(command)
+            self._browse = None
+            self.current_index = len(self.entries)
+    
+    def _append(self, command):
+        if not self.history_file:
+            return
+        try:
+            with open(self.history_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(command, ensure_ascii=False) + "\n")
+            self._file_lines += 1
+        except Exception as e:
+            logger.error(f"保存命令历史失败: {e}")
+            return
+        if self._file_lines > max(1000, 2 * len(self.entries)):
+            self.compact()
+    
+    def compact(self):
+        """按当前顺序重写历史文件，去掉重复和已淘汰的记录（原子替换）"""
+        tmp_file = self.history_file + ".tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for command in self.entries:
+                    f.write(json.dumps(command, ensure_ascii=False) + "\n")
+            os.replace(tmp_file, self.history_file)
+            self._file_lines = len(self.entries)
+        except Exception as e:
+            logger.error(f"压缩命令历史失败: {e}")
+    
+    def get_previous(self):
+        """获取上一条命令"""
+        with self._lock:
+            if self._browse is None:
+                self._browse = list(self.entries)
+                self.current_index = len(self._browse)
+            if self.current_index > 0:
+                self.current_index -= 1
+                return self._browse[self.current_index]
+        return ""
+    
+    def get_next(self):
+        """获取下一条命令"""
+        with self._lock:
+            if self._browse and self.current_index < len(self._browse) - 1:
+                self.current_index += 1
+                return self._browse[self.current_index]
+        return ""
+    
+    def get_recent(self, count=10):
+        """获取最近的命令"""
+        with self._lock:
+            return list(itertools.islice(reversed(self.entries), count))[::-1]
+    
+    def complete(self, prefix, limit=10):
+        """以 prefix 开头的历史命令，最近使用的在前"""
+        with self._lock:
+            return self.trie.complete(prefix, limit)
+    
+    def fuzzy_search(self, query, limit=50):
+        """模糊搜索：query 的字符按顺序出现在命令中即匹配（忽略大小写），最近使用的在前"""
+        with self._lock:
+            if not query:
+                return list(itertools.islice(reversed(self.entries), limit))
+            if self._fuzzy_text is None:
+                # 所有命令按最近使用顺序拼成一个字符串，一次正则扫描完成匹配
+                self._fuzzy_commands = list(reversed(self.entries))
+                lowered = [c.lower() for c in self._fuzzy_commands]
+                self._fuzzy_text = "\n".join(lowered) + "\n"
+                self._fuzzy_offsets = list(itertools.accumulate(len(c) + 1 for c in lowered))
+            text, commands, offsets = self._fuzzy_text, self._fuzzy_commands, self._fuzzy_offsets
+        # 在小写文本上匹配；每个字符前用"不含该字符的任意内容"衔接，匹配时不会回溯
+        query = query.lower()
+        pattern = re.compile(re.escape(query[0]) + "".join(
+            f"[^\n{re.escape(c)}]*{re.escape(c)}" for c in query[1:]))
+        results = []
+        position = 0
+        while len(results) < limit:
+            match = pattern.search(text, position)
+            if match is None:
+                break
+            index = bisect.bisect_right(offsets, match.start())
+            results.append(commands[index])
+            # 从下一行开始继续查找
+            position = offsets[index]
+        return results
+
+class SessionLog:
+    """控制台会话日志
+
+    输出只追加写入磁盘文件，同时记录每行起始偏移（array('Q')），
+    读取时通过 mmap 按行号直接定位，内存中不保留文本本身。
+    """
+    
+    SESSION_DIR = "sessions"
+    # 忽略大小写查找时每次转换的字节数
+    SEARCH_CHUNK = 4 * 1024 * 1024
+    
+    def __init__(self, path=None, keep_sessions=5):
+        if path is None:
+            ProcessUtil.ensure_dir(self.SESSION_DIR)
+            self.prune(keep_sessions - 1)
+            name = datetime.datetime.now().strftime("session-%Y%m%d-%H%M%S.log")
+            path = os.path.join(self.SESSION_DIR, name)
+        self.path = path
+        self._file = open(path, "w+b", buffering=0)
+        self.size = 0
+        # offsets[i] 为第 i 行的起始偏移，最后一个元素为下一行的起始位置
+        self.offsets = array('Q', [0])
+        self._map = None
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def prune(cls, keep):
+        """只保留最近的 keep 个会话日志"""
+        try:
+            names = sorted(n for n in os.listdir(cls.SESSION_DIR) if n.startswith("session-") and n.endswith(".log"))
+        except OSError:
+            return
+        for name in names[:max(0, len(names) - max(0, keep))]:
+            try:
+                os.remove(os.path.join(cls.SESSION_DIR, name))
+            except OSError as e:
+                logger.warning(f"删除旧会话日志失败: {e}")
+    
+    @property
+    def line_count(self):
+        """行数，末尾未换行的部分也算一行"""
+        return len(self.offsets) - 1 + (1 if self.size > self.offsets[-1] else 0)
+    
+    def append(self, text):
+        """追加文本"""
+        data = text.encode("utf-8")
+        with self._lock:
+            self._file.write(data)
+            newline = data.find(b"\n")
+            while newline >= 0:
+                self.offsets.append(self.size + newline + 1)
+                newline = data.find(b"\n", newline + 1)
+            self.size += len(data)
+    
+    def _mapped(self, end):
+        """返回至少覆盖到 end 的只读映射，文件增长后重新映射"""
+        if self._map is None or len(self._map) < end:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+    
+    def _line_offset(self, line):
+        return self.offsets[line] if line < len(self.offsets) else self.size
+    
+    def read_lines(self, start, count):
+        """读取从第 start 行开始的 count 行，返回文本"""
+        with self._lock:
+            start = max(0, min(start, self.line_count))
+            end = min(self.line_count, start + count)
+            begin_offset, end_offset = self._line_offset(start), self._line_offset(end)
+            if end_offset <= begin_offset:
+                return ""
+            return self._mapped(end_offset)[begin_offset:end_offset].decode("utf-8", errors="replace")
+    
+    def line_at(self, offset):
+        """字节偏移所在的行号"""
+        return max(0, bisect.bisect_right(self.offsets, offset) - 1)
+    
+    def search(self, pattern, start_line=0, ignore_case=True):
+        """从第 start_line 行开始查找，到末尾后从头继续，返回匹配所在行号，未找到返回None"""
+        needle = pattern.encode("utf-8")
+        if ignore_case:
+            needle = needle.lower()
+        with self._lock:
+            if self.size == 0 or not needle:
+                return None
+            data = self._mapped(self.size)
+            start = self._line_offset(min(start_line, self.line_count))
+            offset = self._find(data, needle, start, self.size, ignore_case)
+            if offset < 0:
+                offset = self._find(data, needle, 0, min(self.size, start + len(needle)), ignore_case)
+            return self.line_at(offset) if offset >= 0 else None
+    
+    def _find(self, data, needle, start, end, ignore_case):
+        """在映射中分块查找，忽略大小写时逐块转为小写（仅影响ASCII字母）"""
+        if not ignore_case:
+            return data.find(needle, start, end)
+        overlap = len(needle) - 1
+        while start < end:
+            stop = min(end, start + self.SEARCH_CHUNK)
+            found = data[start:min(end, stop + overlap)].lower().find(needle)
+            if found >= 0:
+                return start + found
+            start = stop
+        return -1
+    
+    def copy_to(self, path):
+        """把整个会话日志复制到 path"""
+        with self._lock:
+            shutil.copyfile(self.path, path)
+    
+    def close(self):
+        """关闭文件和映射"""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+
+class ResultConsole:
+    """结果输出控制台
+
+    工作线程只把文本放入队列；Tk线程按固定帧间隔批量取出，追加到 SessionLog。
+    文本控件只显示当前可见的若干行，滚动时从会话日志按行号重新读取，
+    因此无论输出多少，控件的内容和内存占用都保持不变。有选中的文本时新输出不重绘控件，
+    以便在持续输出时选择和复制；滚动时选区按会话日志中的位置保留（仅限可见部分）。
+    """
+    
+    # 刷新间隔，单位毫秒
+    FRAME_INTERVAL = 50
+    # 每帧用于取出队列内容的时间预算，单位秒
+    FRAME_BUDGET = 0.008
+    # 每帧最多合并的条目数，限制单次写入的开销
+    MAX_BATCH = 2000
+    
+    def __init__(self, root, parent, log):
+        self.root = root
+        self.log = log
+        self.pending = queue.SimpleQueue()
+        # 可见窗口的首行行号；follow 为 True 时始终显示末尾
+        self.top = 0
+        self.follow = True
+        self.highlight = None
+        self._line_height = None
+        
+        frame = ttk.Frame(parent)
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.text = tk.Text(frame, height=15, width=80, wrap=tk.NONE)
+        self.scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        xscrollbar = ttk.Scrollbar(frame, orient=tk.HORIZONTAL, command=self.text.xview)
+        self.text.configure(xscrollcommand=xscrollbar.set, state=tk.DISABLED)
+        self.text.tag_configure("match", background="#ffe08a")
+        self.text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        xscrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(0, weight=1)
+        
+        self.text.bind('<MouseWheel>', lambda e: self.scroll_lines(-3 if e.delta > 0 else 3))
+        self.text.bind('<Button-4>', lambda e: self.scroll_lines(-3))
+        self.text.bind('<Button-5>', lambda e: self.scroll_lines(3))
+        self.text.bind('<Prior>', lambda e: self.scroll_lines(-self.visible_lines()))
+        self.text.bind('<Next>', lambda e: self.scroll_lines(self.visible_lines()))
+        self.text.bind('<Control-Home>', lambda e: self.scroll_to(0))
+        self.text.bind('<Control-End>', lambda e: self.scroll_to(self.log.line_count))
+        self.text.bind('<Configure>', lambda e: self.render())
+        
+        self._timer = None
+        self._schedule()
+    
+    def write(self, text):
+        """写入文本，可在任意线程调用"""
+        self.pending.put(text)
+    
+    def drain(self):
+        """在Tk线程中处理一批待显示文本，返回本批条目数"""
+        chunks = []
+        deadline = time.perf_counter() + self.FRAME_BUDGET
+        while len(chunks) < self.MAX_BATCH:
+            try:
+                chunks.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+            if len(chunks) % 100 == 0 and time.perf_counter() > deadline:
+                break
+        if not chunks:
+            return 0
+        
+        self.log.append("".join(chunks))
+        # 仅当视图停留在底部且没有选中文本时跟随新输出，方便查看历史输出和复制
+        if self.follow and not self.text.tag_ranges("sel"):
+            self.render()
+        else:
+            self.update_scrollbar()
+        return len(chunks)
+    
+    def visible_lines(self):
+        """控件当前能显示的行数"""
+        if self._line_height is None:
+            self._line_height = tkfont.Font(font=self.text.cget("font")).metrics("linespace") or 1
+        return max(1, self.text.winfo_height() // self._line_height)
+    
+    def render(self):
+        """从会话日志读取可见窗口的行并显示"""
+        rows = self.visible_lines()
+        total = self.log.line_count
+        if self.follow:
+            self.top = max(0, total - rows)
+        self.top = max(0, min(self.top, total - 1))
+        content = self.log.read_lines(self.top, rows)
+        selection = self.selection()
+        self.text.configure(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", content)
+        self.text.yview_moveto(0)
+        if selection is not None:
+            self.restore_selection(selection, rows)
+        if self.highlight is not None and self.top <= self.highlight[0] < self.top + rows:
+            line, start, end = self.highlight
+            row = line - self.top + 1
+            self.text.tag_add("match", f"{row}.{start}", f"{row}.{end}")
+            self.text.see(f"{row}.{start}")
+        self.text.configure(state=tk.DISABLED)
+        self.update_scrollbar()
+    
+    def selection(self):
+        """选区在会话日志中的位置 ((行, 列), (行, 列))，没有选区时为None"""
+        ranges = self.text.tag_ranges("sel")
+        if not ranges:
+            return None
+        points = []
+        for index in ranges[:2]:
+            row, column = map(int, str(index).split("."))
+            points.append((self.top + row - 1, column))
+        return tuple(points)
+    
+    def restore_selection(self, selection, rows):
+        """重新选中 selection 在当前可见窗口内的部分"""
+        (first_line, first_column), (last_line, last_column) = selection
+        if last_line < self.top or first_line >= self.top + rows:
+            return
+        start = f"{first_line - self.top + 1}.{first_column}" if first_line >= self.top else "1.0"
+        end = f"{last_line - self.top + 1}.{last_column}" if last_line < self.top + rows else tk.END
+        self.text.tag_add("sel", start, end)
+    
+    def update_scrollbar(self):
+        total = max(1, self.log.line_count)
+        rows = self.visible_lines()
+        self.scrollbar.set(self.top / total, min(1.0, (self.top + rows) / total))
+    
+    def scroll_to(self, line):
+        """把第 line 行显示为首行，滚动到末尾时恢复跟随"""
+        rows = self.visible_lines()
+        last_top = max(0, self.log.line_count - rows)
+        self.top = max(0, min(int(line), last_top))
+        self.follow = self.top >= last_top
+        self.render()
+        return "break"
+    
+    def scroll_lines(self, count):
+        return self.scroll_to(self.top + count)
+    
+    def on_scrollbar(self, action, value, unit=None):
+        """滚动条回调: moveto 比例 / scroll 行或页"""
+        if action == "moveto":
+            self.scroll_to(float(value) * self.log.line_count)
+        elif action == "scroll":
+            step = self.visible_lines() if unit == "pages" else 1
+            self.scroll_lines(int(value) * step)
+    
+    def find(self, pattern):
+        """从当前位置之后查找文本并滚动到匹配行，返回是否找到"""
+        if not pattern:
+            return False
+        start = self.highlight[0] + 1 if self.highlight else self.top
+        line = self.log.search(pattern, start)
+        if line is None:
+            self.highlight = None
+            self.render()
+            return False
+        column = self.log.read_lines(line, 1).lower().find(pattern.lower())
+        self.highlight = (line, max(0, column), max(0, column) + len(pattern))
+        self.scroll_to(line - self.visible_lines() // 2)
+        return True
+    
+    def _schedule(self):
+        self._timer = self.root.after(self.FRAME_INTERVAL, self._tick)
+    
+    def _tick(self):
+        try:
+            self.drain()
+        finally:
+            self._schedule()
+    
+    def stop(self):
+        """停止刷新定时器"""
+        if self._timer is not None:
+            self.root.after_cancel(self._timer)
+            self._timer = None
+
+class FanOutDialog:
+    """多设备批量执行窗口"""
+    
+    COLUMNS = (
+        ("device", "设备", 200),
+        ("state", "连接状态", 80),
+        ("status", "执行状态", 80),
+        ("exit_code", "退出码", 60),
+        ("duration", "耗时(秒)", 70),
+        ("output", "输出", 360),
+    )
+    
+    def __init__(self, app):
+        self.app = app
+        self.window = tk.Toplevel(app.root)
+        self.window.title("多设备执行")
+        self.window.geometry("900x420")
+        self.results = {}
+        self.running = False
+        
+        top = ttk.Frame(self.window, padding="5")
+        top.pack(fill=tk.X)
+        ttk.Label(top, text="命令:").pack(side=tk.LEFT)
+        self.command_var = tk.StringVar(value=app.command_var.get())
+        command_entry = ttk.Entry(top, textvariable=self.command_var)
+        command_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        command_entry.bind('<Return>', lambda e: self.run())
+        ttk.Label(top, text="并发数:").pack(side=tk.LEFT)
+        self.workers_var = tk.IntVar(value=app.config.get("fanout_max_workers", 8))
+        ttk.Spinbox(top, from_=1, to=64, width=4, textvariable=self.workers_var).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top, text="刷新设备", command=self.refresh_devices).pack(side=tk.LEFT, padx=5)
+        self.run_button = ttk.Button(top, text="执行", command=self.run)
+        self.run_button.pack(side=tk.LEFT)
+        
+        table_frame = ttk.Frame(self.window, padding="5")
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=[c[0] for c in self.COLUMNS],
+                                 show="headings", selectmode="extended")
+        for key, title, width in self.COLUMNS:
+            self.tree.heading(key, text=title)
+            self.tree.column(key, width=width, stretch=(key == "output"))
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.bind('<Double-1>', self.show_output)
+        
+        self.status_var = tk.StringVar(value="未选中设备时在所有已连接设备上执行")
+        ttk.Label(self.window, textvariable=self.status_var, padding="5").pack(fill=tk.X)
+        
+        self.set_devices(app.device_registry.devices())
+        app.watch_devices(self.window, self.set_devices)
+    
+    def refresh_devices(self):
+        """刷新设备列表"""
+        def run():
+            targets = self.app.device_registry.refresh()
+            self.app.run_on_ui_thread(self.set_devices, targets)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def set_devices(self, targets):
+        """填充设备列表"""
+        if self.running:
+            return
+        self.tree.delete(*self.tree.get_children())
+        for target in targets:
+            self.tree.insert("", tk.END, iid=target.connect_key,
+                             values=(target.connect_key, target.state, "", "", "", ""))
+        self.status_var.set(f"共 {len(targets)} 台设备，未选中设备时在所有已连接设备上执行")
+    
+    def run(self):
+        """在选中（或全部已连接）设备上执行命令"""
+        command = self.command_var.get().strip()
+        if not command or self.running:
+            return
+        targets = list(self.tree.selection())
+        if not targets:
+            targets = [iid for iid in self.tree.get_children()
+                       if DeviceTarget(iid, state=self.tree.set(iid, "state")).connected]
+        if not targets:
+            messagebox.showwarning("警告", "没有可用的设备", parent=self.window)
+            return
+        
+        for target in targets:
+            self.tree.set(target, "status", "等待中")
+            for column in ("exit_code", "duration", "output"):
+                self.tree.set(target, column, "")
+        self.running = True
+        self.run_button.config(state=tk.DISABLED)
+        self.status_var.set(f"正在 {len(targets)} 台设备上执行: {command}")
+        self.app.append_result(f"多设备执行: {command} ({len(targets)} 台设备)")
+        
+        runner = FanOutRunner(self.app.hdc_util, max(1, self.workers_var.get()))
+        
+        def on_start(target):
+            self.app.run_on_ui_thread(self.tree.set, target, "status", "执行中")
+        
+        def on_result(result):
+            self.app.run_on_ui_thread(self.update_row, result)
+        
+        def run():
+            start = time.perf_counter()
+            results = runner.run(command, targets, on_start, on_result)
+            self.app.run_on_ui_thread(self.finish, command, results, time.perf_counter() - start)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def update_row(self, result):
+        """更新单个设备的执行结果"""
+        self.results[result.target] = result
+        if not self.tree.exists(result.target):
+            return
+        first_line = result.output.strip().splitlines()[0] if result.output.strip() else ""
+        self.tree.set(result.target, "status", "成功" if result.ok else "失败")
+        self.tree.set(result.target, "exit_code", result.exit_code)
+        self.tree.set(result.target, "duration", f"{result.duration:.2f}")
+        self.tree.set(result.target, "output", first_line)
+    
+    def finish(self, command, results, elapsed):
+        """全部设备执行完成"""
+        self.running = False
+        self.run_button.config(state=tk.NORMAL)
+        failed = sum(1 for r in results if not r.ok)
+        summary = f"执行完成: {len(results)} 台设备，失败 {failed} 台，总耗时 {elapsed:.2f} 秒"
+        self.status_var.set(summary)
+        self.app.append_result(f"{command} - {summary}")
+        self.app.command_history.add_command(command)
+    
+    def show_output(self, event):
+        """双击设备行时在主界面显示完整输出"""
+        target = self.tree.identify_row(event.y)
+        result = self.results.get(target)
+        if result:
+            self.app.append_result(f"[{target}] {result.command}\n{result.output}")
+
+class BatchInstallDialog:
+    """多设备批量安装窗口"""
+    
+    COLUMNS = (
+        ("device", "设备", 200),
+        ("status", "状态", 90),
+        ("progress", "进度", 60),
+        ("file", "当前文件", 180),
+        ("speed", "速率(MB/s)", 80),
+        ("message", "信息", 260),
+    )
+    
+    def __init__(self, app):
+        self.app = app
+        self.window = tk.Toplevel(app.root)
+        self.window.title("批量安装")
+        self.window.geometry("900x520")
+        self.targets = {}
+        self.running = False
+        
+        # hap文件列表
+        files_frame = ttk.LabelFrame(self.window, text="hap文件", padding="5")
+        files_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.files_list = tk.Listbox(files_frame, height=5, selectmode=tk.EXTENDED)
+        self.files_list.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        files_buttons = ttk.Frame(files_frame)
+        files_buttons.pack(side=tk.LEFT, padx=5)
+        ttk.Button(files_buttons, text="添加hap", command=self.add_files).pack(fill=tk.X)
+        ttk.Button(files_buttons, text="移除", command=self.remove_files).pack(fill=tk.X, pady=5)
+        
+        # 安装选项，与主界面共用同一组勾选状态
+        options_frame = ttk.Frame(self.window, padding="5")
+        options_frame.pack(fill=tk.X)
+        ttk.Checkbutton(options_frame, text="替换安装", variable=app.replace_var).pack(side=tk.LEFT)
+        ttk.Checkbutton(options_frame, text="允许降级", variable=app.downgrade_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Checkbutton(options_frame, text="动态授权", variable=app.dynamic_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Checkbutton(options_frame, text="强制安装", variable=app.force_install_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(options_frame, text="并发数:").pack(side=tk.LEFT, padx=(20, 0))
+        self.workers_var = tk.IntVar(value=app.config.get("install_max_workers", 4))
+        ttk.Spinbox(options_frame, from_=1, to=64, width=4, textvariable=self.workers_var).pack(side=tk.LEFT)
+        ttk.Label(options_frame, text="每Hub并发:").pack(side=tk.LEFT, padx=(10, 0))
+        self.hub_limit_var = tk.IntVar(value=app.config.get("install_per_hub_limit", 2))
+        ttk.Spinbox(options_frame, from_=1, to=64, width=4, textvariable=self.hub_limit_var).pack(side=tk.LEFT)
+        ttk.Label(options_frame, text="重试次数:").pack(side=tk.LEFT, padx=(10, 0))
+        self.retries_var = tk.IntVar(value=app.config.get("install_retries", 2))
+        ttk.Spinbox(options_frame, from_=0, to=10, width=4, textvariable=self.retries_var).pack(side=tk.LEFT)
+        self.start_button = ttk.Button(options_frame, text="开始安装", command=self.start)
+        self.start_button.pack(side=tk.RIGHT)
+        ttk.Button(options_frame, text="刷新设备", command=self.refresh_devices).pack(side=tk.RIGHT, padx=5)
+        
+        # 设备进度表
+        table_frame = ttk.Frame(self.window, padding="5")
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=[c[0] for c in self.COLUMNS],
+                                 show="headings", selectmode="extended")
+        for key, title, width in self.COLUMNS:
+            self.tree.heading(key, text=title)
+            self.tree.column(key, width=width, stretch=(key == "message"))
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.status_var = tk.StringVar(value="未选中设备时安装到所有已连接设备")
+        ttk.Label(self.window, textvariable=self.status_var, padding="5").pack(fill=tk.X)
+        
+        self.set_devices(app.device_registry.devices())
+        app.watch_devices(self.window, self.set_devices)
+    
+    def add_files(self):
+        """添加hap文件"""
+        paths = filedialog.askopenfilenames(
+            title="选择hap文件",
+            filetypes=[("HarmonyNEXT", "*.hap"), ("所有文件", "*.*")],
+            parent=self.window
+        )
+        existing = set(self.files_list.get(0, tk.END))
+        for path in paths:
+            path = os.path.normpath(path)
+            if path not in existing:
+                self.files_list.insert(tk.END, path)
+    
+    def remove_files(self):
+        """移除选中的hap文件"""
+        for index in reversed(self.files_list.curselection()):
+            self.files_list.delete(index)
+    
+    def refresh_devices(self):
+        """刷新设备列表"""
+        def run():
+            targets = self.app.device_registry.refresh()
+            self.app.run_on_ui_thread(self.set_devices, targets)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def set_devices(self, targets):
+        """填充设备列表"""
+        if self.running:
+            return
+        self.targets = {t.connect_key: t for t in targets}
+        self.tree.delete(*self.tree.get_children())
+        for target in targets:
+            status = "等待中" if target.connected else target.state
+            self.tree.insert("", tk.END, iid=target.connect_key,
+                             values=(target.connect_key, status, "", "", "", ""))
+    
+    def start(self):
+        """开始批量安装"""
+        if self.running:
+            return
+        hap_files = list(self.files_list.get(0, tk.END))
+        if not hap_files:
+            messagebox.showwarning("警告", "请添加hap文件", parent=self.window)
+            return
+        keys = list(self.tree.selection()) or [k for k, t in self.targets.items() if t.connected]
+        targets = [self.targets[k] for k in keys if k in self.targets]
+        if not targets:
+            messagebox.showwarning("警告", "没有可用的设备", parent=self.window)
+            return
+        
+        options = HdcUtil.install_options(self.app.replace_var.get(), self.app.downgrade_var.get(),
+                                          self.app.dynamic_var.get())
+        installer = BatchInstaller(
+            self.app.hdc_util,
+            max_workers=max(1, self.workers_var.get()),
+            per_hub_limit=max(1, self.hub_limit_var.get()),
+            retries=max(0, self.retries_var.get()),
+            hub_groups=self.app.config.get("install_hub_groups", {}),
+            install_cache=self.app.install_cache,
+            force=self.app.force_install_var.get()
+        )
+        self.running = True
+        self.start_button.config(state=tk.DISABLED)
+        self.status_var.set(f"正在安装 {len(hap_files)} 个文件到 {len(targets)} 台设备...")
+        self.app.append_result(f"批量安装: {len(hap_files)} 个文件, {len(targets)} 台设备, 选项: {' '.join(options) or '无'}")
+        
+        def on_progress(state):
+            self.app.run_on_ui_thread(self.update_row, InstallProgress(**vars(state)))
+        
+        def run():
+            start = time.perf_counter()
+            progress = installer.run(hap_files, targets, options, on_progress)
+            self.app.run_on_ui_thread(self.finish, progress, time.perf_counter() - start)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def update_row(self, state):
+        """更新单个设备的安装进度"""
+        if not self.tree.exists(state.target):
+            return
+        self.tree.item(state.target, values=(
+            state.target, state.status, f"{state.done}/{state.total}", state.current_file,
+            f"{state.throughput:.2f}" if state.busy_time else "", state.message
+        ))
+    
+    def finish(self, progress, elapsed):
+        """批量安装完成"""
+        self.running = False
+        self.start_button.config(state=tk.NORMAL)
+        failed = [key for key, state in progress.items() if state.failed]
+        summary = f"批量安装完成: {len(progress)} 台设备，失败 {len(failed)} 台，总耗时 {elapsed:.1f} 秒"
+        self.status_var.set(summary)
+        self.app.append_result(summary)
+        for key in failed:
+            self.app.append_result(f"安装失败设备: {key} - {progress[key].message}")
+
+class HilogViewer:
+    """hilog 实时日志窗口
+
+    读取线程只写入 HilogBuffer；界面定时只检查新增的行，修改过滤条件时在后台
+    线程中通过索引重新查询，文本控件最多保留 hilog_display_lines 行。
+    """
+    
+    REFRESH_INTERVAL = 100
+    LEVEL_COLORS = {"D": "#808080", "W": "#b36b00", "E": "#d00000", "F": "#ff0000"}
+    
+    def __init__(self, app, target=""):
+        self.app = app
+        self.buffer = HilogBuffer(app.config.get("hilog_buffer_lines", 200000))
+        self.display_lines = app.config.get("hilog_display_lines", 5000)
+        self.stream = None
+        self.filters = {}
+        self.shown_seq = 0
+        self.query_id = 0
+        self.querying = False
+        self._rate_start = (time.perf_counter(), 0)
+        self._timer = None
+        
+        self.window = tk.Toplevel(app.root)
+        self.window.title("hilog 日志")
+        self.window.geometry("1000x600")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        top = ttk.Frame(self.window, padding="5")
+        top.pack(fill=tk.X)
+        ttk.Label(top, text="设备:").pack(side=tk.LEFT)
+        self.target_var = tk.StringVar(value=target or app.target_var.get())
+        target_box = ttk.Combobox(top, textvariable=self.target_var, width=24, values=app.device_keys())
+        target_box.configure(postcommand=lambda: target_box.configure(values=app.device_keys()))
+        target_box.pack(side=tk.LEFT, padx=5)
+        self.start_button = ttk.Button(top, text="开始", command=self.toggle_stream)
+        self.start_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(top, text="清空", command=self.clear).pack(side=tk.LEFT)
+        self.follow_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(top, text="自动滚动", variable=self.follow_var).pack(side=tk.LEFT, padx=10)
+        
+        filter_frame = ttk.Frame(self.window, padding=(5, 0, 5, 5))
+        filter_frame.pack(fill=tk.X)
+        ttk.Label(filter_frame, text="级别:").pack(side=tk.LEFT)
+        self.level_vars = {}
+        for level in HilogBuffer.LEVELS:
+            var = tk.BooleanVar(value=True)
+            self.level_vars[level] = var
+            ttk.Checkbutton(filter_frame, text=level, variable=var,
+                            command=self.apply_filters).pack(side=tk.LEFT)
+        self.tag_var = tk.StringVar()
+        self.pid_var = tk.StringVar()
+        self.search_var = tk.StringVar()
+        for label, var, width in (("Tag:", self.tag_var, 16), ("PID:", self.pid_var, 10), ("搜索(正则):", self.search_var, 24)):
+            ttk.Label(filter_frame, text=label).pack(side=tk.LEFT, padx=(10, 0))
+            entry = ttk.Entry(filter_frame, textvariable=var, width=width)
+            entry.pack(side=tk.LEFT, padx=5)
+            entry.bind('<Return>', lambda e: self.apply_filters())
+        ttk.Button(filter_frame, text="过滤", command=self.apply_filters).pack(side=tk.LEFT, padx=5)
+        
+        self.text = scrolledtext.ScrolledText(self.window, wrap=tk.NONE)
+        self.text.pack(fill=tk.BOTH, expand=True, padx=5)
+        for level, color in self.LEVEL_COLORS.items():
+            self.text.tag_configure(level, foreground=color)
+        self.text.bind('<Double-1>', self.show_record)
+        
+        self.status_var = tk.StringVar(value="未开始")
+        ttk.Label(self.window, textvariable=self.status_var, padding="5").pack(fill=tk.X)
+        
+        self._schedule()
+    
+    def toggle_stream(self):
+        """开始或停止读取 hilog"""
+        if self.stream and self.stream.running:
+            self.stream.stop()
+            return
+        self.stream = HilogStream(self.app.hdc_util, self.buffer, self.target_var.get().strip(),
+                                  on_exit=lambda code: self.app.run_on_ui_thread(self.on_stream_exit, code))
+        try:
+            self.stream.start()
+        except Exception as e:
+            messagebox.showerror("错误", f"启动hilog失败: {e}", parent=self.window)
+            return
+        self.start_button.config(text="停止")
+    
+    def on_stream_exit(self, exit_code):
+        """hilog 进程退出"""
+        if self.window.winfo_exists():
+            self.start_button.config(text="开始")
+    
+    def clear(self):
+        """清空缓冲区和显示"""
+        self.buffer.clear()
+        self.shown_seq = 0
+        self.query_id += 1
+        self.querying = False
+        self._rate_start = (time.perf_counter(), 0)
+        self.text.delete("1.0", tk.END)
+    
+    def read_filters(self):
+        """读取界面上的过滤条件，输入有误时返回None"""
+        levels = {level for level, var in self.level_vars.items() if var.get()}
+        tags = {t.strip() for t in self.tag_var.get().split(",") if t.strip()}
+        try:
+            pids = {int(p) for p in self.pid_var.get().replace(",", " ").split()}
+            pattern = re.compile(self.search_var.get()) if self.search_var.get() else None
+        except (ValueError, re.error) as e:
+            messagebox.showerror("错误", f"过滤条件无效: {e}", parent=self.window)
+            return None
+        return {
+            "levels": None if len(levels) == len(HilogBuffer.LEVELS) else levels,
+            "tags": tags or None,
+            "pids": pids or None,
+            "pattern": pattern,
+        }
+    
+    def apply_filters(self):
+        """过滤条件变化后在后台重新查询"""
+        filters = self.read_filters()
+        if filters is None:
+            return
+        self.filters = filters
+        self.query_id += 1
+        self.querying = True
+        query_id = self.query_id
+        end = self.buffer.next_seq
+        
+        def run():
+            start = time.perf_counter()
+            rows = self.buffer.query(limit=self.display_lines, end_seq=end, **filters)
+            elapsed = time.perf_counter() - start
+            self.app.run_on_ui_thread(self.show_query, query_id, rows, end, elapsed)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def show_query(self, query_id, rows, end, elapsed):
+        """显示后台查询结果"""
+        if query_id != self.query_id or not self.window.winfo_exists():
+            return
+        self.querying = False
+        self.shown_seq = end
+        self.text.delete("1.0", tk.END)
+        self.render(rows)
+        self.status_var.set(f"过滤完成: 匹配 {len(rows)} 行，耗时 {elapsed * 1000:.1f} ms")
+    
+    def render(self, rows):
+        """追加显示若干行，相同级别的相邻行合并为一次插入"""
+        if not rows:
+            return
+        follow = self.follow_var.get() and self.text.yview()[1] >= 0.999
+        arguments = []
+        current_tag, current_lines = None, []
+        for _, level, line in rows:
+            tag = level if level in self.LEVEL_COLORS else ""
+            if tag != current_tag and current_lines:
+                arguments += ["\n".join(current_lines) + "\n", current_tag]
+                current_lines = []
+            current_tag = tag
+            current_lines.append(line)
+        arguments += ["\n".join(current_lines) + "\n", current_tag]
+        self.text.insert(tk.END, *arguments)
+        
+        line_count = int(self.text.index("end-1c").split(".")[0]) - 1
+        excess = line_count - self.display_lines
+        if excess > 0:
+            self.text.delete("1.0", f"{excess + 1}.0")
+        if follow:
+            self.text.see(tk.END)
+    
+    def show_record(self, event):
+        """双击某行时在状态栏显示解析出的字段"""
+        line = self.text.get(f"@{event.x},{event.y} linestart", f"@{event.x},{event.y} lineend")
+        match = HilogBuffer.LINE_PATTERN.match(line)
+        if match:
+            month, day, hour, minute, second, pid, tid, level, domain, tag = match.groups()
+            self.status_var.set(f"时间 {month}-{day} {hour}:{minute}:{second}  PID {pid}  TID {tid}  "
+                                f"级别 {level}  Domain {domain}  Tag {tag}")
+    
+    def _schedule(self):
+        self._timer = self.window.after(self.REFRESH_INTERVAL, self._tick)
+    
+    def _tick(self):
+        try:
+            # 后台查询进行中时先不追加，查询结果到达后从其结束位置继续
+            if not self.querying:
+                end = self.buffer.next_seq
+                if end > self.shown_seq:
+                    rows = self.buffer.query(limit=self.display_lines, start_seq=self.shown_seq,
+                                             end_seq=end, **self.filters)
+                    self.shown_seq = end
+                    if len(rows) >= self.display_lines:
+                        self.text.delete("1.0", tk.END)
+                    self.render(rows)
+            self.update_status()
+        finally:
+            self._schedule()
+    
+    def update_status(self):
+        """每秒更新一次接收速率"""
+        now = time.perf_counter()
+        start_time, start_seq = self._rate_start
+        if now - start_time < 1.0:
+            return
+        rate = (self.buffer.next_seq - start_seq) / (now - start_time)
+        self._rate_start = (now, self.buffer.next_seq)
+        state = "读取中" if self.stream and self.stream.running else "已停止"
+        self.status_var.set(f"{state}: 缓冲 {len(self.buffer)}/{self.buffer.capacity} 行，"
+                            f"共接收 {self.buffer.next_seq} 行，{rate:,.0f} 行/秒")
+    
+    def close(self):
+        """关闭窗口并结束 hilog 进程"""
+        if self.stream:
+            self.stream.stop()
+        if self._timer is not None:
+            self.window.after_cancel(self._timer)
+            self._timer = None
+        self.window.destroy()
+        self.app.hilog_viewer = None
+
+class ScreenViewer:
+    """设备屏幕镜像窗口，显示 ScreenStream 的最新帧和实测帧率"""
+    
+    REFRESH_INTERVAL = 15
+    
+    def __init__(self, app, target=""):
+        self.app = app
+        self.stream = None
+        self.frame = None
+        self.photo = None
+        self.render_times = collections.deque(maxlen=30)
+        self._timer = None
+        
+        self.window = tk.Toplevel(app.root)
+        self.window.title("屏幕镜像")
+        self.window.geometry("460x900")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        top = ttk.Frame(self.window, padding="5")
+        top.pack(fill=tk.X)
+        ttk.Label(top, text="设备:").pack(side=tk.LEFT)
+        self.target_var = tk.StringVar(value=target or app.target_var.get())
+        target_box = ttk.Combobox(top, textvariable=self.target_var, width=18, values=app.device_keys())
+        target_box.configure(postcommand=lambda: target_box.configure(values=app.device_keys()))
+        target_box.pack(side=tk.LEFT, padx=5)
+        self.start_button = ttk.Button(top, text="开始", width=6, command=self.toggle_stream)
+        self.start_button.pack(side=tk.LEFT)
+        ttk.Label(top, text="FPS:").pack(side=tk.LEFT, padx=(10, 0))
+        self.fps_var = tk.StringVar(value=str(app.config.get("screen_fps", 5)))
+        fps_box = ttk.Spinbox(top, from_=1, to=30, width=4, textvariable=self.fps_var, command=self.update_fps)
+        fps_box.pack(side=tk.LEFT, padx=5)
+        fps_box.bind('<Return>', lambda e: self.update_fps())
+        ttk.Button(top, text="保存截图", command=self.save_frame).pack(side=tk.LEFT)
+        
+        self.canvas = tk.Canvas(self.window, background="black", highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.image_item = self.canvas.create_image(0, 0, anchor=tk.CENTER)
+        self.overlay = self.canvas.create_text(6, 6, anchor=tk.NW, fill="#00ff00", font=("Consolas", 10))
+        self.canvas.bind('<Configure>', self.on_resize)
+        
+        self.status_var = tk.StringVar(
+            value="" if load_pillow() else "未安装Pillow，使用PNG截图，帧率较低（pip install pillow）")
+        ttk.Label(self.window, textvariable=self.status_var, padding="5").pack(fill=tk.X)
+    
+    def toggle_stream(self):
+        """开始或停止镜像"""
+        if self.stream and self.stream.running:
+            self.stream.stop()
+            self.start_button.config(text="开始")
+            return
+        self.stream = ScreenStream(self.app.hdc_util, self.target_var.get().strip(), self.read_fps())
+        self.stream.view_size = self.view_size()
+        self.stream.start()
+        self.render_times.clear()
+        self.start_button.config(text="停止")
+        if self._timer is None:
+            self._tick()
+    
+    def read_fps(self):
+        try:
+            return min(30.0, max(1.0, float(self.fps_var.get())))
+        except ValueError:
+            return 5.0
+    
+    def update_fps(self):
+        if self.stream:
+            self.stream.fps = self.read_fps()
+        self.app.config.set("screen_fps", self.read_fps())
+    
+    def view_size(self):
+        """画布大小，窗口尚未显示时为None"""
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        return (width, height) if width > 1 and height > 1 else None
+    
+    def on_resize(self, event):
+        self.canvas.coords(self.image_item, event.width // 2, event.height // 2)
+        if self.stream:
+            self.stream.view_size = self.view_size()
+    
+    def _tick(self):
+        self._timer = None
+        if self.stream is None:
+            return
+        try:
+            frame = self.stream.frames.get_nowait()
+        except queue.Empty:
+            frame = None
+        try:
+            if frame is not None:
+                self.render(frame)
+            self.update_overlay()
+        finally:
+            if self.stream.running or not self.stream.frames.empty():
+                self._timer = self.window.after(self.REFRESH_INTERVAL, self._tick)
+    
+    def render(self, frame):
+        """显示一帧（PhotoImage 只能在Tk线程中创建）"""
+        if frame.image is not None:
+            self.photo = ImageTk.PhotoImage(frame.image)
+        else:
+            photo = tk.PhotoImage(data=base64.b64encode(frame.data).decode("ascii"))
+            size = self.view_size()
+            factor = 1
+            if size:
+                factor = max(1, math.ceil(max(photo.width() / size[0], photo.height() / size[1])))
+            self.photo = photo.subsample(factor) if factor > 1 else photo
+        self.canvas.itemconfig(self.image_item, image=self.photo)
+        self.frame = frame
+        self.render_times.append(time.perf_counter())
+    
+    def update_overlay(self):
+        """叠加显示实测帧率、端到端延迟和各阶段耗时"""
+        stream = self.stream
+        fps = 0.0
+        if len(self.render_times) > 1:
+            fps = (len(self.render_times) - 1) / max(self.render_times[-1] - self.render_times[0], 1e-6)
+        text = f"FPS {fps:.1f} / {stream.fps:g}  丢帧 {stream.dropped}"
+        frame = self.frame
+        # 重新开始后、新一帧显示之前没有渲染时间，不显示延迟
+        if frame is not None and self.render_times:
+            latency = self.render_times[-1] - frame.captured_at
+            text += (f"\n延迟 {latency * 1000:.0f} ms  截图 {frame.capture_time * 1000:.0f} ms  "
+                     f"传输 {frame.pull_time * 1000:.0f} ms  解码 {frame.decode_time * 1000:.0f} ms")
+        self.canvas.itemconfig(self.overlay, text=text)
+        if stream.error:
+            self.status_var.set(stream.error[:120])
+    
+    def save_frame(self):
+        """保存最近显示的一帧原图"""
+        if self.frame is None:
+            return
+        extension = "." + self.stream.extension
+        file_path = filedialog.asksaveasfilename(
+            parent=self.window,
+            title="保存截图",
+            defaultextension=extension,
+            initialfile=datetime.datetime.now().strftime("screen-%Y%m%d-%H%M%S") + extension,
+            filetypes=[("图片", "*" + extension)]
+        )
+        if not file_path:
+            return
+        try:
+            with open(file_path, 'wb') as f:
+                f.write(self.frame.data)
+            self.status_var.set(f"已保存到: {file_path}")
+        except Exception as e:
+            messagebox.showerror("错误", f"保存失败: {e}", parent=self.window)
+    
+    def close(self):
+        """关闭窗口并停止采集"""
+        if self.stream:
+            self.stream.stop()
+        if self._timer is not None:
+            self.window.after_cancel(self._timer)
+            self._timer = None
+        self.window.destroy()
+        self.app.screen_viewer = None
+
+class CompletionPopup:
+    """输入框下方的补全列表（命令历史、包名）
+
+    complete(text, limit) 返回建议列表，on_accept(建议) 在采用时调用。
+    """
+    
+    MAX_ITEMS = 8
+    
+    def __init__(self, entry, complete, on_accept):
+        self.entry = entry
+        self.complete = complete
+        self.on_accept = on_accept
+        self.window = None
+        self.listbox = None
+    
+    @property
+    def visible(self):
+        return self.window is not None
+    
+    def update(self, text):
+        """按输入内容刷新建议，没有建议时隐藏"""
+        suggestions = [c for c in self.complete(text, self.MAX_ITEMS + 1) if c != text][:self.MAX_ITEMS] if text else []
+        if not suggestions:
+            self.hide()
+            return
+        if self.window is None:
+            self.window = tk.Toplevel(self.entry)
+            self.window.overrideredirect(True)
+            self.listbox = tk.Listbox(self.window, activestyle="none", exportselection=False)
+            self.listbox.pack(fill=tk.BOTH, expand=True)
+            self.listbox.bind('<ButtonRelease-1>', lambda e: self.accept())
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *suggestions)
+        self.listbox.configure(height=len(suggestions))
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self.window.geometry(f"{self.entry.winfo_width()}x{self.listbox.winfo_reqheight()}+{x}+{y}")
+    
+    def move(self, delta):
+        """上下移动选中项"""
+        selection = self.listbox.curselection()
+        index = (selection[0] + delta) if selection else (0 if delta > 0 else self.listbox.size() - 1)
+        index = max(0, min(index, self.listbox.size() - 1))
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+    
+    def accept(self):
+        """采用选中的建议，没有选中项时返回False"""
+        if not self.visible or not self.listbox.curselection():
+            return False
+        self.on_accept(self.listbox.get(self.listbox.curselection()[0]))
+        self.hide()
+        return True
+    
+    def hide(self):
+        if self.window is not None:
+            self.window.destroy()
+            self.window = None
+            self.listbox = None
+
+class HistorySearchDialog:
+    """命令历史模糊搜索窗口（Ctrl+R）"""
+    
+    MAX_RESULTS = 200
+    
+    def __init__(self, app):
+        self.app = app
+        self.window = tk.Toplevel(app.root)
+        self.window.title("搜索命令历史")
+        self.window.geometry("600x360")
+        self.window.transient(app.root)
+        
+        self.query_var = tk.StringVar()
+        entry = ttk.Entry(self.window, textvariable=self.query_var)
+        entry.pack(fill=tk.X, padx=5, pady=5)
+        self.listbox = tk.Listbox(self.window, activestyle="none")
+        self.listbox.pack(fill=tk.BOTH, expand=True, padx=5)
+        self.status_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.status_var, padding="5").pack(fill=tk.X)
+        
+        self.query_var.trace_add("write", lambda *args: self.search())
+        entry.bind('<Return>', lambda e: self.accept())
+        entry.bind('<Up>', lambda e: self.move(-1))
+        entry.bind('<Down>', lambda e: self.move(1))
+        entry.bind('<Control-r>', lambda e: self.move(1))
+        self.window.bind('<Escape>', lambda e: self.window.destroy())
+        self.listbox.bind('<Double-1>', lambda e: self.accept())
+        
+        entry.insert(0, app.command_var.get())
+        entry.focus_set()
+        self.search()
+    
+    def search(self):
+        """按输入内容模糊搜索"""
+        start = time.perf_counter()
+        results = self.app.command_history.fuzzy_search(self.query_var.get(), self.MAX_RESULTS)
+        elapsed = time.perf_counter() - start
+        self.listbox.delete(0, tk.END)
+        if results:
+            self.listbox.insert(tk.END, *results)
+            self.listbox.selection_set(0)
+        self.status_var.set(f"共 {len(self.app.command_history)} 条历史，匹配 {len(results)} 条，耗时 {elapsed * 1000:.1f} ms")
+    
+    def move(self, delta):
+        selection = self.listbox.curselection()
+        if not self.listbox.size():
+            return "break"
+        index = max(0, min((selection[0] if selection else -1) + delta, self.listbox.size() - 1))
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+        return "break"
+    
+    def accept(self):
+        """把选中的命令填入命令输入框"""
+        selection = self.listbox.curselection()
+        if selection:
+            self.app.command_var.set(self.listbox.get(selection[0]))
+            self.app.command_entry.icursor(tk.END)
+        self.window.destroy()
+        self.app.command_entry.focus_set()
+
+class StatsDialog:
+    """命令执行统计窗口，按命令类别显示耗时分位数"""
+    
+    REFRESH_INTERVAL = 2000
+    COLUMNS = (
+        ("verb", "命令", 200),
+        ("count", "次数", 60),
+        ("errors", "失败", 50),
+        ("p50", "p50(ms)", 70),
+        ("p95", "p95(ms)", 70),
+        ("p99", "p99(ms)", 70),
+        ("max", "最大(ms)", 70),
+        ("spawn_p50", "启动p50(ms)", 80),
+        ("ttfb_p50", "首字节p50(ms)", 90),
+        ("stdout_bytes", "输出字节", 90),
+    )
+    
+    def __init__(self, app):
+        self.app = app
+        self.window = tk.Toplevel(app.root)
+        self.window.title("执行统计")
+        self.window.geometry("920x360")
+        
+        top = ttk.Frame(self.window, padding="5")
+        top.pack(fill=tk.X)
+        ttk.Button(top, text="刷新", command=self.refresh).pack(side=tk.LEFT)
+        ttk.Button(top, text="清空", command=self.reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top, text="导出Prometheus", command=lambda: self.export(".prom")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top, text="导出JSON", command=lambda: self.export(".json")).pack(side=tk.LEFT)
+        
+        table_frame = ttk.Frame(self.window, padding="5")
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=[c[0] for c in self.COLUMNS], show="headings")
+        for key, title, width in self.COLUMNS:
+            self.tree.heading(key, text=title)
+            self.tree.column(key, width=width, stretch=(key == "verb"),
+                             anchor=tk.W if key == "verb" else tk.E)
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.status_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.status_var, padding="5").pack(fill=tk.X)
+        
+        self._timer = None
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.refresh()
+    
+    def refresh(self):
+        """重新读取统计数据"""
+        if self._timer is not None:
+            self.window.after_cancel(self._timer)
+        rows = metrics.summary()
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            values = []
+            for key, _, _ in self.COLUMNS:
+                value = row[key]
+                if key in ("p50", "p95", "p99", "max", "spawn_p50", "ttfb_p50"):
+                    value = "" if value is None else f"{value * 1000:.1f}"
+                values.append(value)
+            self.tree.insert("", tk.END, values=values)
+        total = sum(row["count"] for row in rows)
+        self.status_var.set(f"共 {len(rows)} 类命令，{total} 次调用（分位数为对数分桶估算值）")
+        self._timer = self.window.after(self.REFRESH_INTERVAL, self.refresh)
+    
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+    
+    def export(self, extension):
+        """导出为 Prometheus 文本或 JSON"""
+        file_path = filedialog.asksaveasfilename(
+            parent=self.window,
+            title="导出统计",
+            defaultextension=extension,
+            filetypes=[("JSON", "*.json")] if extension == ".json" else [("Prometheus", "*.prom"), ("文本文件", "*.txt")]
+        )
+        if not file_path:
+            return
+        try:
+            metrics.export(file_path)
+            self.status_var.set(f"已导出到: {file_path}")
+        except Exception as e:
+            messagebox.showerror("错误", f"导出失败: {e}", parent=self.window)
+    
+    def close(self):
+        if self._timer is not None:
+            self.window.after_cancel(self._timer)
+            self._timer = None
+        self.window.destroy()
+
+class DeviceInfoDialog:
+    """设备信息窗口：并行采集所有已连接设备的信息"""
+    
+    COLUMNS = (
+        ("connect_key", "connect key", 150),
+        ("model", "型号", 90),
+        ("os_version", "系统版本", 160),
+        ("api_level", "API", 40),
+        ("udid", "UDID", 200),
+        ("storage", "存储(已用/总计)", 120),
+        ("battery", "电池", 110),
+        ("duration", "耗时(ms)", 70),
+    )
+    
+    def __init__(self, app):
+        self.app = app
+        self.infos = []
+        self.window = tk.Toplevel(app.root)
+        self.window.title("设备信息")
+        self.window.geometry("960x320")
+        
+        top = ttk.Frame(self.window, padding="5")
+        top.pack(fill=tk.X)
+        ttk.Button(top, text="刷新", command=self.refresh).pack(side=tk.LEFT)
+        ttk.Button(top, text="导出CSV", command=lambda: self.export(".csv")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top, text="导出JSON", command=lambda: self.export(".json")).pack(side=tk.LEFT)
+        
+        table_frame = ttk.Frame(self.window, padding="5")
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=[c[0] for c in self.COLUMNS], show="headings")
+        for key, title, width in self.COLUMNS:
+            self.tree.heading(key, text=title)
+            self.tree.column(key, width=width, stretch=key in ("os_version", "udid"))
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.status_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.status_var, padding="5").pack(fill=tk.X)
+        self.refresh()
+    
+    @staticmethod
+    def row(info: DeviceInfo):
+        gb = 1024 * 1024
+        storage = ""
+        if info.storage_total_kb:
+            storage = f"{info.storage_used_kb / gb:.1f}/{info.storage_total_kb / gb:.1f} GB"
+        battery = ""
+        if info.battery_level is not None:
+            battery = f"{info.battery_level}% {info.battery_status}"
+        values = {
+            "connect_key": info.connect_key,
+            "model": info.model or info.error,
+            "os_version": info.os_version or info.os_fullname,
+            "api_level": info.api_level,
+            "udid": info.udid,
+            "storage": storage,
+            "battery": battery,
+            "duration": f"{info.duration * 1000:.0f}",
+        }
+        return [values[key] for key, _, _ in DeviceInfoDialog.COLUMNS]
+    
+    def refresh(self):
+        """在后台线程中采集，结果逐台显示"""
+        self.tree.delete(*self.tree.get_children())
+        self.infos = []
+        self.status_var.set("正在采集...")
+        collector = DeviceInfoCollector(self.app.hdc_util, self.app.config.get("fanout_max_workers", 8))
+        
+        def on_result(info):
+            self.app.run_on_ui_thread(lambda: self.add(info))
+        
+        def run():
+            start = time.perf_counter()
+            targets = [d.connect_key for d in self.app.device_registry.devices(wait=True) if d.connected]
+            infos = collector.collect_all(targets, on_result)
+            elapsed = time.perf_counter() - start
+            self.app.run_on_ui_thread(
+                lambda: self.status_var.set(f"共 {len(infos)} 台设备，耗时 {elapsed:.2f} 秒"))
+        
+        self.app.engine.run_in_executor(run)
+    
+    def add(self, info):
+        if not self.window.winfo_exists():
+            return
+        self.infos.append(info)
+        self.tree.insert("", tk.END, values=self.row(info))
+    
+    def export(self, extension):
+        """导出为 CSV 或 JSON"""
+        file_path = filedialog.asksaveasfilename(
+            parent=self.window,
+            title="导出设备信息",
+            defaultextension=extension,
+            filetypes=[("CSV", "*.csv")] if extension == ".csv" else [("JSON", "*.json")]
+        )
+        if not file_path:
+            return
+        try:
+            DeviceInfoCollector.export(self.infos, file_path)
+            self.status_var.set(f"已导出到: {file_path}")
+        except Exception as e:
+            messagebox.showerror("错误", f"导出失败: {e}", parent=self.window)
+
+class MacroDialog:
+    """命令宏窗口：打开宏文件，按依赖关系执行并显示每步的状态和耗时"""
     
-    def run_exe(self, exe_path, arguments=""):
-        """使用指定的exe文件执行命令"""
-        output = []
+    COLUMNS = (
+        ("id", "步骤", 110),
+        ("depends", "依赖", 110),
+        ("target", "设备", 120),
+        ("status", "状态", 70),
+        ("start", "开始(s)", 60),
+        ("duration", "耗时(s)", 60),
+        ("message", "命令 / 信息", 360),
+    )
+    STATUS_TEXT = {"pending": "等待", "running": "执行中", "ok": "成功", "failed": "失败",
+                   "timeout": "超时", "skipped": "已跳过"}
+    
+    def __init__(self, app):
+        self.app = app
+        self.macro = None
+        self.running = False
+        self.window = tk.Toplevel(app.root)
+        self.window.title("命令宏")
+        self.window.geometry("900x420")
+        
+        top = ttk.Frame(self.window, padding="5")
+        top.pack(fill=tk.X)
+        ttk.Button(top, text="打开宏文件", command=self.open_file).pack(side=tk.LEFT)
+        self.run_button = ttk.Button(top, text="运行", command=self.run, state=tk.DISABLED)
+        self.run_button.pack(side=tk.LEFT, padx=5)
+        self.path_var = tk.StringVar(value="未打开")
+        ttk.Label(top, textvariable=self.path_var).pack(side=tk.LEFT, padx=5)
+        
+        table_frame = ttk.Frame(self.window, padding="5")
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=[c[0] for c in self.COLUMNS], show="headings")
+        for key, title, width in self.COLUMNS:
+            self.tree.heading(key, text=title)
+            self.tree.column(key, width=width, stretch=(key == "message"))
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.status_var = tk.StringVar(value="宏为JSON文件（安装了PyYAML时也可以是YAML），格式见readme")
+        ttk.Label(self.window, textvariable=self.status_var, padding="5").pack(fill=tk.X)
+    
+    def open_file(self):
+        """选择并解析宏文件"""
+        file_path = filedialog.askopenfilename(
+            parent=self.window,
+            title="选择宏文件",
+            filetypes=[("宏文件", "*.json *.yaml *.yml"), ("所有文件", "*.*")]
+        )
+        if not file_path:
+            return
         try:
-            process = subprocess.Popen(
-                [exe_path] + arguments.split() if arguments else [exe_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
-            
-            stdout, stderr = process.communicate()
-            
-            if stdout:
-                output.extend(stdout.split('\n'))
-            
-            if stderr:
-                output.append(f"ERROR: {stderr}")
-                
+            self.macro = Macro.load(file_path)
         except Exception as e:
-            logger.error(f"执行exe失败: {e}")
-            output.append(f"ERROR: {e}")
-            
-        return '\n'.join(output)
+            messagebox.showerror("错误", f"读取宏失败: {e}", parent=self.window)
+            return
+        self.path_var.set(file_path)
+        self.tree.delete(*self.tree.get_children())
+        for step in self.macro.steps:
+            target = step.target if step.target is not None else self.macro.target
+            self.tree.insert("", tk.END, iid=step.id, values=(
+                step.id, ",".join(step.depends_on), target or "默认", self.STATUS_TEXT["pending"], "", "",
+                step.command))
+        self.run_button.config(state=tk.NORMAL)
+        self.status_var.set(f"{self.macro.name}: 共 {len(self.macro.steps)} 步")
+    
+    def run(self):
+        """在后台线程中执行宏"""
+        if self.running or self.macro is None:
+            return
+        macro = self.macro
+        self.running = True
+        self.run_button.config(state=tk.DISABLED)
+        self.status_var.set(f"正在执行 {macro.name}...")
+        self.app.append_result(f"执行宏: {macro.name}（{len(macro.steps)} 步）")
+        runner = MacroRunner(self.app.engine, self.app.target_var.get().strip())
+        
+        def on_step(step):
+            self.app.run_on_ui_thread(self.update_row, StepResult(**vars(step)))
+            if step.status not in ("pending", "running"):
+                self.app.append_result(f"[{step.id}] {self.STATUS_TEXT[step.status]} {step.duration:.2f} 秒"
+                                       + (f": {step.message}" if step.message else ""))
+                if step.output:
+                    self.app.append_result(step.output)
+        
+        def run():
+            result = runner.run(macro, on_step=on_step)
+            self.app.run_on_ui_thread(self.finish, result)
+        
+        threading.Thread(target=run, daemon=True).start()
     
-    def export_file(self, origin_path):
-        """导出文件"""
-        formatted_date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-        HdcUtil.run_cmd(f"mkdir {formatted_date}")
-        command = f"file recv {origin_path} ./{formatted_date}"
-        return self.run_exe(self.hdc_path, command)
+    def update_row(self, step):
+        if not self.window.winfo_exists() or not self.tree.exists(step.id):
+            return
+        values = list(self.tree.item(step.id, "values"))
+        values[3] = self.STATUS_TEXT[step.status]
+        if step.status != "pending":
+            values[4] = f"{step.start:.2f}"
+        if step.status not in ("pending", "running", "skipped"):
+            values[5] = f"{step.duration:.2f}"
+        values[6] = step.message or step.command or values[6]
+        self.tree.item(step.id, values=values)
     
-    def run_command(self, command):
-        """运行hdc命令"""
-        return self.run_exe(self.hdc_path, command)
+    def finish(self, result):
+        self.running = False
+        summary = (f"宏 {result.name} {'执行成功' if result.ok else '执行失败'}，总耗时 {result.duration:.2f} 秒"
+                   f"（各步耗时合计 {sum(s.duration for s in result.steps):.2f} 秒）")
+        self.app.append_result(summary)
+        if self.window.winfo_exists():
+            self.run_button.config(state=tk.NORMAL)
+            self.status_var.set(summary)
 
-class CommandHistory:
-    """命令历史管理"""
+class PackageUninstallDialog:
+    """批量卸载窗口：从包名索引中过滤、多选后依次卸载"""
     
-    def __init__(self, max_history=50):
-        self.max_history = max_history
-        self.history = []
-        self.current_index = -1
+    def __init__(self, app):
+        self.app = app
+        self.index = app.package_index
+        self.window = tk.Toplevel(app.root)
+        self.window.title("批量卸载")
+        self.window.geometry("520x560")
+        
+        top = ttk.Frame(self.window, padding="5")
+        top.pack(fill=tk.X)
+        ttk.Label(top, text="设备:").pack(side=tk.LEFT)
+        self.target_var = tk.StringVar(value=app.selected_target())
+        target_box = ttk.Combobox(top, textvariable=self.target_var, width=22,
+                                  values=[""] + app.device_keys(connected_only=True))
+        target_box.configure(postcommand=lambda: target_box.configure(
+            values=[""] + app.device_keys(connected_only=True)))
+        target_box.pack(side=tk.LEFT, padx=5)
+        target_box.bind('<<ComboboxSelected>>', lambda e: self.refresh(force=False))
+        ttk.Button(top, text="刷新", command=self.refresh).pack(side=tk.LEFT)
+        
+        filter_frame = ttk.Frame(self.window, padding=(5, 0, 5, 5))
+        filter_frame.pack(fill=tk.X)
+        ttk.Label(filter_frame, text="过滤:").pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar()
+        filter_entry = ttk.Entry(filter_frame, textvariable=self.filter_var)
+        filter_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        filter_entry.bind('<KeyRelease>', lambda e: self.apply_filter())
+        filter_entry.focus_set()
+        
+        list_frame = ttk.Frame(self.window, padding="5")
+        list_frame.pack(fill=tk.BOTH, expand=True)
+        self.listbox = tk.Listbox(list_frame, selectmode=tk.EXTENDED)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.listbox.yview)
+        self.listbox.configure(yscrollcommand=scrollbar.set)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        bottom = ttk.Frame(self.window, padding="5")
+        bottom.pack(fill=tk.X)
+        self.status_var = tk.StringVar()
+        ttk.Label(bottom, textvariable=self.status_var).pack(side=tk.LEFT)
+        self.uninstall_button = ttk.Button(bottom, text="卸载选中", command=self.uninstall_selected)
+        self.uninstall_button.pack(side=tk.RIGHT)
+        
+        self.refresh(force=False)
     
-    def add_command(self, command):
-        """添加命令到历史"""
-        if command and command not in self.history:
-            self.history.append(command)
-            if len(self.history) > self.max_history:
-                self.history.pop(0)
-        self.current_index = len(self.history)
+    def refresh(self, force=True):
+        """在后台重新获取应用列表，完成后刷新显示"""
+        target = self.target_var.get().strip()
+        self.status_var.set("正在获取应用列表...")
+        
+        def run():
+            if force or not self.index.packages(target):
+                self.index.refresh(target)
+            self.app.run_on_ui_thread(self.apply_filter)
+        
+        threading.Thread(target=run, daemon=True).start()
     
-    def get_previous(self):
-        """获取上一条命令"""
-        if self.history and self.current_index > 0:
-            self.current_index -= 1
-            return self.history[self.current_index]
-        return ""
+    def apply_filter(self):
+        """按过滤条件显示（只查询本地索引）"""
+        if not self.window.winfo_exists():
+            return
+        target = self.target_var.get().strip()
+        names = self.index.search(target, self.filter_var.get().strip(), limit=100000)
+        self.listbox.delete(0, tk.END)
+        if names:
+            self.listbox.insert(tk.END, *names)
+        self.status_var.set(f"显示 {len(names)} / {len(self.index.packages(target))} 个应用")
     
-    def get_next(self):
-        """获取下一条命令"""
-        if self.history and self.current_index < len(self.history) - 1:
-            self.current_index += 1
-            return self.history[self.current_index]
-        return ""
+    def uninstall_selected(self):
+        """卸载选中的应用"""
+        names = [self.listbox.get(i) for i in self.listbox.curselection()]
+        if not names:
+            messagebox.showwarning("警告", "请选择要卸载的应用", parent=self.window)
+            return
+        preview = "\n".join(names[:10]) + (f"\n... 共 {len(names)} 个" if len(names) > 10 else "")
+        if not messagebox.askyesno("确认", f"确定卸载以下应用吗？\n{preview}", parent=self.window):
+            return
+        target = self.target_var.get().strip()
+        self.uninstall_button.config(state=tk.DISABLED)
+        
+        def run():
+            removed = []
+            for name in names:
+                result = self.app.hdc_util.execute(f"uninstall {name}", target)
+                ok = BatchInstaller.install_succeeded(result)
+                if ok:
+                    removed.append(name)
+                self.app.append_result(f"卸载 {name}: {'成功' if ok else result.output.strip()}")
+            self.index.remove(target, removed)
+            self.app.append_result(f"批量卸载完成: 成功 {len(removed)} 个，失败 {len(names) - len(removed)} 个")
+            self.app.run_on_ui_thread(self.finish)
+        
+        threading.Thread(target=run, daemon=True).start()
     
-    def get_recent(self, count=10):
-        """获取最近的命令"""
-        return self.history[-count:] if self.history else []
+    def finish(self):
+        if self.window.winfo_exists():
+            self.uninstall_button.config(state=tk.NORMAL)
+            self.apply_filter()
 
 class HarmonyDevTools:
     """Harmony开发工具主界面"""
     
-    def __init__(self, root):
+    def __init__(self, root, profiler=None):
         self.root = root
-        self.config = Config()
-        self.hdc_util = HdcUtil()
-        self.command_history = CommandHistory()
+        self.profiler = profiler or StartupProfiler()
+        with self.profiler.phase("加载配置"):
+            self.config = Config()
+        with self.profiler.phase("HdcUtil初始化"):
+            self.hdc_util = HdcUtil()
+            self.hdc_util.shell_timeout = self.config.get("command_timeout", 300) or None
+        self.command_history = CommandHistory(self.config.get("history_max_entries", 100000))
+        self._ui_calls = queue.SimpleQueue()
+        self.device_registry = DeviceRegistry(self.hdc_util, self.config.get("device_poll_interval", 3.0))
+        self.engine = AsyncHdcEngine(self.hdc_util, self.config.get("engine_max_concurrency", 16))
+        self.engine.start()
+        self.query_cache = QueryCache(self.config.get("query_cache_commands", []),
+                                      self.config.get("query_cache_ttl", 600),
+                                      self.config.get("query_cache_max_entries", 256))
+        self.hilog_viewer = None
+        self.screen_viewer = None
+        self.install_cache = InstallCache()
+        self.package_index = PackageIndex(self.hdc_util, self.config.get("package_index_ttl", 300))
         
         # 设置窗口
-        self.setup_window()
-        self.setup_menu()
-        self.setup_ui()
-        self.setup_bindings()
+        with self.profiler.phase("构建界面"):
+            self.setup_window()
+            self.setup_menu()
+            self.setup_ui()
+            self.setup_bindings()
         
         # 加载配置
         self.load_config()
         
-    def setup_window(self):
-        """设置窗口"""
-        self.root.title("HDC Tools")
-        self.root.minsize(970, 600)    # 最小大小限制
-        self.root.resizable(False, True)  # 允许水平 & 垂直拉伸
-        center_window(self.root, 970, 600)  # 初始化居中
+        self._process_ui_calls()
+        self.device_registry.subscribe(self.on_device_event)
+        self.device_registry.subscribe(self.query_cache.on_device_event)
+        self.device_registry.subscribe(self.package_index.on_device_event)
         
-        # 设置图标（如果存在）
+        # 非关键的初始化推迟到窗口显示之后
+        self.root.after_idle(self.on_first_idle)
+    
+    def on_first_idle(self):
+        """窗口首次空闲（已显示）后执行的延迟初始化"""
+        self.profiler.record("首次空闲", time.perf_counter() - self.profiler.mainloop_start)
+        self.profiler.report()
+        
+        attach_file_log_handler()
+        self.load_icon()
+        
+        def background_init():
+            # 查找hdc后再开始后台轮询设备
+            start = time.perf_counter()
+            _ = self.hdc_util.hdc_path
+            duration = time.perf_counter() - start
+            self.profiler.record("查找hdc（后台）", duration)
+            self.device_registry.start()
+            if self.profiler.enabled:
+                print(f"  {duration * 1000:8.1f} ms  查找hdc（后台）", flush=True)
+            self.load_command_history()
+        
+        threading.Thread(target=background_init, name="startup", daemon=True).start()
+    
+    def load_command_history(self):
+        """加载命令历史；历史文件不存在时从配置中的最近命令导入"""
+        if not self.command_history.load():
+            for command in self.config.get("recent_commands", []):
+                self.command_history.add_command(command)
+    
+    def load_icon(self):
+        """设置图标（如果存在）"""
         try:
             if os.path.exists("icon.ico"):
                 self.root.iconbitmap("icon.ico")
         except:
             pass
+        
+    def setup_window(self):
+        """设置窗口"""
+        self.root.title("HDC Tools")
+        self.root.minsize(970, 600)    # 最小大小限制
+        self.root.resizable(False, True)  # 允许水平 & 垂直拉伸
+        center_window(self.root, 970, 600)  # 初始化居中
     
     def setup_menu(self):
         """设置菜单栏"""
@@ -288,6 +5386,16 @@ class HarmonyDevTools:
         # 工具菜单
         tools_menu = Menu(menubar, tearoff=0)
         menubar.add_cascade(label="工具", menu=tools_menu)
+        tools_menu.add_command(label="多设备执行", command=self.open_fan_out)
+        tools_menu.add_command(label="批量安装", command=self.open_batch_install)
+        tools_menu.add_command(label="命令宏", command=self.open_macro)
+        tools_menu.add_command(label="推送文件夹", command=self.send_folder)
+        tools_menu.add_command(label="hilog 日志", command=self.open_hilog_viewer)
+        tools_menu.add_command(label="屏幕镜像", command=self.open_screen_viewer)
+        tools_menu.add_command(label="设备信息", command=self.open_device_info)
+        tools_menu.add_command(label="执行统计", command=self.open_stats)
+        tools_menu.add_command(label="清空查询缓存", command=self.clear_query_cache)
+        tools_menu.add_separator()
         tools_menu.add_command(label="清理HDC进程", command=self.kill_hdc_processes)
         tools_menu.add_command(label="检查HDC状态", command=self.check_hdc_status)
         tools_menu.add_separator()
@@ -317,7 +5425,7 @@ class HarmonyDevTools:
             row=row, column=0, padx=(0, 5), pady=5)
         
         self.target_var = tk.StringVar()
-        target_entry = ttk.Entry(main_frame, textvariable=self.target_var, width=30)
+        target_entry = ttk.Combobox(main_frame, textvariable=self.target_var, width=30)
         target_entry.grid(row=row, column=1, columnspan=2, padx=5, pady=5, sticky=(tk.W, tk.E))
         
         ttk.Button(main_frame, text="连接设备", width=12, command=self.connect_device).grid(
@@ -326,8 +5434,9 @@ class HarmonyDevTools:
         ttk.Button(main_frame, text="重启hdc", width=12, command=self.restart_hdc).grid(
             row=row, column=4, padx=5, pady=5)
         
-        ttk.Button(main_frame, text="版本信息", width=12, command=self.check_version).grid(
-            row=row, column=5, padx=(5, 0), pady=5)
+        version_button = ttk.Button(main_frame, text="版本信息", width=12)
+        version_button.grid(row=row, column=5, padx=(5, 0), pady=5)
+        self.bind_refresh_click(version_button, self.check_version)
         
         # 第二行：安装操作
         row += 1
@@ -336,6 +5445,8 @@ class HarmonyDevTools:
         
         ttk.Button(install_frame, text="安装hap", width=12, command=self.install_hap).pack(side=tk.LEFT)
         
+        ttk.Button(install_frame, text="批量安装", width=10, command=self.open_batch_install).pack(side=tk.LEFT, padx=(5, 0))
+        
         self.replace_var = tk.BooleanVar()
         ttk.Checkbutton(install_frame, text="替换安装", variable=self.replace_var).pack(side=tk.LEFT, padx=(10, 0))
         
@@ -345,30 +5456,52 @@ class HarmonyDevTools:
         self.dynamic_var = tk.BooleanVar()
         ttk.Checkbutton(install_frame, text="动态授权", variable=self.dynamic_var).pack(side=tk.LEFT, padx=(10, 0))
         
+        # 默认跳过设备上已安装的相同hap，勾选后总是重新安装
+        self.force_install_var = tk.BooleanVar()
+        ttk.Checkbutton(install_frame, text="强制安装", variable=self.force_install_var).pack(side=tk.LEFT, padx=(10, 0))
+        
         # 卸载操作
         uninstall_frame = ttk.LabelFrame(main_frame, text="卸载操作", padding="5")
         uninstall_frame.grid(row=row, column=3, columnspan=3, padx=(5, 0), pady=5, sticky=(tk.W, tk.E))
         
         self.package_name_var = tk.StringVar()
-        ttk.Entry(uninstall_frame, textvariable=self.package_name_var, width=25).pack(side=tk.LEFT)
+        self.package_entry = ttk.Entry(uninstall_frame, textvariable=self.package_name_var, width=25)
+        self.package_entry.pack(side=tk.LEFT)
         
         ttk.Button(uninstall_frame, text="卸载应用", width=12, command=self.uninstall_app).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(uninstall_frame, text="批量卸载", width=12, command=self.open_bulk_uninstall).pack(side=tk.LEFT, padx=(5, 0))
         
         # 第三行：其他操作
         row += 1
         ttk.Button(main_frame, text="导出照片", width=12, command=self.export_photo).grid(
             row=row, column=0, padx=(0, 5), pady=5)
         
-        ttk.Button(main_frame, text="UDID", width=12, command=self.get_udid).grid(
-            row=row, column=1, padx=5, pady=5)
+        udid_button = ttk.Button(main_frame, text="UDID", width=12)
+        udid_button.grid(row=row, column=1, padx=5, pady=5)
+        self.bind_refresh_click(udid_button, self.get_udid)
+        
+        ttk.Button(main_frame, text="多设备执行", width=12, command=self.open_fan_out).grid(
+            row=row, column=2, padx=5, pady=5, sticky=tk.W)
+        
+        ttk.Button(main_frame, text="增量导出照片", width=12, command=self.sync_photo).grid(
+            row=row, column=3, padx=5, pady=5)
+        
+        ttk.Button(main_frame, text="hilog 日志", width=12, command=self.open_hilog_viewer).grid(
+            row=row, column=4, padx=5, pady=5)
+        
+        ttk.Button(main_frame, text="推送文件夹", width=12, command=self.send_folder).grid(
+            row=row, column=5, padx=(5, 0), pady=5)
         
         # 第四行：命令执行
         row += 1
         self.command_var = tk.StringVar()
         command_entry = ttk.Entry(main_frame, textvariable=self.command_var, width=50)
-        command_entry.grid(row=row, column=0, columnspan=5, padx=(0, 5), pady=5, sticky=(tk.W, tk.E))
+        command_entry.grid(row=row, column=0, columnspan=4, padx=(0, 5), pady=5, sticky=(tk.W, tk.E))
         
         ttk.Button(main_frame, text="执行", width=12, command=self.execute_command).grid(
+            row=row, column=4, padx=5, pady=5)
+        
+        ttk.Button(main_frame, text="停止", width=12, command=self.cancel_commands).grid(
             row=row, column=5, padx=(5, 0), pady=5)
         
         # 第五行：结果显示
@@ -376,9 +5509,19 @@ class HarmonyDevTools:
         result_frame = ttk.LabelFrame(main_frame, text="执行结果", padding="5")
         result_frame.grid(row=row, column=0, columnspan=6, padx=0, pady=5, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # 创建结果显示区域
-        self.result_text = scrolledtext.ScrolledText(result_frame, height=15, width=80)
-        self.result_text.pack(fill=tk.BOTH, expand=True)
+        # 查找栏
+        find_frame = ttk.Frame(result_frame)
+        find_frame.pack(fill=tk.X, pady=(0, 5))
+        self.find_var = tk.StringVar()
+        self.find_entry = ttk.Entry(find_frame, textvariable=self.find_var, width=30)
+        self.find_entry.pack(side=tk.RIGHT)
+        self.find_entry.bind('<Return>', lambda e: self.find_in_console())
+        ttk.Button(find_frame, text="查找", width=6, command=self.find_in_console).pack(side=tk.RIGHT, padx=5)
+        
+        # 创建结果显示区域，内容保存在会话日志文件中，控件只显示可见部分
+        self.session_log = SessionLog(keep_sessions=self.config.get("console_keep_sessions", 5))
+        self.console = ResultConsole(self.root, result_frame, self.session_log)
+        self.result_text = self.console.text
         
         # 配置结果区域网格权重
         result_frame.columnconfigure(0, weight=1)
@@ -389,18 +5532,112 @@ class HarmonyDevTools:
         self.target_entry = target_entry
         self.command_entry = command_entry
     
+    @staticmethod
+    def bind_refresh_click(button, action):
+        """单击按钮执行 action()，按住Shift单击时执行 action(refresh=True)，不使用查询缓存"""
+        shift = {"held": False}
+        
+        def on_press(event):
+            shift["held"] = bool(event.state & 0x0001)
+        
+        def on_command():
+            # 键盘触发按钮时没有按下事件，用完即复位
+            refresh, shift["held"] = shift["held"], False
+            action(refresh=refresh)
+        
+        button.bind('<ButtonPress-1>', on_press, add="+")
+        button.configure(command=on_command)
+    
     def setup_bindings(self):
         """设置事件绑定"""
         # 命令输入框绑定回车键
-        self.command_entry.bind('<Return>', lambda e: self.execute_command())
+        self.command_entry.bind('<Return>', self.on_command_return)
+        self.command_entry.bind('<Shift-Return>', self.on_command_return)
         
-        # 命令输入框绑定上下箭头键（历史记录）
-        self.command_entry.bind('<Up>', lambda e: self.show_command_history('up'))
-        self.command_entry.bind('<Down>', lambda e: self.show_command_history('down'))
+        # 命令输入框绑定上下箭头键（补全列表或历史记录）
+        self.command_entry.bind('<Up>', lambda e: self.on_command_arrow(-1))
+        self.command_entry.bind('<Down>', lambda e: self.on_command_arrow(1))
+        
+        # 输入时按前缀补全，Ctrl+R 模糊搜索历史
+        self.completion = CompletionPopup(self.command_entry, self.command_history.complete, self.command_var.set)
+        self.command_entry.bind('<KeyRelease>', self.on_command_key)
+        self.command_entry.bind('<Escape>', lambda e: self.completion.hide())
+        self.command_entry.bind('<FocusOut>', lambda e: self.root.after(150, self.completion.hide))
+        self.root.bind('<Control-r>', lambda e: self.open_history_search())
+        
+        # 包名输入框：按所选设备上已安装应用的包名补全（只查询本地索引）
+        self.package_completion = CompletionPopup(
+            self.package_entry, lambda text, limit: self.package_index.search(self.selected_target(), text, limit),
+            self.package_name_var.set)
+        self.package_entry.bind('<FocusIn>', lambda e: self.package_index.refresh_async(self.selected_target()))
+        # 切换设备后预先获取该设备的包名
+        self.target_var.trace_add("write", lambda *args: self.package_index.refresh_async(self.selected_target()))
+        self.package_entry.bind('<KeyRelease>', self.on_package_key)
+        self.package_entry.bind('<Up>', lambda e: self.on_package_arrow(-1))
+        self.package_entry.bind('<Down>', lambda e: self.on_package_arrow(1))
+        self.package_entry.bind('<Return>', self.on_package_return)
+        self.package_entry.bind('<Escape>', lambda e: self.package_completion.hide())
+        self.package_entry.bind('<FocusOut>', lambda e: self.root.after(150, self.package_completion.hide))
+        
+        # Ctrl+F 查找输出
+        self.root.bind('<Control-f>', lambda e: self.find_entry.focus_set())
         
         # 窗口大小改变事件
         self.root.bind('<Configure>', self.on_window_resize)
     
+    def on_command_key(self, event):
+        """输入内容变化时刷新补全列表"""
+        if event.keysym in ("Up", "Down", "Return", "Escape", "Tab") or event.keysym.startswith(("Shift", "Control", "Alt")):
+            return
+        self.completion.update(self.command_var.get())
+    
+    def on_command_arrow(self, delta):
+        """补全列表显示时在列表中移动，否则浏览历史"""
+        if self.completion.visible:
+            self.completion.move(delta)
+        else:
+            self.show_command_history('up' if delta < 0 else 'down')
+        return "break"
+    
+    def on_command_return(self, event):
+        """回车: 补全列表有选中项时采用该项，否则执行命令；Shift+回车不使用查询缓存"""
+        if self.completion.accept():
+            self.command_entry.icursor(tk.END)
+            return "break"
+        self.completion.hide()
+        self.execute_command(refresh=bool(event.state & 0x0001))
+        return "break"
+    
+    def on_package_key(self, event):
+        """包名输入变化时刷新补全列表"""
+        if event.keysym in ("Up", "Down", "Return", "Escape", "Tab") or event.keysym.startswith(("Shift", "Control", "Alt")):
+            return
+        self.package_completion.update(self.package_name_var.get().strip())
+    
+    def on_package_arrow(self, delta):
+        if self.package_completion.visible:
+            self.package_completion.move(delta)
+            return "break"
+        return None
+    
+    def on_package_return(self, event):
+        """回车: 补全列表有选中项时采用该项，否则卸载"""
+        if self.package_completion.accept():
+            self.package_entry.icursor(tk.END)
+            return "break"
+        self.package_completion.hide()
+        self.uninstall_app()
+        return "break"
+    
+    def open_bulk_uninstall(self):
+        """打开批量卸载窗口"""
+        PackageUninstallDialog(self)
+    
+    def open_history_search(self):
+        """打开命令历史模糊搜索窗口"""
+        self.completion.hide()
+        HistorySearchDialog(self)
+    
     def show_command_history(self, direction):
         """显示命令历史"""
         if direction == 'up':
@@ -426,31 +5663,143 @@ class HarmonyDevTools:
         if default_target:
             self.target_var.set(default_target)
     
+    def run_on_ui_thread(self, func, *args):
+        """在Tk线程中执行回调，可在任意线程调用"""
+        self._ui_calls.put((func, args))
+    
+    def _process_ui_calls(self):
+        """处理工作线程提交的界面回调"""
+        while True:
+            try:
+                func, args = self._ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"界面回调执行失败: {e}")
+        self.root.after(ResultConsole.FRAME_INTERVAL, self._process_ui_calls)
+    
     def append_result(self, text):
-        """添加结果到显示区域"""
+        """添加结果到显示区域，可在任意线程调用"""
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        self.result_text.insert(tk.END, f"[{timestamp}] {text}\n")
-        self.result_text.see(tk.END)
-        self.root.update_idletasks()
+        self.console.write(f"[{timestamp}] {text}\n")
     
-    def execute_command_async(self, command):
-        """异步执行命令"""
-        def run():
-            self.append_result(f"执行命令: {command}")
-            result = self.hdc_util.run_command(command)
-            self.append_result(f"执行结果: {result}")
+    def command_timeout(self, command):
+        """命令的超时时间，持续输出类命令（hilog、top、文件传输等）不设超时"""
+        rest = HdcUtil.split_target(command)[1]
+        for prefix in self.config.get("long_running_commands", []):
+            if rest == prefix or rest.startswith(prefix + " "):
+                return None
+        return self.config.get("command_timeout", 300) or None
+    
+    def execute_command_async(self, command, refresh=False):
+        """异步执行命令，可缓存的查询优先使用缓存结果（refresh 为True时强制重新执行）"""
+        self.append_result(f"执行命令: {command}")
+        if QueryCache.resets_server(command):
+            self.query_cache.invalidate()
+        self.query_cache.invalidate_for(command)
+        cacheable = self.query_cache.cacheable(command)
+        cached = self.query_cache.get(command) if cacheable and not refresh else None
+        if cached is not None:
+            result, age = cached
+            self.append_result(f"执行结果（缓存于 {age:.0f} 秒前，Shift+回车或Shift+单击按钮强制刷新）:")
+            for line in result.output.splitlines():
+                self.append_result(line)
+            self.command_history.add_command(command)
+            return
+        
+        self.append_result("执行结果:")
+        # 逐行显示输出，长时间运行的命令（hilog、top等）也能实时看到结果
+        lines = []
+        
+        def on_line(line):
+            self.append_result(line)
+            if cacheable:
+                lines.append(line)
+        
+        future = self.engine.run_command(command, self.command_timeout(command), on_line)
+        
+        def done(f):
+            if f.cancelled():
+                self.append_result(f"已取消: {command}")
+            elif f.exception() is not None:
+                self.append_result(f"执行失败: {f.exception()}")
+            else:
+                result = f.result()
+                self.append_result(f"完成: 退出码 {result.exit_code}，耗时 {result.duration:.2f} 秒")
+                if cacheable:
+                    self.query_cache.put(CommandResult(result.command, "\n".join(lines), result.exit_code,
+                                                       result.duration, result.target))
+                if QueryCache.resets_server(command):
+                    self.query_cache.invalidate()
+                # 执行期间可能有查询结果写入缓存，完成后再失效一次
+                self.query_cache.invalidate_for(command)
             
             # 添加到命令历史
             self.command_history.add_command(command)
         
-        thread = threading.Thread(target=run)
-        thread.daemon = True
-        thread.start()
+        future.add_done_callback(done)
+        return future
+    
+    def clear_query_cache(self):
+        """清空查询缓存"""
+        count = self.query_cache.invalidate()
+        self.append_result(f"已清空 {count} 条查询缓存（命中 {self.query_cache.hits} 次，"
+                           f"未命中 {self.query_cache.misses} 次）")
+    
+    def cancel_commands(self):
+        """取消所有正在执行的命令"""
+        count = self.engine.cancel_all()
+        self.append_result(f"已停止 {count} 个正在执行的任务" if count else "没有正在执行的任务")
     
     def list_devices(self):
-        """列举设备"""
-        self.command_var.set("list targets -v")
-        self.execute_command_async("list targets -v")
+        """列举设备，直接显示后台轮询缓存的结果并触发一次刷新"""
+        def run():
+            devices = self.device_registry.devices(wait=True)
+            age = self.device_registry.age or 0
+            self.append_result(f"设备列表（{age:.0f}秒前更新）: 共 {len(devices)} 台")
+            for device in devices:
+                self.append_result(f"  {device.connect_key}\t{device.transport}\t{device.state}\t{device.name}")
+            self.device_registry.request_refresh()
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def on_device_event(self, event, device, previous):
+        """设备连接、断开或状态变化（在轮询线程中调用）"""
+        if event == DeviceRegistry.ADDED:
+            self.append_result(f"设备已连接: {device.connect_key} ({device.transport} {device.state})")
+        elif event == DeviceRegistry.REMOVED:
+            self.append_result(f"设备已断开: {device.connect_key}")
+        else:
+            self.append_result(f"设备状态变化: {device.connect_key} {previous.state} -> {device.state}")
+        if event != DeviceRegistry.ADDED:
+            # 设备断开或状态变化后旧的shell会话已不可用
+            self.hdc_util.close_session(device.connect_key)
+        self.run_on_ui_thread(self.update_target_picker)
+    
+    def update_target_picker(self):
+        """用注册表中的设备填充connect key下拉框"""
+        self.target_entry.configure(values=self.device_keys())
+    
+    def selected_target(self):
+        """connect key 输入框中选择的已连接设备；为空或不是已连接的设备时返回空（默认设备）"""
+        target = self.target_var.get().strip()
+        device = self.device_registry.get(target) if target else None
+        return target if device is not None and device.connected else ""
+    
+    def device_keys(self, connected_only=False):
+        """注册表缓存的设备 connect key（不调用hdc，首次轮询完成前为空）"""
+        return [d.connect_key for d in self.device_registry.devices() if d.connected or not connected_only]
+    
+    def watch_devices(self, window, callback):
+        """设备变化时在Tk线程中调用 callback(设备列表)，window 关闭后自动取消订阅"""
+        def notify():
+            if window.winfo_exists():
+                callback(self.device_registry.devices())
+        
+        unsubscribe = self.device_registry.subscribe(lambda event, device, previous: self.run_on_ui_thread(notify))
+        window.bind('<Destroy>', lambda e: unsubscribe() if e.widget is window else None, add="+")
     
     def connect_device(self):
         """连接设备"""
@@ -470,10 +5819,10 @@ class HarmonyDevTools:
         self.command_var.set("kill -r")
         self.execute_command_async("kill -r")
     
-    def check_version(self):
-        """检查版本信息"""
+    def check_version(self, refresh=False):
+        """检查版本信息，refresh 为True时不使用查询缓存"""
         self.command_var.set("checkserver")
-        self.execute_command_async("checkserver")
+        self.execute_command_async("checkserver", refresh)
     
     def install_hap(self):
         """安装hap文件"""
@@ -487,17 +5836,62 @@ class HarmonyDevTools:
             normalized_path = os.path.normpath(file_path)
             self.append_result(f"选择文件: {normalized_path}")
             
-            command = "install"
-            if self.replace_var.get():
-                command += " -r"
-            if self.downgrade_var.get():
-                command += " -d"
-            if self.dynamic_var.get():
-                command += " -g"
-            
+            options = HdcUtil.install_options(self.replace_var.get(), self.downgrade_var.get(),
+                                              self.dynamic_var.get())
+            command = " ".join(["install"] + options)
             command += f" \"{normalized_path}\""
             self.command_var.set(command)
-            self.execute_command_async(command)
+            force = self.force_install_var.get()
+            
+            self.append_result(f"执行命令: {command}")
+            # 计算哈希、查询设备在工作线程中进行，真正的安装经由执行引擎（受超时限制，可被"停止"取消）
+            check = self.engine.run_in_executor(self.install_cache.check, self.hdc_util, normalized_path, "", force)
+            
+            def checked(f):
+                if f.cancelled():
+                    self.append_result(f"已取消: {command}")
+                    return
+                if f.exception() is not None:
+                    self.append_result(f"执行失败: {f.exception()}")
+                    return
+                info, result = f.result()
+                if result is not None:
+                    self.append_result("执行结果:")
+                    self.append_result(result.output.rstrip())
+                    if info is not None:
+                        self.append_result("如需重新安装请勾选\"强制安装\"")
+                    self.command_history.add_command(command)
+                    return
+                self.append_result("执行结果:")
+                lines = []
+                
+                def on_line(line):
+                    self.append_result(line)
+                    lines.append(line)
+                
+                install = self.engine.run_command(["install"] + options + [normalized_path],
+                                                  self.command_timeout(command), on_line)
+                install.add_done_callback(lambda f: installed(f, info, lines))
+            
+            def installed(f, info, lines):
+                if f.cancelled():
+                    self.append_result(f"已取消: {command}")
+                elif f.exception() is not None:
+                    self.append_result(f"执行失败: {f.exception()}")
+                else:
+                    result = f.result()
+                    self.append_result(f"完成: 退出码 {result.exit_code}，耗时 {result.duration:.2f} 秒")
+                    result.output = "\n".join(lines)
+                    if BatchInstaller.install_succeeded(result):
+                        self.engine.run_in_executor(self.install_cache.remember, self.hdc_util, info, "")
+                        self.package_index.refresh_async("", force=True)
+                self.command_history.add_command(command)
+            
+            check.add_done_callback(checked)
+    
+    def open_batch_install(self):
+        """打开批量安装窗口"""
+        BatchInstallDialog(self)
     
     def uninstall_app(self):
         """卸载应用"""
@@ -505,28 +5899,40 @@ class HarmonyDevTools:
         if not package_name:
             messagebox.showwarning("警告", "请输入包名")
             return
+        target = self.selected_target()
         command = f"uninstall {package_name}"
+        if target:
+            command = f"-t {target} {command}"
         self.command_var.set(command)
-        self.execute_command_async(command)
+        future = self.execute_command_async(command)
+        if future is not None:
+            # 卸载后重新获取包名索引
+            future.add_done_callback(lambda f: self.package_index.refresh_async(target, force=True))
     
     def export_photo(self):
         """导出照片"""
         self.export_file("/storage/media/100/local/files/Photo")
     
     def export_file(self, path):
-        """导出文件"""
+        """从选中的设备导出文件，目录下的文件并行传输"""
+        target = self.selected_target()
+        
         def run():
             formatted_date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-            HdcUtil.run_cmd(f"mkdir {formatted_date}")
-            self.append_result(f"创建目录: {formatted_date}")
             self.append_result(f"导出 {path} 到 {formatted_date}")
-            result = self.hdc_util.export_file(path)
-            self.append_result(f"导出结果: {result}")
+            try:
+                summary = self.hdc_util.export_file(path, formatted_date, self.config.get("transfer_workers", 4),
+                                                    on_progress=self.report_transfer, async_engine=self.engine,
+                                                    timeout=self.transfer_timeout(), target=target)
+            except Exception as e:
+                self.append_result(f"导出失败: {e}")
+                return
+            self.append_result(f"导出结果: {summary}")
             
             # 导出完成后打开文件夹
             try:
                 if os.path.exists(formatted_date):
-                    os.startfile(formatted_date)
+                    ProcessUtil.open_path(formatted_date)
                     self.append_result(f"已打开导出目录: {formatted_date}")
             except Exception as e:
                 self.append_result(f"打开文件夹失败: {e}")
@@ -535,18 +5941,119 @@ class HarmonyDevTools:
         thread.daemon = True
         thread.start()
     
-    def get_udid(self):
-        """获取UDID"""
+    def transfer_timeout(self):
+        """目录传输中单个文件的超时时间（秒），0 为不限"""
+        return self.config.get("transfer_file_timeout", 600) or None
+    
+    def report_transfer(self, progress: TransferProgress):
+        """传输进度回调（工作线程中）"""
+        self.append_result(f"传输进度: {progress.describe()}")
+    
+    def send_folder(self):
+        """选择本地文件夹，并行推送到设备"""
+        local_dir = filedialog.askdirectory(title="选择要推送的文件夹")
+        if not local_dir:
+            return
+        remote_dir = self.config.get("push_remote_dir", "/data/local/tmp").rstrip("/")
+        remote_dir = f"{remote_dir}/{os.path.basename(os.path.normpath(local_dir))}"
+        target = self.selected_target()
+        
+        def run():
+            self.append_result(f"推送 {local_dir} 到 {remote_dir}")
+            engine = TransferEngine(self.hdc_util, self.config.get("transfer_workers", 4),
+                                    async_engine=self.engine, timeout=self.transfer_timeout())
+            try:
+                result = engine.send(local_dir, remote_dir, target, on_progress=self.report_transfer)
+            except Exception as e:
+                self.append_result(f"推送失败: {e}")
+                return
+            self.append_result(f"推送结果: {result.summary()}")
+        
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+    
+    def sync_photo(self):
+        """增量导出照片"""
+        self.sync_file("/storage/media/100/local/files/Photo")
+    
+    def sync_file(self, path):
+        """从选中的设备增量导出文件，只拉取新增或变化的文件"""
+        target = self.selected_target()
+        
+        def run():
+            local_dir = os.path.join(self.config.get("export_sync_dir", "export"),
+                                     os.path.basename(path.rstrip("/")))
+            self.append_result(f"增量导出 {path} 到 {local_dir}")
+            exporter = IncrementalExporter(self.hdc_util, self.config.get("export_workers", 4),
+                                           async_engine=self.engine, timeout=self.transfer_timeout())
+            
+            try:
+                result = exporter.sync(path, local_dir, target, on_progress=self.report_transfer)
+            except Exception as e:
+                self.append_result(f"增量导出失败: {e}")
+                return
+            self.append_result(
+                f"增量导出完成: 共 {result.total} 个文件，新拉取 {result.pulled} 个"
+                f"（{result.bytes_pulled / (1024 * 1024):.1f} MB），跳过 {result.skipped} 个，"
+                f"失败 {result.failed} 个，耗时 {result.duration:.1f} 秒{'，已取消' if result.cancelled else ''}")
+            
+            try:
+                ProcessUtil.open_path(local_dir)
+            except Exception as e:
+                self.append_result(f"打开文件夹失败: {e}")
+        
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+    
+    def open_fan_out(self):
+        """打开多设备执行窗口"""
+        FanOutDialog(self)
+    
+    def open_macro(self):
+        """打开命令宏窗口"""
+        MacroDialog(self)
+    
+    def open_device_info(self):
+        """打开设备信息窗口"""
+        DeviceInfoDialog(self)
+    
+    def open_stats(self):
+        """打开执行统计窗口"""
+        StatsDialog(self)
+    
+    def open_screen_viewer(self):
+        """打开屏幕镜像窗口，已打开时切换到前台"""
+        if self.screen_viewer is not None:
+            self.screen_viewer.window.lift()
+            return
+        self.screen_viewer = ScreenViewer(self)
+    
+    def open_hilog_viewer(self, target=""):
+        """打开 hilog 日志窗口，已打开时切换到前台"""
+        if self.hilog_viewer is not None:
+            self.hilog_viewer.window.lift()
+            return
+        self.hilog_viewer = HilogViewer(self, target)
+    
+    def get_udid(self, refresh=False):
+        """获取UDID，refresh 为True时不使用查询缓存"""
         self.command_var.set("shell bm get --udid")
-        self.execute_command_async("shell bm get --udid")
+        self.execute_command_async("shell bm get --udid", refresh)
     
-    def execute_command(self):
+    def execute_command(self, refresh=False):
         """执行命令"""
         command = self.command_var.get().strip()
         if not command:
             messagebox.showwarning("警告", "请输入命令")
             return
-        self.execute_command_async(command)
+        # 不带参数的 hilog 会持续输出，交给日志窗口处理
+        target, rest = HdcUtil.split_target(command)
+        if rest in ("hilog", "shell hilog"):
+            self.open_hilog_viewer(target)
+            return
+        self.execute_command_async(command, refresh)
     
     def save_log(self):
         """保存日志"""
@@ -558,21 +6065,25 @@ class HarmonyDevTools:
         
         if file_path:
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(self.result_text.get(1.0, tk.END))
+                self.session_log.copy_to(file_path)
                 messagebox.showinfo("成功", f"日志已保存到: {file_path}")
             except Exception as e:
                 messagebox.showerror("错误", f"保存失败: {e}")
     
+    def find_in_console(self):
+        """在全部输出中查找下一处匹配"""
+        pattern = self.find_var.get()
+        if pattern and not self.console.find(pattern):
+            messagebox.showinfo("查找", f"未找到: {pattern}")
+    
     def kill_hdc_processes(self):
         """清理HDC进程"""
         def run():
-            result = HdcUtil.run_cmd("taskkill /IM hdc.exe")
-            self.append_result(f"清理HDC进程: {result}")
+            count = ProcessUtil.kill_processes("hdc")
+            self.query_cache.invalidate()
+            self.append_result(f"清理HDC进程: 已结束 {count} 个进程")
         
-        thread = threading.Thread(target=run)
-        thread.daemon = True
-        thread.start()
+        self.engine.run_in_executor(run)
     
     def check_hdc_status(self):
         """检查HDC状态"""
@@ -580,10 +6091,10 @@ class HarmonyDevTools:
     
     def open_log_file(self):
         """打开日志文件"""
-        log_file = "harmony_dev_tools.log"
+        log_file = LOG_FILE
         if os.path.exists(log_file):
             try:
-                os.startfile(log_file)
+                ProcessUtil.open_path(log_file)
             except:
                 messagebox.showinfo("信息", f"日志文件位置: {os.path.abspath(log_file)}")
         else:
@@ -625,10 +6136,13 @@ class HarmonyDevTools:
    - 点击"导出照片"导出设备照片
    - 点击"导出日志"导出指定应用的日志文件
    - 使用自定义命令执行其他操作
+   - "工具 → 命令宏"按依赖关系执行JSON/YAML宏文件中的多步命令（格式见readme）
 
 4. 快捷键:
    - 命令输入框支持上下箭头键浏览历史
-   - 回车键执行命令
+   - 输入时自动列出以当前内容开头的历史命令，上下键选择、回车采用
+   - Ctrl+R 模糊搜索全部命令历史
+   - 回车键执行命令；UDID、版本、param get 等查询的结果会缓存，Shift+回车或Shift+单击UDID/版本信息按钮强制重新执行
 
 5. 日志管理:
    - 可通过菜单保存执行日志
@@ -639,26 +6153,342 @@ class HarmonyDevTools:
     def on_closing(self):
         """窗口关闭时的处理"""
         try:
-            # 保存配置
+            # 保存配置（最近命令同时写入配置）
+            self.config.set("recent_commands",
+                            self.command_history.get_recent(self.config.get("max_recent_commands", 10)))
             self.config.save_config()
             
+            # 结束 hilog 读取
+            if self.hilog_viewer is not None:
+                self.hilog_viewer.close()
+            if self.screen_viewer is not None:
+                self.screen_viewer.close()
+            
+            # 停止设备轮询和执行引擎
+            self.device_registry.stop()
+            self.engine.shutdown()
+            
+            # 关闭shell会话
+            self.hdc_util.close_sessions()
+            
             # 清理HDC进程
-            result = HdcUtil.run_cmd("taskkill /IM hdc.exe")
-            self.append_result(result)
+            ProcessUtil.kill_processes("hdc")
+            
+            # 关闭会话日志
+            self.console.stop()
+            self.session_log.close()
         except:
             pass
         self.root.destroy()
 
-def main():
-    """主函数"""
-    root = tk.Tk()
-    app = HarmonyDevTools(root)
+# --- 命令行模式 ---
+# 退出码
+EXIT_OK = 0
+EXIT_COMMAND_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_DEVICE = 3
+EXIT_INTERRUPTED = 130
+
+CLI_COMMANDS = ("run", "macro", "devices", "info", "pull", "push")
+
+def build_arg_parser():
+    """命令行参数定义"""
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="HarmonyDevTools 命令行模式（不加载图形界面），结果以JSON输出到标准输出",
+        epilog="退出码: 0 全部成功, 1 有命令失败, 2 参数错误, 3 找不到hdc或设备, 130 被中断"
+    )
+    parser.add_argument("--hdc", help="hdc可执行文件路径（默认自动查找）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出详细日志到标准错误")
+    subparsers = parser.add_subparsers(dest="action")
+    
+    run_parser = subparsers.add_parser("run", help="在一台或多台设备上执行命令脚本")
+    run_parser.add_argument("script", help="命令脚本，每行一条hdc命令，#开头为注释；- 表示从标准输入读取")
+    run_parser.add_argument("--targets", default="",
+                            help="all 表示所有已连接设备，或逗号分隔的connect key；默认使用hdc默认设备")
+    run_parser.add_argument("--timeout", type=float, default=300, help="单条命令超时时间（秒），0表示不限制")
+    run_parser.add_argument("--workers", type=int, default=16, help="最大并发命令数")
+    run_parser.add_argument("--stop-on-error", action="store_true", help="某台设备上命令失败后跳过该设备的后续命令")
+    run_parser.add_argument("-o", "--output", help="结果JSON写入文件而不是标准输出")
+    run_parser.add_argument("--metrics", help="执行指标写入文件（.json 为JSON，其余为Prometheus文本）")
+    
+    macro_parser = subparsers.add_parser("macro", help="执行命令宏（按依赖关系并行执行的多步命令）")
+    macro_parser.add_argument("file", help="宏文件（JSON，安装了PyYAML时也可以是YAML）")
+    macro_parser.add_argument("--target", default="", help="未指定target的步骤使用的设备，默认使用hdc默认设备")
+    macro_parser.add_argument("--var", action="append", default=[], metavar="NAME=VALUE",
+                              help="设置变量，可重复指定，覆盖宏文件中的同名变量")
+    macro_parser.add_argument("--workers", type=int, default=16, help="最大并发命令数")
+    macro_parser.add_argument("-o", "--output", help="结果JSON写入文件而不是标准输出")
+    macro_parser.add_argument("--metrics", help="执行指标写入文件（.json 为JSON，其余为Prometheus文本）")
+    
+    devices_parser = subparsers.add_parser("devices", help="列举设备")
+    devices_parser.add_argument("-o", "--output", help="结果JSON写入文件而不是标准输出")
+    
+    info_parser = subparsers.add_parser("info", help="并行采集设备信息（每台设备一次shell调用）")
+    info_parser.add_argument("--targets", default="all",
+                             help="all 表示所有已连接设备（默认），或逗号分隔的connect key")
+    info_parser.add_argument("--workers", type=int, default=8, help="最大并发设备数")
+    info_parser.add_argument("-o", "--output", help="写入文件而不是标准输出（.csv 为CSV，其余为JSON）")
+    
+    for action, help_text, source, destination in (
+            ("pull", "从设备并行拉取目录或文件", "设备上的目录或文件", "本地目录"),
+            ("push", "向设备并行推送目录或文件", "本地目录或文件", "设备上的目标目录")):
+        transfer_parser = subparsers.add_parser(action, help=help_text)
+        transfer_parser.add_argument("source", help=source)
+        transfer_parser.add_argument("destination", help=destination)
+        transfer_parser.add_argument("--target", default="", help="设备connect key，默认使用hdc默认设备")
+        transfer_parser.add_argument("--workers", type=int, default=4, help="并发传输数")
+        transfer_parser.add_argument("-o", "--output", help="结果JSON写入文件而不是标准输出")
+    return parser
+
+def read_script(path):
+    """读取命令脚本，忽略空行和注释"""
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+def resolve_targets(hdc_util, spec):
+    """解析 --targets，返回connect key列表（空字符串表示hdc默认设备）"""
+    spec = spec.strip()
+    if not spec:
+        return [""]
+    if spec == "all":
+        return [t.connect_key for t in hdc_util.list_targets() if t.connected]
+    return [key.strip() for key in spec.split(",") if key.strip()]
+
+def write_json(data, output=None):
+    """输出JSON结果"""
+    text = json.dumps(data, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+        sys.stdout.flush()
+
+def result_to_dict(result: CommandResult):
+    """CommandResult 转为可序列化的字典"""
+    data = asdict(result)
+    data["ok"] = result.ok
+    data["duration"] = round(result.duration, 3)
+    return data
+
+def cli_run(args, hdc_util):
+    """执行命令脚本：同一设备按顺序执行，不同设备并行"""
+    try:
+        commands = read_script(args.script)
+    except OSError as e:
+        logger.error(f"读取脚本失败: {e}")
+        return EXIT_USAGE
+    if not commands:
+        logger.error("脚本中没有命令")
+        return EXIT_USAGE
+    targets = resolve_targets(hdc_util, args.targets)
+    if not targets:
+        logger.error("没有已连接的设备")
+        return EXIT_NO_DEVICE
+    
+    engine = AsyncHdcEngine(hdc_util, max(1, args.workers))
+    engine.start()
+    timeout = args.timeout or None
+    
+    async def run_target(target):
+        results = []
+        for command in commands:
+            result = await engine.execute(command, timeout, target=target)
+            results.append(result_to_dict(result))
+            if args.stop_on_error and not result.ok:
+                break
+        ok = len(results) == len(commands) and all(r["ok"] for r in results)
+        return {"target": target, "ok": ok, "results": results}
+    
+    async def run_all():
+        return await asyncio.gather(*(run_target(t) for t in targets))
+    
+    start = time.perf_counter()
+    try:
+        target_results = engine.submit(run_all()).result()
+    finally:
+        engine.shutdown()
+        hdc_util.close_sessions()
+    ok = all(t["ok"] for t in target_results)
+    write_json({
+        "version": get_version(),
+        "script": args.script,
+        "ok": ok,
+        "duration": round(time.perf_counter() - start, 3),
+        "targets": target_results,
+    }, args.output)
+    if args.metrics:
+        metrics.export(args.metrics)
+    return EXIT_OK if ok else EXIT_COMMAND_FAILED
+
+def macro_result_to_dict(result: MacroResult):
+    """MacroResult 转为可序列化的字典"""
+    steps = []
+    for step in result.steps:
+        data = asdict(step)
+        data["start"] = round(step.start, 3)
+        data["duration"] = round(step.duration, 3)
+        steps.append(data)
+    return {
+        "macro": result.name,
+        "ok": result.ok,
+        "duration": round(result.duration, 3),
+        "variables": result.variables,
+        "steps": steps,
+    }
+
+def cli_macro(args, hdc_util):
+    """执行命令宏"""
+    try:
+        macro = Macro.load(args.file)
+        variables = dict(item.split("=", 1) for item in args.var)
+    except (OSError, ValueError) as e:
+        logger.error(f"读取宏失败: {e}")
+        return EXIT_USAGE
+    
+    engine = AsyncHdcEngine(hdc_util, max(1, args.workers))
+    engine.start()
+    
+    def on_step(step):
+        if step.status not in ("pending", "running"):
+            logger.info(f"[{step.id}] {step.status} {step.duration:.2f}s {step.message}")
+    
+    try:
+        result = MacroRunner(engine, args.target).run(macro, variables, on_step)
+    finally:
+        engine.shutdown()
+        hdc_util.close_sessions()
+    data = macro_result_to_dict(result)
+    data["version"] = get_version()
+    write_json(data, args.output)
+    if args.metrics:
+        metrics.export(args.metrics)
+    return EXIT_OK if result.ok else EXIT_COMMAND_FAILED
+
+def cli_devices(args, hdc_util):
+    """列举设备"""
+    devices = [asdict(t) for t in hdc_util.list_targets()]
+    write_json({"version": get_version(), "devices": devices}, args.output)
+    return EXIT_OK if devices else EXIT_NO_DEVICE
+
+def cli_info(args, hdc_util):
+    """采集设备信息"""
+    targets = resolve_targets(hdc_util, args.targets)
+    if not targets:
+        logger.error("没有已连接的设备")
+        return EXIT_NO_DEVICE
+    collector = DeviceInfoCollector(hdc_util, max(1, args.workers))
+    try:
+        infos = collector.collect_all(targets)
+    finally:
+        hdc_util.close_sessions()
+    if args.output:
+        DeviceInfoCollector.export(infos, args.output)
+    else:
+        write_json({"version": get_version(), "devices": [asdict(info) for info in infos]})
+    return EXIT_OK if all(not info.error for info in infos) else EXIT_COMMAND_FAILED
+
+def cli_transfer(args, hdc_util):
+    """并行拉取/推送，进度输出到标准错误"""
+    engine = TransferEngine(hdc_util, max(1, args.workers))
+    
+    def on_progress(progress):
+        sys.stderr.write(f"\r{progress.describe()}\033[K")
+        sys.stderr.flush()
+    
+    try:
+        if args.action == "pull":
+            result = engine.recv(args.source, args.destination, args.target, on_progress=on_progress)
+        else:
+            result = engine.send(args.source, args.destination, args.target, on_progress=on_progress)
+    except TransferError as e:
+        logger.error(str(e))
+        return EXIT_COMMAND_FAILED
+    finally:
+        sys.stderr.write("\n")
+        hdc_util.close_sessions()
+    write_json({
+        "version": get_version(),
+        "direction": result.direction,
+        "source": result.source,
+        "destination": result.destination,
+        "ok": result.ok,
+        "files": result.files,
+        "bytes": result.bytes,
+        "duration": round(result.duration, 3),
+        "mb_per_s": round(result.rate / (1024 * 1024), 3),
+        "failures": [{"path": path, "error": error} for path, error in result.failures],
+    }, args.output)
+    return EXIT_OK if result.ok else EXIT_COMMAND_FAILED
+
+def cli_main(argv):
+    """命令行模式入口，返回退出码"""
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if not args.action:
+        parser.print_help()
+        return EXIT_USAGE
+    attach_file_log_handler()
+    if not args.verbose:
+        # 只降低控制台输出的级别，日志文件仍记录INFO
+        for handler in logging.getLogger().handlers:
+            if type(handler) is logging.StreamHandler:
+                handler.setLevel(logging.WARNING)
+    
+    hdc_util = HdcUtil()
+    if args.hdc:
+        hdc_util.hdc_path = args.hdc
+    if not (os.path.exists(hdc_util.hdc_path) or shutil.which(hdc_util.hdc_path)):
+        logger.error(f"找不到hdc: {hdc_util.hdc_path}")
+        return EXIT_NO_DEVICE
+    
+    try:
+        if args.action == "run":
+            return cli_run(args, hdc_util)
+        if args.action == "macro":
+            return cli_macro(args, hdc_util)
+        if args.action == "info":
+            return cli_info(args, hdc_util)
+        if args.action in ("pull", "push"):
+            return cli_transfer(args, hdc_util)
+        return cli_devices(args, hdc_util)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+
+def run_gui(profile_startup=False):
+    """启动图形界面"""
+    profiler = StartupProfiler(enabled=profile_startup)
+    profiler.record("模块导入", _IMPORT_END - _IMPORT_START)
+    with profiler.phase("导入tkinter"):
+        load_tkinter()
+        enable_dpi_awareness()
+    with profiler.phase("创建Tk"):
+        root = tk.Tk()
+    app = HarmonyDevTools(root, profiler)
     
     # 绑定关闭事件
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     
     # 启动应用
+    profiler.mainloop_start = time.perf_counter()
     root.mainloop()
 
+def main(argv=None):
+    """主函数：带子命令时进入命令行模式，否则启动图形界面"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and (argv[0] in CLI_COMMANDS or argv[0] in ("-h", "--help") or argv[0].startswith("--hdc")
+                 or argv[0] in ("-v", "--verbose")):
+        return cli_main(argv)
+    run_gui(profile_startup="--profile-startup" in argv)
+    return EXIT_OK
+
+# 模块导入完成的时间
+_IMPORT_END = time.perf_counter()
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())